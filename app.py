@@ -2,7 +2,11 @@ import streamlit as st
 import pandas as pd
 from pptx import Presentation
 from pptx.util import Inches
-from PIL import Image
+from pptx.enum.shapes import MSO_SHAPE_TYPE
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.opc.package import PartFactory
+from pptx.text.text import _Paragraph
+from PIL import Image, ImageOps
 import json
 import re
 import io
@@ -11,20 +15,157 @@ from datetime import datetime
 import base64
 from clipboard_component import copy_component, paste_component
 import docx
+from docx.table import _Cell
+from docx.text.paragraph import Paragraph
 import glob
 import os
+import hashlib
+import secrets
+import copy
+import posixpath
+import time
+import threading
+import contextlib
+import collections
+import tempfile
+import shutil
+import mmap
+import weakref
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 
 # PDF support imports
 import fitz  # PyMuPDF
 from reportlab.pdfgen import canvas
 from reportlab.lib.pagesizes import letter
 import PyPDF2
+import pdf_workers
+from pdf_workers import rewrite_pdf_page_text
+
+# Image placeholder settings ({{image:name}} fields)
+IMAGE_FIELD_PREFIX = "image:"
+IMAGE_FIELD_PATTERN = r'\{\{image:([^}]+)\}\}'
+DEFAULT_IMAGE_DPI = 150
+EMU_PER_INCH = 914400
+PDF_POINTS_PER_INCH = 72
+
+# Run normalization settings (see normalize_template_runs)
+WORD_NAMESPACE = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+DRAWING_NAMESPACE = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+RELATIONSHIP_NAMESPACE = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+DOCX_RUN_TAGS = {
+    'p': f'{{{WORD_NAMESPACE}}}p',
+    'r': f'{{{WORD_NAMESPACE}}}r',
+    'rPr': f'{{{WORD_NAMESPACE}}}rPr',
+    't': f'{{{WORD_NAMESPACE}}}t',
+    'proofErr': f'{{{WORD_NAMESPACE}}}proofErr',
+    'ignored_attributes': (),
+    'ignored_children': {f'{{{WORD_NAMESPACE}}}lang', f'{{{WORD_NAMESPACE}}}noProof'},
+    'preserve_space': True
+}
+PPTX_RUN_TAGS = {
+    'p': f'{{{DRAWING_NAMESPACE}}}p',
+    'r': f'{{{DRAWING_NAMESPACE}}}r',
+    'rPr': f'{{{DRAWING_NAMESPACE}}}rPr',
+    't': f'{{{DRAWING_NAMESPACE}}}t',
+    'proofErr': None,
+    'ignored_attributes': ('lang', 'altLang', 'dirty', 'err', 'smtClean', 'noProof'),
+    'ignored_children': set(),
+    'preserve_space': False
+}
+NORMALIZED_DOCX_PARTS = r'word/(document|header\d*|footer\d*|footnotes|endnotes)\.xml'
+NORMALIZED_PPTX_PARTS = r'ppt/slides/slide\d+\.xml'
+# Word parts outside the body that hold their own text (same URIs for python-docx and python-pptx)
+WORD_STORY_RELTYPES = (RT.HEADER, RT.FOOTER, RT.FOOTNOTES, RT.ENDNOTES)
+
+# Capacity limits - keep server memory bounded however many users are active
+MAX_TEMPLATE_MB = 50
+MAX_CONCURRENT_FILLS = 4
+MAX_FILL_MEMORY_MB = 1024
+SESSION_MEMORY_BUDGET_MB = 100
+ADMISSION_TIMEOUT_SECONDS = 120
+FILL_BASE_MEMORY_BYTES = 20 * 1024 * 1024
+# Peak memory of a fill relative to template file size (object model + output copies)
+FILL_MEMORY_MULTIPLIERS = {'pdf': 6, 'docx': 12, 'pptx': 8, 'xlsx': 3}
+
+# Large PDFs are split into page ranges processed in worker processes
+PARALLEL_PDF_MIN_PAGES = 100
+PDF_WORKER_PROCESSES = max(1, min(8, os.cpu_count() or 1))
+
+# Batch (spreadsheet) settings
+BATCH_DEFAULT_VALUE = "TBD"
+BATCH_FORMAT_TYPES = ("text", "date", "currency", "phone")
+BATCH_CURRENCY_SYMBOLS = "$€£¥₹"
+# An amount after symbols and whitespace are removed: optional "-" or accounting
+# parentheses, digits with optional comma thousands groups, optional decimals
+BATCH_AMOUNT_PATTERN = r'^(?P<open>\()?(?P<sign>-)?(?P<number>(?:\d{1,3}(?:,\d{3})+|\d+)(?:\.\d+)?|\.\d+)(?P<close>\))?$'
+BATCH_FORMAT_EXAMPLE = """{
+  "DD_Month_YYYY": {"type": "date", "pattern": "%d %B %Y"},
+  "money_saved": {"type": "currency"},
+  "phone": {"type": "phone"},
+  "name_all_caps": {"uppercase": true, "max_length": 40, "required": true}
+}"""
+# Server-side files go in per-user directories (the temp directory is already per-user
+# on Windows); see make_private_directory
+PRIVATE_DIR_SUFFIX = f"_{os.getuid()}" if hasattr(os, 'getuid') else ""
+
+# Finished batch rows are journaled on disk so interrupted or edited batches resume
+BATCH_JOURNAL_DIR = os.path.join(tempfile.gettempdir(), "document_filler_batches" + PRIVATE_DIR_SUFFIX)
+BATCH_JOURNAL_MAX_AGE_HOURS = 24
+BATCH_JOURNAL_SYNC_ROWS = 25
+
+# Output optimization settings
+OUTPUT_COMPRESSION_OPTIONS = {
+    "Balanced (deflate level 6)": 6,
+    "Smallest file (deflate level 9)": 9,
+    "Fastest (no compression)": 0
+}
+DEFAULT_COMPRESSION_OPTION = "Balanced (deflate level 6)"
+DEFAULT_MAX_IMAGE_BYTES = 500 * 1024
+PRECOMPRESSED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.mp3', '.mp4', '.m4a', '.wdp'}
+OUTPUT_MIME_TYPES = {
+    'pptx': "application/vnd.openxmlformats-officedocument.presentationml.presentation",
+    'docx': "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    'xlsx': "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    'pdf': "application/pdf"
+}
+
+# Excel settings
+SPREADSHEET_NAMESPACE = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+XLSX_HEADER_FOOTER_TAGS = ('oddHeader', 'oddFooter', 'evenHeader', 'evenFooter', 'firstHeader', 'firstFooter')
+XLSX_DRAWING_PARTS = r'xl/(charts/chart\d+|drawings/drawing\d+)\.xml'
+REPEATED_ROW_PATTERN = r'\{\{([^}.]+)\.([^}]+)\}\}'
+XLSX_CELL_REFERENCE = r'(\$?[A-Z]{1,3})(\$?)(\d+)'
+# Same-sheet A1 references (optionally a range) not preceded by a sheet name or part of a name/function
+XLSX_FORMULA_REFERENCE = r"(?<![A-Za-z0-9_.!$'\"])(\$?[A-Z]{1,3}\$?\d+)(?::(\$?[A-Z]{1,3}\$?\d+))?(?![A-Za-z0-9_(!])"
+
+# Combined output settings
+MAX_COMBINED_RECORDS = 500
+SHARED_SLIDE_RELTYPES = {RT.IMAGE, RT.MEDIA, RT.VIDEO, RT.AUDIO, RT.SLIDE}
+
+# Template store settings
+TEMPLATE_STORE_DIR = os.path.join(tempfile.gettempdir(), "document_filler_templates" + PRIVATE_DIR_SUFFIX)
+TEMPLATE_STORE_MAX_MB = 1024
+
+# Per-rerun cost settings
+TEMPLATE_CATALOG_TTL_SECONDS = 300
+# Session cache entries holding generated outputs (keyed per template and inputs)
+OUTPUT_CACHE_NAMES = ('ai_output', 'ai_stream_output', 'manual_output', 'batch_output')
+
+# Optional AI backend (the "llm_backend" section of prompt_config.json)
+LLM_REQUEST_TIMEOUT_SECONDS = 120
+
+# Fill report settings (problems first in the status order)
+FILL_REPORT_STATUSES = ("error", "warning", "unmatched", "skipped", "filled")
+FILL_REPORT_PAGE_ROWS = 100
 
 # --- NEW: Function to load configuration ---
+@st.cache_resource
 def load_prompt_config():
     """
     Loads and validates the prompt configuration from the JSON file.
     This will raise an error if the file is missing or invalid.
+    Loaded once per server process; restart the app after editing the config.
     """
     script_dir = os.path.dirname(os.path.abspath(__file__))
     config_file = os.path.join(script_dir, "prompt_config.json")
@@ -58,7 +199,8 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Custom CSS for better styling
+# Custom CSS for better styling, plus Google Analytics (replace 'G-HMVVJJ6C17' with your actual ID).
+# Sent as a single element because it is re-sent on every rerun.
 st.markdown("""
 <style>
     .main-header {
@@ -105,10 +247,6 @@ st.markdown("""
     }
     .nipr-btn { background-color: #004d40; } /* Dark Teal for NiprGPT */
 </style>
-""", unsafe_allow_html=True)
-
-# Google Analytics - Replace 'G-HMVVJJ6C17' with your actual Google Analytics ID
-st.markdown("""
 <script async src="https://www.googletagmanager.com/gtag/js?id=G-HMVVJJ6C17"></script>
 <script>
   window.dataLayer = window.dataLayer || [];
@@ -119,6 +257,255 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
+# --- Static Resource Functions ---
+@st.cache_resource
+def get_banner_bytes():
+    """(NEW) Banner image bytes, read from disk once per server process. None if missing."""
+    try:
+        with open("banner.png", "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+@st.cache_resource(ttl=TEMPLATE_CATALOG_TTL_SECONDS)
+def get_template_catalog():
+    """(NEW) Bundled template paths. Rescanned at most every TEMPLATE_CATALOG_TTL_SECONDS."""
+    return sorted(glob.glob("templates/*.*"))
+
+def template_cache_key(source_file):
+    """(NEW) Cheap identity for a template (no hashing of its contents), so reruns
+    can reuse the session's analysis instead of re-reading the file."""
+    if isinstance(source_file, str):
+        stat = os.stat(source_file)
+        return (source_file, stat.st_size, stat.st_mtime_ns)
+    return (source_file.name, source_file.size, getattr(source_file, 'file_id', None))
+
+
+# --- Template Store Functions ---
+class TemplateReader(io.RawIOBase):
+    """(NEW) Seekable, read-only file object over a shared template mapping.
+
+    Each reader keeps its own position, so any number of sessions can read the same
+    mapping at once. zipfile (python-pptx, python-docx) and PyPDF2 read through it
+    directly; PyMuPDF and worker processes open `path` instead.
+    """
+
+    def __init__(self, path, mapping):
+        super().__init__()
+        self.path = path
+        self.name = os.path.basename(path)
+        self._view = memoryview(mapping)
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = max(0, min(len(buffer), len(self._view) - self._position))
+        buffer[:count] = self._view[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+    def getbuffer(self):
+        """Zero-copy view of the whole template."""
+        return self._view
+
+class TemplateStore:
+    """(NEW) Content-addressed store of templates as read-only memory-mapped files.
+
+    Templates (bundled, uploaded and normalized copies) are written once as
+    <sha256>.<ext> under a directory only the server user can open, and mapped
+    read-only. Every session, the PDF worker processes and other server processes of
+    the same user read the same file, so the OS page cache holds one physical copy
+    however many read it. Files with a live reader in this process are never evicted.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = make_private_directory(directory)
+        self.max_bytes = max_bytes
+        self._mappings = {}
+        self._readers = collections.defaultdict(weakref.WeakSet)
+        self._bundled_paths = {}
+        self._derived_paths = {}
+        self._lock = threading.Lock()
+
+    def add_bytes(self, data, extension, mode=0o600):
+        """Store bytes (if not already present) and return their store path."""
+        path = os.path.join(self.directory, f"{hashlib.sha256(data).hexdigest()}.{extension}")
+        if not os.path.exists(path):
+            # Write to a temporary name first so other processes never map a partial file
+            file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(file_descriptor, 'wb') as f:
+                f.write(data)
+            os.chmod(temp_path, mode)
+            os.replace(temp_path, path)
+            self._evict(keep=path)
+        return path
+
+    def add(self, source_file, extension):
+        """Store a bundled template path, uploaded file or reader; return its store path."""
+        if isinstance(source_file, TemplateReader):
+            return source_file.path
+        if isinstance(source_file, str):
+            stat = os.stat(source_file)
+            key = (source_file, stat.st_size, stat.st_mtime_ns)
+            path = self._bundled_paths.get(key)
+            if path is None or not os.path.exists(path):
+                with open(source_file, 'rb') as f:
+                    path = self.add_bytes(f.read(), extension)
+                self._bundled_paths[key] = path
+            return path
+        return self.add_bytes(read_template_bytes(source_file), extension)
+
+    def derive(self, path, extension, name, build, mode=0o600):
+        """Store (once) a template derived from `path` by build(reader) -> (bytes, extra).
+        Returns (derived path, extra)."""
+        key = (path, name)
+        derived = self._derived_paths.get(key)
+        if derived is None or not os.path.exists(derived[0]):
+            data, extra = build(self.open(path))
+            derived = (self.add_bytes(data, extension, mode), extra)
+            self._derived_paths[key] = derived
+        return derived
+
+    def open(self, path):
+        """Return a new reader over the shared mapping of a store path."""
+        with self._lock:
+            mapping = self._mappings.get(path)
+            if mapping is None:
+                with open(path, 'rb') as f:
+                    mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+                self._mappings[path] = mapping
+            reader = TemplateReader(path, mapping)
+            self._readers[path].add(reader)
+        if not os.path.exists(path):
+            # Evicted by another server process; the mapping still holds the content, so put
+            # the file back for PyMuPDF and the worker processes, which open it by path
+            self.add_bytes(bytes(mapping), path.rsplit('.', 1)[-1])
+        return reader
+
+    def _evict(self, keep):
+        """Delete least recently added templates beyond max_bytes, except those being read."""
+        with self._lock:
+            in_use = {path for path, readers in self._readers.items() if readers}
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.path != keep and entry.path not in in_use:
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_bytes = sum(size for _, size, _ in entries) + os.path.getsize(keep)
+        for _, size, path in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            with contextlib.suppress(OSError):
+                os.unlink(path)
+            with self._lock:
+                self._mappings.pop(path, None)
+                self._readers.pop(path, None)
+            total_bytes -= size
+
+def make_private_directory(directory):
+    """(NEW) Create a directory only the server user can open, or check an existing one.
+
+    The name is predictable, so in a shared temp directory another user could create it
+    (or a symlink) first. It is only used if it is a real directory owned by this user;
+    otherwise a fresh private directory is made instead. Returns the directory to use.
+    """
+    with contextlib.suppress(FileExistsError):
+        os.mkdir(directory, 0o700)
+    status = os.lstat(directory)
+    if (os.path.isdir(directory) and not os.path.islink(directory)
+            and (not hasattr(os, 'getuid') or status.st_uid == os.getuid())):
+        if status.st_mode & 0o077:
+            os.chmod(directory, 0o700)
+        return directory
+    return tempfile.mkdtemp(prefix=os.path.basename(directory) + "_")
+
+@st.cache_resource
+def get_template_store():
+    """Shared template store for every session in this server process."""
+    return TemplateStore(TEMPLATE_STORE_DIR, TEMPLATE_STORE_MAX_MB * 1024 * 1024)
+
+def decrypt_pdf_template(pdf_path, password=None):
+    """(NEW) Decrypt a stored PDF template once; return (plain path, encryption).
+
+    The decrypted copy is derived into the template store (readable by the server user
+    only), so analysis and every later fill read plain objects instead of decrypting
+    again. The password is checked on each call, which only derives the key, before the
+    cached copy is handed out. encryption is None for unencrypted PDFs, else a dict with
+    the original permissions and the passwords needed to re-encrypt the output.
+    Returns (None, None) when the password is missing or wrong.
+    """
+    with fitz.open(pdf_path, filetype="pdf") as pdf_document:
+        if not pdf_document.needs_pass and not (pdf_document.metadata or {}).get('encryption'):
+            return pdf_path, None
+        authentication = pdf_document.authenticate(password or '')
+        if not authentication:
+            return None, None
+
+    def build(template_file):
+        with fitz.open(template_file.path, filetype="pdf") as encrypted_document:
+            encrypted_document.authenticate(password or '')
+            # The /P entry holds the original permissions whichever password was used
+            encrypt_type, encrypt_value = encrypted_document.xref_get_key(-1, "Encrypt")
+            if encrypt_type == 'xref':
+                encrypt_value = encrypted_document.xref_object(int(encrypt_value.split()[0]))
+            permissions = re.search(r'/P\s*(-?\d+)', encrypt_value)
+            return encrypted_document.tobytes(encryption=fitz.PDF_ENCRYPT_NONE), {
+                'permissions': int(permissions.group(1)) if permissions else -1
+            }
+
+    plain_path, extra = get_template_store().derive(pdf_path, 'pdf', 'decrypted', build)
+    # authenticate() returns 2 for the user password, 4 for the owner password and 6 when they are equal
+    owner_authenticated = authentication >= 4
+    return plain_path, {
+        'permissions': extra['permissions'],
+        # An owner-password unlock must not become the password every reader needs to open the output
+        'user_password': password if authentication in (2, 6) else '',
+        # An unknown owner password is replaced so the permissions stay enforced
+        'owner_password': password if owner_authenticated else secrets.token_urlsafe(24)
+    }
+
+
+# --- Parallel PDF Functions ---
+@st.cache_resource
+def get_pdf_process_pool():
+    """Shared worker pool for large-PDF page ranges (spawned once per server process)."""
+    return ProcessPoolExecutor(max_workers=PDF_WORKER_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+
+def use_parallel_pdf(page_count):
+    """(NEW) Whether a PDF is large enough to be split across worker processes."""
+    return (PDF_WORKER_PROCESSES > 1 and page_count >= PARALLEL_PDF_MIN_PAGES
+            and st.session_state.get('parallel_pdf', True))
+
+def run_pdf_page_ranges(worker, source_path, page_count, *args):
+    """(NEW) Run a pdf_workers function over page ranges in parallel.
+
+    Every worker opens the template store file read-only, instead of the whole
+    document being pickled to each process. Results are returned in page order.
+    """
+    pool = get_pdf_process_pool()
+    futures = [
+        pool.submit(worker, source_path, start, end, *args)
+        for start, end in pdf_workers.split_page_ranges(page_count, PDF_WORKER_PROCESSES)
+    ]
+    return [future.result() for future in futures]
+
+
 # --- Analysis Functions (Unchanged) ---
 def analyze_pdf_fields(uploaded_file):
     """Analyze PDF file for field placeholders and form fields"""
@@ -127,9 +514,9 @@ def analyze_pdf_fields(uploaded_file):
         if hasattr(uploaded_file, 'seek'):
             uploaded_file.seek(0)
         
-        # Read PDF with PyMuPDF
-        pdf_bytes = uploaded_file.read()
-        pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+        # Read PDF with PyMuPDF, straight from the shared template store file
+        pdf_path = get_template_store().add(uploaded_file, 'pdf')
+        pdf_document = fitz.open(pdf_path, filetype="pdf")
         
         found_fields = set()
         field_locations = []
@@ -151,20 +538,28 @@ def analyze_pdf_fields(uploaded_file):
                 return [], []
         
         # Method 1: Extract text and look for {{field_name}} patterns
-        for page_num in range(len(pdf_document)):
-            page = pdf_document.load_page(page_num)
-            text_content = page.get_text()
+        if use_parallel_pdf(len(pdf_document)):
+            # Very large documents: scan page ranges in worker processes, merged in page order
+            for range_locations in run_pdf_page_ranges(pdf_workers.analyze_page_range, pdf_path, len(pdf_document),
+                                                       st.session_state.get('pdf_password')):
+                for location in range_locations:
+                    found_fields.add(location['field'])
+                    field_locations.append(location)
+        else:
+            for page_num in range(len(pdf_document)):
+                page = pdf_document.load_page(page_num)
+                text_content = page.get_text()
             
-            # Find field patterns in text
-            matches = re.findall(field_pattern, text_content)
-            for field in matches:
-                found_fields.add(field)
-                field_locations.append({
-                    'field': field,
-                    'page': page_num + 1,
-                    'type': 'text',
-                    'context': text_content[:100] + '...' if len(text_content) > 100 else text_content
-                })
+                # Find field patterns in text
+                matches = re.findall(field_pattern, text_content)
+                for field in matches:
+                    found_fields.add(field)
+                    field_locations.append({
+                        'field': field,
+                        'page': page_num + 1,
+                        'type': 'text',
+                        'context': text_content[:100] + '...' if len(text_content) > 100 else text_content
+                    })
         
         # Method 2: Check for form fields (if it's a fillable PDF)
         try:
@@ -174,24 +569,10 @@ def analyze_pdf_fields(uploaded_file):
             
             pdf_reader = PyPDF2.PdfReader(uploaded_file)
             
-            # Handle encrypted PDFs
+            # analyze_template hands over the decrypted copy of protected PDFs
             if pdf_reader.is_encrypted:
-                # Try to decrypt with empty password first (common case)
-                try:
-                    pdf_reader.decrypt("")
-                    st.info("📋 PDF encryption bypassed for form field analysis.")
-                except:
-                    # If that fails and we have a password from earlier, try it
-                    if 'pdf_password' in st.session_state and st.session_state.pdf_password:
-                        try:
-                            pdf_reader.decrypt(st.session_state.pdf_password)
-                            st.info("📋 Using provided password for form field analysis.")
-                        except:
-                            st.warning("⚠️ Could not decrypt PDF for form field analysis. Text analysis will still work.")
-                            pdf_reader = None
-                    else:
-                        st.warning("⚠️ PDF is encrypted. Form field detection limited. Text pattern detection will still work.")
-                        pdf_reader = None
+                st.warning("⚠️ PDF is encrypted. Form field detection limited. Text pattern detection will still work.")
+                pdf_reader = None
             
             if pdf_reader:
                 # Check each page for form fields
@@ -249,7 +630,9 @@ def analyze_powerpoint_fields(uploaded_file):
         field_locations = []
         
         for slide_num, slide in enumerate(prs.slides, 1):
-            for shape in slide.shapes:
+            if not has_placeholder_text(slide._element):
+                continue
+            for shape in iter_placeholder_shapes(slide.shapes):
                 if hasattr(shape, "text_frame") and shape.text_frame and shape.text_frame.text:
                     text_content = shape.text_frame.text
                     field_pattern = r'\{\{([^}]+)\}\}'
@@ -264,22 +647,20 @@ def analyze_powerpoint_fields(uploaded_file):
                         })
                 
                 elif shape.has_table:
-                    table = shape.table
-                    for row_num, row in enumerate(table.rows):
-                        for cell_num, cell in enumerate(row.cells):
-                            if cell.text:
-                                text_content = cell.text
-                                field_pattern = r'\{\{([^}]+)\}\}'
-                                matches = re.findall(field_pattern, text_content)
-                                
-                                for field in matches:
-                                    found_fields.add(field)
-                                    field_locations.append({
-                                        'field': field,
-                                        'slide': slide_num,
-                                        'location': f'Table R{row_num+1}C{cell_num+1}',
-                                        'context': text_content[:50] + '...' if len(text_content) > 50 else text_content
-                                    })
+                    for row_num, cell_num, _, paragraphs in iter_table_cells(shape.table._tbl, DRAWING_NAMESPACE):
+                        text_content = "\n".join(_Paragraph(paragraph, shape).text for paragraph in paragraphs)
+                        if text_content:
+                            field_pattern = r'\{\{([^}]+)\}\}'
+                            matches = re.findall(field_pattern, text_content)
+                            
+                            for field in matches:
+                                found_fields.add(field)
+                                field_locations.append({
+                                    'field': field,
+                                    'slide': slide_num,
+                                    'location': f'Table R{row_num+1}C{cell_num+1}',
+                                    'context': text_content[:50] + '...' if len(text_content) > 50 else text_content
+                                })
         
         return list(found_fields), field_locations
 
@@ -301,15 +682,14 @@ def analyze_word_fields(uploaded_file):
                 for field in matches:
                     found_fields.add(field)
 
-        # Check tables
+        # Check tables (each merged cell once, nested tables included)
         for table in doc.tables:
-            for row in table.rows:
-                for cell in row.cells:
-                    for para in cell.paragraphs:
-                        if para.text:
-                            matches = re.findall(field_pattern, para.text)
-                            for field in matches:
-                                found_fields.add(field)
+            for _, _, _, paragraphs in iter_table_cells(table._tbl, WORD_NAMESPACE):
+                for para in (Paragraph(paragraph, table) for paragraph in paragraphs):
+                    if para.text:
+                        matches = re.findall(field_pattern, para.text)
+                        for field in matches:
+                            found_fields.add(field)
 
         # Check text boxes and shapes (NEW CODE)
         try:
@@ -362,23 +742,13 @@ def analyze_word_fields(uploaded_file):
             # If XML parsing fails, fall back to a simpler approach
             st.warning(f"Advanced text box detection failed: {e}. Using basic detection only.")
 
-        # Alternative approach: check headers and footers which might contain text boxes
-        for section in doc.sections:
-            # Check headers
-            if section.header:
-                for para in section.header.paragraphs:
-                    if para.text:
-                        matches = re.findall(field_pattern, para.text)
-                        for field in matches:
-                            found_fields.add(field)
-            
-            # Check footers  
-            if section.footer:
-                for para in section.footer.paragraphs:
-                    if para.text:
-                        matches = re.findall(field_pattern, para.text)
-                        for field in matches:
-                            found_fields.add(field)
+        # Check headers, footers, footnotes and endnotes (each shared part once)
+        for part, element in word_story_parts(doc):
+            for para in (Paragraph(paragraph, part) for paragraph in element.iter(f'{{{WORD_NAMESPACE}}}p')):
+                if para.text:
+                    matches = re.findall(field_pattern, para.text)
+                    for field in matches:
+                        found_fields.add(field)
         
         return list(found_fields), []
         
@@ -387,7 +757,726 @@ def analyze_word_fields(uploaded_file):
         return [], []
 
 
+# --- Streaming Analysis Functions ---
+def scan_ooxml_fields_streaming(template_file, file_extension, split_parts=None):
+    """(NEW) Find {{field}} placeholders without building the python-docx/pptx object model.
+
+    Each relevant XML part is streamed straight out of the zip with lxml.iterparse.
+    Text is joined per paragraph (so placeholders split across runs are still found)
+    and every paragraph is cleared as soon as it has been read, so memory stays
+    bounded regardless of document size. If split_parts (a set) is given, the names
+    of parts with a placeholder split across runs are added to it, for
+    normalize_template_runs.
+    Returns (fields, field_locations) in the same shape as the object-model analyzers.
+    """
+    from lxml import etree
+
+    if file_extension == 'docx':
+        tags = DOCX_RUN_TAGS
+    else:
+        tags = PPTX_RUN_TAGS
+    field_pattern = r'\{\{([^}]+)\}\}'
+    found_fields = set()
+    field_locations = []
+
+    with zipfile.ZipFile(template_file) as package:
+        for part_name, location in _streaming_scan_parts(package, file_extension):
+            with package.open(part_name) as part_stream:
+                paragraph_number = 0
+                for _, paragraph in etree.iterparse(part_stream, events=('end',), tag=tags['p']):
+                    paragraph_number += 1
+                    texts = [t.text for t in paragraph.iter(tags['t']) if t.text]
+                    text_content = ''.join(texts)
+                    if '{{' in text_content:
+                        if split_parts is not None and _has_split_text(texts):
+                            split_parts.add(part_name)
+                        for field in re.findall(field_pattern, text_content):
+                            found_fields.add(field)
+                            field_locations.append(dict(
+                                location,
+                                field=field,
+                                paragraph=paragraph_number,
+                                context=text_content[:100] + '...' if len(text_content) > 100 else text_content
+                            ))
+                    # Drop the paragraph and anything before it that has already been scanned
+                    paragraph.clear()
+                    while paragraph.getprevious() is not None:
+                        del paragraph.getparent()[0]
+
+    return list(found_fields), field_locations
+
+def _streaming_scan_parts(package, file_extension):
+    """Yield (part name, base location dict) for the parts that can hold placeholders."""
+    names = set(package.namelist())
+    if file_extension == 'docx':
+        for part_name in sorted(names):
+            if re.fullmatch(NORMALIZED_DOCX_PARTS, part_name):
+                yield part_name, {'part': part_name}
+        return
+
+    # Slides are numbered by their order in presentation.xml, not by file name
+    from lxml import etree
+
+    relationship_namespace = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+    presentation_namespace = 'http://schemas.openxmlformats.org/presentationml/2006/main'
+    slide_targets = {}
+    if 'ppt/_rels/presentation.xml.rels' in names:
+        for relationship in etree.fromstring(package.read('ppt/_rels/presentation.xml.rels')):
+            slide_targets[relationship.get('Id')] = posixpath.normpath(posixpath.join('ppt', relationship.get('Target')))
+    slide_order = []
+    if 'ppt/presentation.xml' in names:
+        presentation = etree.fromstring(package.read('ppt/presentation.xml'))
+        for slide_id in presentation.iter(f'{{{presentation_namespace}}}sldId'):
+            target = slide_targets.get(slide_id.get(f'{{{relationship_namespace}}}id'))
+            if target in names:
+                slide_order.append(target)
+    if not slide_order:
+        slide_order = sorted((name for name in names if re.fullmatch(NORMALIZED_PPTX_PARTS, name)),
+                             key=lambda name: int(re.search(r'(\d+)\.xml$', name).group(1)))
+
+    for slide_number, part_name in enumerate(slide_order, 1):
+        yield part_name, {'slide': slide_number}
+
+
+def analyze_template(source_file, file_extension):
+    """(NEW) Normalize and analyze a template in one pass.
+
+    Returns a dict with template_path (the template store file to fill from, normalized
+    for DOCX/PPTX, decrypted for protected PDFs), splits_repaired, fields, field_locations,
+    image_fields and pdf_encryption, or None for an unsupported file type. main() keeps the result per session so reruns skip this.
+    """
+    if file_extension not in ('pptx', 'docx', 'pdf', 'xlsx'):
+        return None
+    store = get_template_store()
+    template_path = store.add(source_file, file_extension)
+    splits_repaired = 0
+    pdf_encryption = None
+    if file_extension == 'pdf':
+        # Protected PDFs are decrypted once; analysis and every fill then read the plain copy
+        plain_path, pdf_encryption = decrypt_pdf_template(template_path, st.session_state.get('pdf_password'))
+        if plain_path is not None:
+            template_path = plain_path
+    streaming = file_extension in ('pptx', 'docx') and st.session_state.get('streaming_analysis', True)
+    split_parts = set() if streaming else None
+
+    with st.spinner('🔍 Analyzing template fields...'):
+        if streaming:
+            # Scanning first finds the parts with split placeholders, so only those are normalized
+            fields, field_locations = scan_ooxml_fields_streaming(store.open(template_path), file_extension, split_parts)
+        # Repair placeholders split across runs once per template (stored by content, shared by all sessions)
+        if file_extension in ('pptx', 'docx') and split_parts != set():
+            template_path, splits_repaired = store.derive(
+                template_path, file_extension, 'normalized',
+                lambda template_file: normalize_template_runs(template_file, file_extension, split_parts)
+            )
+        source_file = store.open(template_path)
+
+        if file_extension == 'xlsx':
+            fields, field_locations = scan_xlsx_fields_streaming(source_file)
+        elif streaming:
+            pass
+        elif file_extension == 'pptx':
+            fields, field_locations = analyze_powerpoint_fields(source_file)
+        elif file_extension == 'docx':
+            fields, field_locations = analyze_word_fields(source_file)
+        else:
+            fields, field_locations = analyze_pdf_fields(source_file)
+        fields, image_fields = split_image_fields(fields)
+
+    return {
+        'template_path': template_path,
+        'splits_repaired': splits_repaired,
+        'fields': fields,
+        'field_locations': field_locations,
+        'image_fields': image_fields,
+        'pdf_encryption': pdf_encryption
+    }
+
+
+# --- Excel Functions ---
+def _xlsx_tag(name):
+    return f'{{{SPREADSHEET_NAMESPACE}}}{name}'
+
+def _xlsx_part_path(base_part, target):
+    """Resolve a relationship target (relative or absolute) to a zip member name."""
+    if target.startswith('/'):
+        return target.lstrip('/')
+    return posixpath.normpath(posixpath.join(posixpath.dirname(base_part), target))
+
+def _xlsx_related_parts(package, part_name, relationship_type):
+    """Map relationship ID -> zip member name for one relationship type of a part."""
+    from lxml import etree
+
+    rels_name = posixpath.join(posixpath.dirname(part_name), '_rels', posixpath.basename(part_name) + '.rels')
+    if rels_name not in package.namelist():
+        return {}
+    return {
+        relationship.get('Id'): _xlsx_part_path(part_name, relationship.get('Target'))
+        for relationship in etree.fromstring(package.read(rels_name))
+        if relationship.get('Type', '').endswith('/' + relationship_type) and relationship.get('TargetMode') != 'External'
+    }
+
+def _xlsx_sheet_parts(package):
+    """Return [(sheet name, worksheet part name)] in workbook order."""
+    from lxml import etree
+
+    sheet_targets = _xlsx_related_parts(package, 'xl/workbook.xml', 'worksheet')
+    workbook = etree.fromstring(package.read('xl/workbook.xml'))
+    sheets = []
+    for sheet in workbook.iter(_xlsx_tag('sheet')):
+        target = sheet_targets.get(sheet.get(f'{{{RELATIONSHIP_NAMESPACE}}}id'))
+        if target in package.namelist():
+            sheets.append((sheet.get('name'), target))
+    return sheets
+
+def _xlsx_string_text(string_element):
+    """Text of a shared string item or inline string (plain or rich text runs, without phonetic hints)."""
+    return ''.join(
+        text_element.text or ''
+        for text_element in string_element.iter(_xlsx_tag('t'))
+        if text_element.getparent().tag != _xlsx_tag('rPh')
+    )
+
+def _xlsx_placeholder_strings(package):
+    """Stream sharedStrings.xml and keep only the items that contain a placeholder.
+
+    Returns {shared string index: <si> element}. Other strings are never held in memory.
+    """
+    from lxml import etree
+
+    placeholder_strings = {}
+    if 'xl/sharedStrings.xml' not in package.namelist():
+        return placeholder_strings
+    with package.open('xl/sharedStrings.xml') as part_stream:
+        for index, (_, string_item) in enumerate(etree.iterparse(part_stream, tag=_xlsx_tag('si'))):
+            if '{{' in _xlsx_string_text(string_item):
+                placeholder_strings[index] = copy.deepcopy(string_item)
+            string_item.clear()
+            while string_item.getprevious() is not None:
+                del string_item.getparent()[0]
+    return placeholder_strings
+
+def _xlsx_row_has_placeholder(row, placeholder_strings):
+    """Cheap whole-row check so rows without placeholders skip the per-cell work."""
+    # Inline strings carry their text in the row; shared strings are matched by index
+    if '{{' in ''.join(row.itertext()):
+        return True
+    return bool(placeholder_strings) and any(
+        value.text and value.text.strip().isdigit() and int(value.text) in placeholder_strings
+        for value in row.iterfind(f"{_xlsx_tag('c')}[@t='s']/{_xlsx_tag('v')}")
+    )
+
+def _xlsx_cell_text(cell, placeholder_strings):
+    """Placeholder-bearing text of a cell, or None for cells that cannot hold one."""
+    cell_type = cell.get('t')
+    if cell_type == 's':
+        value = cell.find(_xlsx_tag('v'))
+        if value is not None and value.text and value.text.strip().isdigit():
+            string_item = placeholder_strings.get(int(value.text))
+            if string_item is not None:
+                return _xlsx_string_text(string_item)
+    elif cell_type == 'inlineStr':
+        inline_string = cell.find(_xlsx_tag('is'))
+        # itertext() is a cheap first pass; most inline strings hold no placeholder
+        if inline_string is not None and '{{' in ''.join(inline_string.itertext()):
+            text = _xlsx_string_text(inline_string)
+            if '{{' in text:
+                return text
+    return None
+
+def scan_xlsx_fields_streaming(template_file):
+    """(NEW) Find {{field}} placeholders in a workbook without loading its cells.
+
+    Worksheets are streamed row by row with lxml.iterparse. Cells (shared and inline
+    strings), headers/footers, chart titles and drawing text boxes are searched.
+    Fields written as {{table.column}} mark a row that can be repeated per item.
+    Returns (fields, field_locations) with {'sheet', 'cell', 'field'} locations.
+    """
+    from lxml import etree
+
+    field_pattern = r'\{\{([^}]+)\}\}'
+    found_fields = set()
+    field_locations = []
+
+    def record(text, sheet, cell):
+        for field in re.findall(field_pattern, text):
+            found_fields.add(field)
+            field_locations.append({'field': field, 'sheet': sheet, 'cell': cell})
+
+    with zipfile.ZipFile(template_file) as package:
+        placeholder_strings = _xlsx_placeholder_strings(package)
+        header_footer_tags = {_xlsx_tag(name) for name in XLSX_HEADER_FOOTER_TAGS}
+        for sheet_name, part_name in _xlsx_sheet_parts(package):
+            with package.open(part_name) as part_stream:
+                for _, element in etree.iterparse(part_stream, tag=(_xlsx_tag('row'), *header_footer_tags)):
+                    if element.tag == _xlsx_tag('row'):
+                        cells = element.iter(_xlsx_tag('c')) if _xlsx_row_has_placeholder(element, placeholder_strings) else ()
+                        for cell in cells:
+                            text = _xlsx_cell_text(cell, placeholder_strings)
+                            if text:
+                                record(text, sheet_name, cell.get('r', f"row {element.get('r')}"))
+                        element.clear()
+                        while element.getprevious() is not None:
+                            del element.getparent()[0]
+                    elif element.text and '{{' in element.text:
+                        record(element.text, sheet_name, 'header/footer')
+
+        for part_name in package.namelist():
+            if re.fullmatch(XLSX_DRAWING_PARTS, part_name):
+                drawing = etree.fromstring(package.read(part_name))
+                for paragraph in drawing.iter(f'{{{DRAWING_NAMESPACE}}}p'):
+                    record(''.join(text.text or '' for text in paragraph.iter(f'{{{DRAWING_NAMESPACE}}}t')),
+                           'Charts and drawings', posixpath.basename(part_name))
+
+    return sorted(found_fields), field_locations
+
+def _replace_placeholders(text, values):
+    """Replace every known {{field}} in text. Returns (text, replacements)."""
+    replacements = 0
+    for placeholder, value in values.items():
+        if placeholder in text:
+            replacements += text.count(placeholder)
+            text = text.replace(placeholder, str(value))
+    return text, replacements
+
+def _replace_in_text_elements(text_elements, values):
+    """Replace placeholders across a sequence of text elements (one logical string).
+
+    A placeholder split across rich-text runs is moved into the first run's text.
+    """
+    text_elements = list(text_elements)
+    combined_text = ''.join(text_element.text or '' for text_element in text_elements)
+    if '{{' not in combined_text:
+        return 0
+    new_text, replacements = _replace_placeholders(combined_text, values)
+    if replacements:
+        per_element = [_replace_placeholders(text_element.text or '', values) for text_element in text_elements]
+        if sum(count for _, count in per_element) == replacements:
+            # Every placeholder sits inside one run, so each run keeps its own formatting
+            for text_element, (text, _) in zip(text_elements, per_element):
+                text_element.text = text
+        else:
+            text_elements[0].text = new_text
+            for text_element in text_elements[1:]:
+                text_element.text = ''
+        for text_element in text_elements:
+            text_element.set('{http://www.w3.org/XML/1998/namespace}space', 'preserve')
+    return replacements
+
+def _shift_row(row, expansions, range_end=False):
+    """Map an original row number through the repeated rows inserted above it.
+
+    expansions is [(template row, extra rows)]. A range ending on a repeated row is
+    extended to cover every copy.
+    """
+    shifted = row
+    for template_row, extra_rows in expansions:
+        if template_row < row or (range_end and template_row == row):
+            shifted += extra_rows
+    return shifted
+
+def _shift_range_list(references, expansions):
+    """Shift a space-separated list of A1 ranges (ref/sqref attributes)."""
+    shifted_references = []
+    for reference in references.split():
+        start, _, end = reference.partition(':')
+        start_match = re.fullmatch(r'(\$?[A-Z]+\$?)(\d+)', start)
+        end_match = re.fullmatch(r'(\$?[A-Z]+\$?)(\d+)', end) if end else None
+        if not start_match:
+            shifted_references.append(reference)
+            continue
+        shifted = f"{start_match.group(1)}{_shift_row(int(start_match.group(2)), expansions)}"
+        if end_match:
+            shifted += f":{end_match.group(1)}{_shift_row(int(end_match.group(2)), expansions, range_end=True)}"
+        elif end:
+            shifted += f":{end}"
+        else:
+            # A single cell on a repeated row (e.g. a validation) covers every copy
+            last_row = _shift_row(int(start_match.group(2)), expansions, range_end=True)
+            if last_row > _shift_row(int(start_match.group(2)), expansions):
+                shifted += f":{start_match.group(1)}{last_row}"
+        shifted_references.append(shifted)
+    return ' '.join(shifted_references)
+
+def _shift_formula(formula, expansions, template_row=None, copy_row=None):
+    """Shift same-sheet A1 references in a formula through the repeated rows above.
+
+    In a copy of a repeated row, relative references to the template row point at
+    the copy's own row. References qualified with a sheet name are left alone.
+    """
+    def shift_reference(match, range_end):
+        column, absolute, row = match.group(1), match.group(2), int(match.group(3))
+        if copy_row is not None and row == template_row and not absolute:
+            return f"{column}{copy_row}"
+        return f"{column}{absolute}{_shift_row(row, expansions, range_end)}"
+
+    def shift(match):
+        start = shift_reference(re.match(XLSX_CELL_REFERENCE, match.group(1)), False)
+        if match.group(2):
+            return f"{start}:{shift_reference(re.match(XLSX_CELL_REFERENCE, match.group(2)), True)}"
+        return start
+
+    return re.sub(XLSX_FORMULA_REFERENCE, shift, formula)
+
+def _fill_xlsx_row(row, row_number, new_row_number, placeholder_strings, values, expansions, copy_index=0):
+    """Fill one <row> in place: placeholders, then row/cell numbers and formulas."""
+    replacements = 0
+    moved = new_row_number != row_number
+    if moved and row.get('r'):
+        row.set('r', str(new_row_number))
+
+    for cell in row.iter(_xlsx_tag('c')):
+        if moved and cell.get('r'):
+            cell.set('r', re.sub(r'\d+$', str(new_row_number), cell.get('r')))
+
+        formula = cell.find(_xlsx_tag('f'))
+        if formula is not None:
+            if copy_index and formula.get('t') == 'shared':
+                # Shared formulas cannot be repeated; later copies keep the cached value
+                cell.remove(formula)
+            elif expansions or copy_index:
+                if formula.text:
+                    formula.text = _shift_formula(formula.text, expansions, row_number if copy_index else None,
+                                                  new_row_number if copy_index else None)
+                if formula.get('ref'):
+                    formula.set('ref', _shift_range_list(formula.get('ref'), expansions))
+
+        text = _xlsx_cell_text(cell, placeholder_strings)
+        if not text:
+            continue
+        value = values.get(text.strip())
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and re.fullmatch(r'\{\{[^}]+\}\}', text.strip()):
+            # A cell that is just one placeholder with a numeric value becomes a real number
+            for child in list(cell):
+                if child.tag != _xlsx_tag('f'):
+                    cell.remove(child)
+            cell.attrib.pop('t', None)
+            number = cell.makeelement(_xlsx_tag('v'), {})
+            number.text = repr(value) if isinstance(value, float) else str(value)
+            cell.append(number)
+            replacements += 1
+            continue
+
+        if cell.get('t') == 's':
+            # Give the cell its own inline copy of the shared string so each row gets its own value
+            shared_index = cell.find(_xlsx_tag('v'))
+            string_item = placeholder_strings[int(shared_index.text)]
+            cell.remove(shared_index)
+            inline_string = cell.makeelement(_xlsx_tag('is'), {})
+            inline_string.extend(copy.deepcopy(child) for child in string_item)
+            cell.set('t', 'inlineStr')
+            cell.append(inline_string)
+        inline_string = cell.find(_xlsx_tag('is'))
+        replacements += _replace_in_text_elements(
+            (text_element for text_element in inline_string.iter(_xlsx_tag('t'))
+             if text_element.getparent().tag != _xlsx_tag('rPh')),
+            values
+        )
+    return replacements
+
+def _xlsx_sheet_expansions(source, placeholder_strings, row_lists):
+    """Find the rows a list value repeats, before any row is written, so formulas above
+    a repeated row are shifted too. Returns [(template row, extra rows)] in row order.
+    Like the fill itself this streams the sheet one row at a time.
+    """
+    from lxml import etree
+
+    expansions = []
+    if not row_lists:
+        return expansions
+    last_row_number = 0
+    for _, row in etree.iterparse(source, events=('end',), tag=_xlsx_tag('row')):
+        row_number = int(row.get('r')) if row.get('r') else last_row_number + 1
+        last_row_number = row_number
+        if _xlsx_row_has_placeholder(row, placeholder_strings):
+            list_name = _repeated_row_name(row, placeholder_strings, row_lists)
+            if list_name is not None:
+                # An empty list keeps its row (see _fill_xlsx_sheet), so it adds none
+                expansions.append((row_number, max(len(row_lists[list_name]), 1) - 1))
+        row.clear()
+        while row.getprevious() is not None:
+            del row.getparent()[0]
+    return expansions
+
+def _fill_xlsx_sheet(source, target, placeholder_strings, values, row_lists, expansions):
+    """Stream one worksheet from source to target, filling and repeating rows.
+
+    expansions comes from _xlsx_sheet_expansions, so every reference is shifted for all
+    repeated rows, including those below it. Only the current row is held in memory.
+    Returns the number of replacements.
+    """
+    from lxml import etree
+
+    replacements = 0
+    last_row_number = 0
+    row_offset = 0
+    sheet_data_writer = None
+    root_writer = None
+    inherited_declarations = []
+
+    def write(element):
+        # xmlfile would repeat the worksheet's namespace declarations on every element
+        xml_file.flush()
+        element_bytes = etree.tostring(element, encoding='UTF-8', xml_declaration=False)
+        tag_end = element_bytes.index(b'>')
+        start_tag = element_bytes[:tag_end]
+        for declaration in inherited_declarations:
+            start_tag = start_tag.replace(declaration, b'', 1)
+        target.write(start_tag + element_bytes[tag_end:])
+
+    def write_top_level_elements(root, before=None):
+        nonlocal replacements
+        for element in list(root):
+            if element is before:
+                break
+            # The dimension hint is dropped since rows may have been repeated
+            if element.tag != _xlsx_tag('dimension'):
+                replacements += _fill_xlsx_sheet_element(element, values, expansions)
+                write(element)
+            root.remove(element)
+
+    with etree.xmlfile(target, encoding='UTF-8') as xml_file:
+        xml_file.write_declaration(standalone=True)
+        # Only sheetData and row events reach Python; cells are handled a whole row at a time
+        parser = etree.iterparse(source, events=('start', 'end'), tag=(_xlsx_tag('sheetData'), _xlsx_tag('row')))
+        for event, element in parser:
+            if element.tag == _xlsx_tag('sheetData'):
+                if event == 'start':
+                    root = element.getparent()
+                    inherited_declarations = [
+                        (f' xmlns:{prefix}="{uri}"' if prefix else f' xmlns="{uri}"').encode('utf-8')
+                        for prefix, uri in root.nsmap.items()
+                    ]
+                    root_writer = xml_file.element(root.tag, dict(root.attrib), nsmap=root.nsmap)
+                    root_writer.__enter__()
+                    write_top_level_elements(root, before=element)
+                    sheet_data_writer = xml_file.element(element.tag, dict(element.attrib))
+                    sheet_data_writer.__enter__()
+                else:
+                    sheet_data_writer.__exit__(None, None, None)
+                    element.getparent().remove(element)
+                continue
+            if event == 'start':
+                continue
+
+            row_number = int(element.get('r')) if element.get('r') else last_row_number + 1
+            last_row_number = row_number
+            has_placeholder = _xlsx_row_has_placeholder(element, placeholder_strings)
+            list_name = _repeated_row_name(element, placeholder_strings, row_lists) if has_placeholder else None
+            if list_name is None:
+                if has_placeholder or expansions:
+                    replacements += _fill_xlsx_row(element, row_number, row_number + row_offset,
+                                                   placeholder_strings if has_placeholder else {}, values, expansions)
+                write(element)
+            else:
+                # An empty list keeps one blank row so ranges over the repeated rows stay valid
+                items = row_lists[list_name] or [
+                    dict.fromkeys(_repeated_row_columns(element, placeholder_strings, list_name), '')]
+                for index, item in enumerate(items):
+                    if not isinstance(item, dict):
+                        item = {'value': item}
+                    item_values = dict(values)
+                    item_values.update({f"{{{{{list_name}.{key}}}}}": value for key, value in item.items()})
+                    row_copy = copy.deepcopy(element)
+                    replacements += _fill_xlsx_row(row_copy, row_number, row_number + row_offset + index,
+                                                   placeholder_strings, item_values, expansions, copy_index=index)
+                    write(row_copy)
+                row_offset += len(items) - 1
+            element.clear()
+            element.getparent().remove(element)
+
+        if root_writer is None:
+            # No sheetData (e.g. a chartsheet): the whole part is small
+            root = parser.root
+            for element in root:
+                replacements += _fill_xlsx_sheet_element(element, values, expansions)
+            xml_file.write(root)
+        else:
+            write_top_level_elements(parser.root)
+            root_writer.__exit__(None, None, None)
+    return replacements
+
+def _repeated_row_name(row, placeholder_strings, row_lists):
+    """Name of the list a row repeats for ({{name.column}} with a list value), or None."""
+    if not row_lists:
+        return None
+    for cell in row.iter(_xlsx_tag('c')):
+        text = _xlsx_cell_text(cell, placeholder_strings)
+        if text:
+            for list_name, _ in re.findall(REPEATED_ROW_PATTERN, text):
+                if list_name in row_lists:
+                    return list_name
+    return None
+
+def _repeated_row_columns(row, placeholder_strings, list_name):
+    """Columns of the {{list_name.column}} placeholders in a row."""
+    columns = []
+    for cell in row.iter(_xlsx_tag('c')):
+        text = _xlsx_cell_text(cell, placeholder_strings)
+        if text:
+            columns.extend(column for name, column in re.findall(REPEATED_ROW_PATTERN, text) if name == list_name)
+    return columns
+
+def _fill_xlsx_sheet_element(element, values, expansions):
+    """Fill headers/footers and shift merged cells, hyperlinks, validations etc."""
+    replacements = 0
+    if element.tag == _xlsx_tag('headerFooter'):
+        for header_footer in element:
+            if header_footer.text:
+                header_footer.text, count = _replace_placeholders(header_footer.text, values)
+                replacements += count
+    if not expansions:
+        return replacements
+
+    if element.tag == _xlsx_tag('mergeCells'):
+        repeated_rows = dict(expansions)
+        for merge_cell in list(element):
+            rows = re.findall(r'\d+', merge_cell.get('ref', ''))
+            if len(rows) == 2 and rows[0] == rows[1] and int(rows[0]) in repeated_rows:
+                # A merge inside a repeated row is repeated with it
+                template_row = int(rows[0])
+                first_row = _shift_row(template_row, expansions)
+                for index in range(repeated_rows[template_row] + 1):
+                    merge_copy = copy.deepcopy(merge_cell)
+                    merge_copy.set('ref', re.sub(r'\d+', str(first_row + index), merge_cell.get('ref')))
+                    merge_cell.addprevious(merge_copy)
+                element.remove(merge_cell)
+            else:
+                merge_cell.set('ref', _shift_range_list(merge_cell.get('ref', ''), expansions))
+        element.set('count', str(len(element)))
+        return replacements
+
+    for node in element.iter():
+        for attribute in ('ref', 'sqref'):
+            if node.get(attribute):
+                node.set(attribute, _shift_range_list(node.get(attribute), expansions))
+    return replacements
+
+def _fill_xlsx_drawing(part_bytes, values):
+    """Fill chart titles/labels and drawing text boxes. Returns (bytes, replacements)."""
+    from lxml import etree
+
+    drawing = etree.fromstring(part_bytes)
+    replacements = 0
+    for paragraph in drawing.iter(f'{{{DRAWING_NAMESPACE}}}p'):
+        replacements += _replace_in_text_elements(paragraph.iter(f'{{{DRAWING_NAMESPACE}}}t'), values)
+    # Cached series and category names
+    for cached_value in drawing.iter('{http://schemas.openxmlformats.org/drawingml/2006/chart}v'):
+        if cached_value.text and '{{' in cached_value.text:
+            cached_value.text, count = _replace_placeholders(cached_value.text, values)
+            replacements += count
+    if not replacements:
+        return part_bytes, 0
+    return etree.tostring(drawing, xml_declaration=True, encoding='UTF-8', standalone=True), replacements
+
+def _remove_calculation_chain(package, part_name):
+    """Drop calcChain references and ask Excel to recalculate everything on open.
+
+    Filled values and repeated rows invalidate the cached calculation chain; Excel
+    rebuilds it automatically.
+    """
+    from lxml import etree
+
+    part = etree.fromstring(package.read(part_name))
+    if part_name == '[Content_Types].xml':
+        for override in list(part):
+            if override.get('PartName') == '/xl/calcChain.xml':
+                part.remove(override)
+    elif part_name == 'xl/_rels/workbook.xml.rels':
+        for relationship in list(part):
+            if relationship.get('Type', '').endswith('/calcChain'):
+                part.remove(relationship)
+    else:
+        calculation_properties = part.find(_xlsx_tag('calcPr'))
+        if calculation_properties is None:
+            calculation_properties = part.makeelement(_xlsx_tag('calcPr'), {})
+            # calcPr follows sheets/definedNames and precedes everything else
+            anchor = None
+            for name in ('sheets', 'functionGroups', 'externalReferences', 'definedNames'):
+                if part.find(_xlsx_tag(name)) is not None:
+                    anchor = part.find(_xlsx_tag(name))
+            anchor.addnext(calculation_properties)
+        calculation_properties.set('fullCalcOnLoad', '1')
+    return etree.tostring(part, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+def fill_excel_with_data(template_file, data):
+    """(NEW) Fill an .xlsx template by streaming its XML. Returns (bytes, replacements).
+
+    Worksheets are rewritten row by row (lxml.iterparse in, lxml.xmlfile out), so
+    workbooks with hundreds of thousands of rows never become Python cell objects.
+    Text values replace {{field}} in cells, headers/footers, charts and text boxes;
+    a cell that is exactly one placeholder with a numeric value becomes a number.
+    A list value repeats each row holding {{name.column}} placeholders once per item
+    (e.g. "hazards": [{"hazard": "...", "control": "..."}]); rows below, merged
+    cells, tables, validations and same-sheet formula references move down to match.
+    An empty list leaves the row in place with its list placeholders blanked.
+    """
+    from lxml import etree
+
+    values = {f"{{{{{field}}}}}": value for field, value in data.items() if not isinstance(value, list)}
+    row_lists = {field: value for field, value in data.items() if isinstance(value, list)}
+    calculation_parts = ('[Content_Types].xml', 'xl/_rels/workbook.xml.rels', 'xl/workbook.xml')
+    replacements = 0
+    output_buffer = io.BytesIO()
+
+    with zipfile.ZipFile(template_file) as package, \
+            zipfile.ZipFile(output_buffer, 'w', zipfile.ZIP_DEFLATED) as output:
+        placeholder_strings = _xlsx_placeholder_strings(package)
+        sheet_parts = [part_name for _, part_name in _xlsx_sheet_parts(package)]
+
+        # Worksheets first, so tables can be moved to match repeated rows afterwards
+        table_expansions = {}
+        for part_name in sheet_parts:
+            with package.open(part_name) as source:
+                expansions = _xlsx_sheet_expansions(source, placeholder_strings, row_lists)
+            with package.open(part_name) as source, output.open(part_name, 'w', force_zip64=True) as target:
+                replacements += _fill_xlsx_sheet(source, target, placeholder_strings, values, row_lists, expansions)
+            if expansions:
+                for table_part in _xlsx_related_parts(package, part_name, 'table').values():
+                    table_expansions[table_part] = expansions
+
+        for item in package.infolist():
+            part_name = item.filename
+            if part_name in sheet_parts or part_name == 'xl/calcChain.xml':
+                continue
+            if part_name in calculation_parts:
+                output.writestr(part_name, _remove_calculation_chain(package, part_name))
+            elif re.fullmatch(XLSX_DRAWING_PARTS, part_name):
+                part_bytes, count = _fill_xlsx_drawing(package.read(item), values)
+                replacements += count
+                output.writestr(part_name, part_bytes)
+            elif part_name in table_expansions:
+                table = etree.fromstring(package.read(item))
+                for node in table.iter():
+                    if node.get('ref'):
+                        node.set('ref', _shift_range_list(node.get('ref'), table_expansions[part_name]))
+                output.writestr(part_name, etree.tostring(table, xml_declaration=True, encoding='UTF-8', standalone=True))
+            else:
+                output.writestr(item, package.read(item))
+
+    return output_buffer.getvalue(), replacements
+
+
 # --- Helper and Filling Functions ---
+def _owned_elements(elements, owner_tag, owner):
+    """Elements whose nearest owner_tag ancestor is owner (not ones inside a nested table)."""
+    return [element for element in elements if next(element.iterancestors(owner_tag), None) is owner]
+
+def iter_table_cells(table_element, namespace):
+    """(NEW) Yield (row, column, cell element, paragraph elements) for every physical cell of a table.
+
+    Walks the w:tc / a:tc elements directly. python-docx's row.cells rebuilds the cell
+    grid for each row and repeats a merged cell once per grid column (and row) it spans;
+    here each cell is visited exactly once, in document order. Cells of nested tables
+    follow the cell containing them, each with only its own paragraphs.
+    """
+    table_tag, row_tag, cell_tag, paragraph_tag = (f'{{{namespace}}}{name}' for name in ('tbl', 'tr', 'tc', 'p'))
+    for row_index, row in enumerate(_owned_elements(table_element.iter(row_tag), table_tag, table_element)):
+        for column_index, cell in enumerate(_owned_elements(row.iter(cell_tag), row_tag, row)):
+            yield row_index, column_index, cell, _owned_elements(cell.iter(paragraph_tag), cell_tag, cell)
+            for nested_table in _owned_elements(cell.iter(table_tag), cell_tag, cell):
+                yield from iter_table_cells(nested_table, namespace)
+
 
 # --- REFACTORED: Generate AI prompt function ---
 def generate_ai_prompt(fields, project_data, template_name=None):
@@ -399,6 +1488,11 @@ def generate_ai_prompt(fields, project_data, template_name=None):
     
     # Prepare field list
     field_descriptions = [f"  - {field}" for field in sorted(fields)]
+    repeated_rows = sorted({match.group(1) for field in fields if (match := re.fullmatch(r'([^.]+)\.(.+)', field))})
+    for list_name in repeated_rows:
+        # Spreadsheet rows written as {{name.column}} repeat once per item of a list
+        field_descriptions.append(f'  - {list_name}: optional list of objects keyed by the "{list_name}.*" column names '
+                                  f'(without the "{list_name}." prefix), one spreadsheet row per item')
     field_list = "\n".join(field_descriptions)
     
     # Replace placeholders in the prompt template
@@ -416,18 +1510,21 @@ def replace_text_in_paragraph(paragraph, key, value):
     if key not in paragraph.text:
         return
     
-    # Replace the simple case
+    # Replace the simple case (templates are normalized on load, so this is the usual path)
     for run in paragraph.runs:
         if key in run.text:
             run.text = run.text.replace(key, value)
-            return
-
-    # Handle cases where the key is split across multiple runs
-    runs = paragraph.runs
-    full_text = "".join(run.text for run in runs)
-    if key in full_text:
-        start_index = full_text.find(key)
+    
+    # Handle cases where the key is still split across multiple runs
+    search_from = 0
+    for _ in range(paragraph.text.count(key)):
+        runs = paragraph.runs
+        full_text = "".join(run.text for run in runs)
+        start_index = full_text.find(key, search_from)
+        if start_index == -1:
+            break
         end_index = start_index + len(key)
+        search_from = start_index + len(value)
         
         current_pos = 0
         runs_to_modify = []
@@ -445,82 +1542,629 @@ def replace_text_in_paragraph(paragraph, key, value):
             for i in range(1, len(runs_to_modify)):
                 runs_to_modify[i].text = ""
 
-def fill_pdf_with_data(pdf_file, data):
-    """Fill PDF with data - prioritizing form field filling over text replacement"""
-    try:
-        # Reset file pointer
-        if hasattr(pdf_file, 'seek'):
-            pdf_file.seek(0)
-        
-        replacements_made = 0
-        
-        # Method 1: Try form field filling first (this is the proper way for Acrobat forms)
-        try:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            pdf_writer = PyPDF2.PdfWriter()
-            
-            # Handle encryption for form filling
-            if pdf_reader.is_encrypted:
-                try:
-                    # Try empty password first
-                    pdf_reader.decrypt("")
-                except:
-                    # Try with provided password
-                    if 'pdf_password' in st.session_state and st.session_state.pdf_password:
-                        try:
-                            pdf_reader.decrypt(st.session_state.pdf_password)
-                        except:
-                            st.warning("Could not decrypt PDF for form field filling.")
-                            pdf_reader = None
+# --- AI Response Functions ---
+class JsonFieldStream:
+    """(NEW) Incremental reader for the JSON in an AI response, fed text as it arrives.
+
+    feed() returns the (field, value) pairs of top-level JSON objects as soon as each
+    member is complete, so a streamed response can be applied field by field. Prose
+    around the JSON is skipped, and several objects are merged in order (later values
+    win). Text is scanned once, jumping between structural characters, and only the
+    member being read is buffered, so long responses never cause regex backtracking.
+    """
+    TOKENS = re.compile(r'[][{}",\\]')
+
+    def __init__(self):
+        self.fields = {}
+        self.invalid_members = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._member = []
+
+    def feed(self, chunk):
+        completed = []
+        start = 0
+        position = 0
+        if self._escaped and chunk:
+            # The backslash ended the previous chunk; skip the character it escapes
+            self._escaped = False
+            position = 1
+        while (match := self.TOKENS.search(chunk, position)) is not None:
+            char, index = match.group(), match.start()
+            position = index + 1
+            if self._in_string:
+                if char == '\\':
+                    if position < len(chunk):
+                        position += 1
                     else:
-                        pdf_reader = None
-            
-            form_fields_filled = 0
-            all_form_fields = set()
-            
-            if pdf_reader:
-                # First pass: collect all form field names
-                for page in pdf_reader.pages:
-                    if '/Annots' in page:
-                        annotations = page['/Annots']
-                        if annotations:
-                            for annotation_ref in annotations:
-                                try:
-                                    annotation = annotation_ref.get_object()
-                                    if annotation.get('/Subtype') == '/Widget':
-                                        field_name = annotation.get('/T')
-                                        if field_name:
-                                            all_form_fields.add(str(field_name))
-                                except:
-                                    continue
-                
-                st.info(f"Found {len(all_form_fields)} form fields in PDF: {list(all_form_fields)}")
-                
-                # Second pass: fill form fields
-                for page in pdf_reader.pages:
-                    if '/Annots' in page:
-                        annotations = page['/Annots']
-                        if annotations:
-                            for annotation_ref in annotations:
-                                try:
-                                    annotation = annotation_ref.get_object()
-                                    if annotation.get('/Subtype') == '/Widget':
-                                        field_name = annotation.get('/T')
-                                        if field_name:
-                                            field_name_str = str(field_name)
-                                            
-                                            # Check if we have data for this field
-                                            field_filled = False
-                                            for field, value in data.items():
-                                                # Direct match
-                                                if field == field_name_str:
-                                                    annotation.update({
+                        self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif self._depth == 0:
+                # Outside any object only an opening brace matters (prose quotes are ignored)
+                if char == '{':
+                    self._depth = 1
+                    self._member = []
+                    start = position
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    self._member.append(chunk[start:index])
+                    completed.extend(self._finish_member())
+            elif char == ',' and self._depth == 1:
+                self._member.append(chunk[start:index])
+                completed.extend(self._finish_member())
+                start = position
+        if self._depth > 0:
+            self._member.append(chunk[start:])
+        return completed
+
+    def _finish_member(self):
+        text = "".join(self._member).strip()
+        self._member = []
+        if not text:
+            return []
+        try:
+            member = json.loads("{" + text + "}")
+        except ValueError:
+            # Braces in prose (like "{{name}}") aren't JSON members; only count real attempts
+            if text.startswith('"'):
+                self.invalid_members += 1
+            return []
+        self.fields.update(member)
+        return list(member.items())
+
+def extract_json_fields(text):
+    """(NEW) Field values from a complete AI response. Returns (fields, JsonFieldStream)."""
+    stream = JsonFieldStream()
+    stream.feed(text)
+    if not stream.fields:
+        raise json.JSONDecodeError("No JSON object found", text, 0)
+    return stream.fields, stream
+
+def stream_openai_compatible(prompt, settings):
+    """(NEW) Yield the text of a streamed reply from an OpenAI-compatible chat completions endpoint.
+
+    Works with any server speaking that protocol (hosted APIs, vLLM, Ollama, llama.cpp or
+    llm_stub_server.py). The API key, if any, is read from the environment variable
+    named by settings["api_key_env"] so it never lives in the config file.
+    """
+    import urllib.request
+
+    headers = {"Content-Type": "application/json"}
+    api_key = os.environ.get(settings["api_key_env"]) if settings.get("api_key_env") else None
+    if api_key:
+        headers["Authorization"] = f"Bearer {api_key}"
+    body = json.dumps({
+        "model": settings.get("model", ""),
+        "stream": True,
+        "messages": [{"role": "user", "content": prompt}]
+    }).encode('utf-8')
+    request = urllib.request.Request(settings["url"], data=body, headers=headers)
+    with urllib.request.urlopen(request, timeout=settings.get("timeout", LLM_REQUEST_TIMEOUT_SECONDS)) as response:
+        # Server-sent events: one "data: {...}" line per chunk, then "data: [DONE]"
+        for line in response:
+            line = line.decode('utf-8').strip()
+            if not line.startswith("data:"):
+                continue
+            payload = line[len("data:"):].strip()
+            if payload == "[DONE]":
+                break
+            choices = json.loads(payload).get("choices") or []
+            if choices:
+                text = (choices[0].get("delta") or {}).get("content")
+                if text:
+                    yield text
+
+# Backend "type" in prompt_config.json -> generator of reply text chunks for (prompt, settings)
+LLM_BACKENDS = {
+    "openai_compatible": stream_openai_compatible,
+}
+
+def get_llm_backend():
+    """(NEW) The configured "llm_backend" settings, or None when no usable backend is set up."""
+    settings = PROMPT_CONFIG.get("llm_backend")
+    if not settings or settings.get("type") not in LLM_BACKENDS or not settings.get("url"):
+        return None
+    return settings
+
+def stream_llm_response(prompt, settings):
+    """(NEW) Stream the configured backend's reply to prompt as text chunks."""
+    return LLM_BACKENDS[settings["type"]](prompt, settings)
+
+# --- Template Normalization Functions ---
+def read_template_bytes(source_file):
+    """(NEW) Return the raw bytes of a bundled template path or an uploaded file."""
+    if hasattr(source_file, 'getvalue'):
+        return source_file.getvalue()
+    if hasattr(source_file, 'read'):
+        source_file.seek(0)
+        return source_file.read()
+    with open(source_file, 'rb') as f:
+        return f.read()
+
+def normalize_template_runs(template_file, file_extension, split_parts=None):
+    """(NEW) One-time pass that repairs {{placeholders}} split across runs.
+
+    Word and PowerPoint split text into separate runs for spell-check marks, revision
+    ids and language tags, so "{{name}}" often ends up as "{{", "name", "}}". This merges
+    adjacent runs with identical formatting and moves any placeholder that still spans
+    runs into the run where it starts. Fills can then use simple single-run replacement.
+    Only the parts in split_parts (as found by scan_ooxml_fields_streaming) are parsed
+    into a tree and rewritten; without it, each part is first streamed to check for a
+    split placeholder. Every other entry is streamed across unchanged.
+    Takes a template file object. Returns (normalized_bytes, splits_repaired).
+    """
+    from lxml import etree
+
+    if file_extension == 'docx':
+        part_pattern = NORMALIZED_DOCX_PARTS
+        tags = DOCX_RUN_TAGS
+    elif file_extension == 'pptx':
+        part_pattern = NORMALIZED_PPTX_PARTS
+        tags = PPTX_RUN_TAGS
+    else:
+        return read_template_bytes(template_file), 0
+
+    source_zip = zipfile.ZipFile(template_file)
+    if split_parts is None:
+        split_parts = {name for name in source_zip.namelist()
+                       if re.fullmatch(part_pattern, name) and _has_split_placeholder(source_zip, name, tags)}
+    splits_repaired = 0
+    output_buffer = io.BytesIO()
+    with zipfile.ZipFile(output_buffer, 'w') as output_zip:
+        for entry in source_zip.infolist():
+            if entry.filename not in split_parts:
+                with source_zip.open(entry) as source, output_zip.open(entry, 'w') as target:
+                    shutil.copyfileobj(source, target)
+                continue
+            root = etree.fromstring(source_zip.read(entry.filename))
+            for paragraph in root.iter(tags['p']):
+                splits_repaired += _normalize_paragraph_runs(paragraph, tags)
+            output_zip.writestr(entry, etree.tostring(root, xml_declaration=True, encoding='UTF-8', standalone=True))
+
+    return output_buffer.getvalue(), splits_repaired
+
+def _has_split_text(texts):
+    """True if the joined text elements hold more {{placeholders}} than the elements do one by one."""
+    whole_count = len(re.findall(r'\{\{[^{}]*\}\}', ''.join(texts)))
+    return whole_count > sum(len(re.findall(r'\{\{[^{}]*\}\}', text)) for text in texts)
+
+def _has_split_placeholder(package, part_name, tags):
+    """Stream a part's paragraphs and report whether any {{placeholder}} spans text elements."""
+    from lxml import etree
+
+    with package.open(part_name) as part_stream:
+        for _, paragraph in etree.iterparse(part_stream, events=('end',), tag=tags['p']):
+            if _has_split_text([t.text for t in paragraph.iter(tags['t']) if t.text]):
+                return True
+            # Drop the paragraph and anything before it that has already been scanned
+            paragraph.clear()
+            while paragraph.getprevious() is not None:
+                del paragraph.getparent()[0]
+    return False
+
+def _is_simple_text_run(run, tags):
+    """True for runs holding only formatting and a single text element."""
+    children = list(run)
+    text_elements = [child for child in children if child.tag == tags['t']]
+    return len(text_elements) == 1 and all(child.tag in (tags['rPr'], tags['t']) for child in children)
+
+def _run_format_key(run, tags):
+    """Serialize a run's formatting, ignoring proofing/language markup that doesn't change appearance."""
+    from lxml import etree
+
+    properties = run.find(tags['rPr'])
+    if properties is None:
+        return b''
+    properties = copy.deepcopy(properties)
+    for attribute in tags['ignored_attributes']:
+        properties.attrib.pop(attribute, None)
+    for child in list(properties):
+        if child.tag in tags['ignored_children']:
+            properties.remove(child)
+    return etree.tostring(properties)
+
+def _set_run_text(run, text, tags):
+    text_element = run.find(tags['t'])
+    text_element.text = text
+    if tags['preserve_space']:
+        text_element.set('{http://www.w3.org/XML/1998/namespace}space', 'preserve')
+
+def _normalize_paragraph_runs(paragraph, tags):
+    """Merge and coalesce the text runs of one paragraph. Returns placeholders repaired."""
+    # Spell/grammar check markers carry no content but break runs apart
+    if tags['proofErr']:
+        for marker in paragraph.findall(tags['proofErr']):
+            paragraph.remove(marker)
+
+    # Runs can sit directly in the paragraph or inside hyperlinks/revision wrappers;
+    # only take runs whose nearest paragraph is this one (not text boxes inside it)
+    containers = []
+    for run in paragraph.iter(tags['r']):
+        ancestor = run.getparent()
+        while ancestor is not None and ancestor.tag != tags['p']:
+            ancestor = ancestor.getparent()
+        if ancestor is paragraph and run.getparent() not in containers:
+            containers.append(run.getparent())
+
+    repaired = 0
+    for container in containers:
+        sequence = []
+        for child in list(container) + [None]:
+            if child is not None and child.tag == tags['r'] and _is_simple_text_run(child, tags):
+                sequence.append(child)
+                continue
+            if len(sequence) > 1:
+                repaired += _normalize_run_sequence(sequence, tags)
+            sequence = []
+    return repaired
+
+def _normalize_run_sequence(runs, tags):
+    """Normalize consecutive simple text runs in place. Returns placeholders repaired."""
+    texts = [run.find(tags['t']).text or '' for run in runs]
+    full_text = ''.join(texts)
+
+    # Which run owns each character; placeholders are given entirely to their first run
+    owners = [index for index, text in enumerate(texts) for _ in text]
+    repaired = 0
+    for match in re.finditer(r'\{\{[^{}]*\}\}', full_text):
+        start_owner = owners[match.start()]
+        if owners[match.end() - 1] != start_owner:
+            repaired += 1
+            for position in range(match.start(), match.end()):
+                owners[position] = start_owner
+
+    new_texts = [''] * len(runs)
+    for character, owner in zip(full_text, owners):
+        new_texts[owner] += character
+
+    # Merge neighbours with identical formatting, and drop runs emptied by coalescing
+    kept_run = None
+    kept_key = None
+    for index, run in enumerate(runs):
+        if texts[index] and not new_texts[index]:
+            run.getparent().remove(run)
+            continue
+        format_key = _run_format_key(run, tags)
+        if kept_run is not None and format_key == kept_key:
+            new_texts[kept_run] += new_texts[index]
+            run.getparent().remove(run)
+            continue
+        kept_run, kept_key = index, format_key
+
+    for index, run in enumerate(runs):
+        if run.getparent() is not None and new_texts[index] != texts[index]:
+            _set_run_text(run, new_texts[index], tags)
+    return repaired
+
+# --- Image Placeholder Functions ---
+def split_image_fields(fields):
+    """(NEW) Separate {{image:name}} placeholders from regular text fields."""
+    text_fields = []
+    image_fields = []
+    for field in fields:
+        if field.startswith(IMAGE_FIELD_PREFIX):
+            image_fields.append(field[len(IMAGE_FIELD_PREFIX):].strip())
+        else:
+            text_fields.append(field)
+    return text_fields, sorted(set(image_fields))
+
+def emu_to_pixels(emu, dpi):
+    """Convert an EMU length to a pixel count at the given DPI."""
+    return max(1, int(round(emu / EMU_PER_INCH * dpi)))
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def prepare_image(image_bytes, max_width_px, max_height_px):
+    """(NEW) Downscale an image to fit the target box and re-encode it compactly.
+
+    Results are cached by image content and target size, so the same logo used in
+    many places (or across a batch) is only resized and encoded once. Because the
+    returned bytes are identical, python-pptx/python-docx also store it only once
+    per package (both dedupe image parts by hash).
+    Returns (image_bytes, (width_px, height_px)).
+    """
+    source = Image.open(io.BytesIO(image_bytes))
+    source_format = source.format
+    image = ImageOps.exif_transpose(source)
+    original_size = image.size
+
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    # Never upscale - only shrink to the target extent
+    image.thumbnail((max_width_px, max_height_px), Image.LANCZOS)
+    resized = image.size != original_size
+
+    output = io.BytesIO()
+    if has_alpha or (source_format in ("PNG", "GIF", "BMP") and image.mode in ("P", "L", "1")):
+        # Keep lossless encoding for transparency and flat graphics (logos, icons)
+        if image.mode not in ("RGBA", "LA", "P", "L", "1"):
+            image = image.convert("RGBA")
+        image.save(output, format="PNG", optimize=True)
+    else:
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        image.save(output, format="JPEG", quality=85, optimize=True, progressive=True)
+
+    encoded = output.getvalue()
+    # Keep the original file if re-encoding didn't help and no resize was needed
+    if not resized and source_format in ("PNG", "JPEG") and len(image_bytes) <= len(encoded):
+        return image_bytes, image.size
+    return encoded, image.size
+
+def fit_image_in_box(image_size, box_width, box_height):
+    """Return (width, height) that fits image_size inside the box, keeping aspect ratio."""
+    image_width, image_height = image_size
+    scale = min(box_width / image_width, box_height / image_height)
+    return int(image_width * scale), int(image_height * scale)
+
+def fill_powerpoint_images(prs, uploaded_images, image_dpi=DEFAULT_IMAGE_DPI):
+    """(NEW) Replace {{image:name}} text shapes with pictures sized to the shape."""
+    # First pass: find target shapes so each image is prepared once at its largest extent
+    targets = []
+    for slide in prs.slides:
+        if not has_placeholder_text(slide._element):
+            continue
+        for shape in iter_placeholder_shapes(slide.shapes):
+            if hasattr(shape, "text_frame") and shape.text_frame and shape.width and shape.height:
+                for name in re.findall(IMAGE_FIELD_PATTERN, shape.text_frame.text):
+                    if name.strip() in uploaded_images:
+                        targets.append((slide, shape, name))
+
+    extents = {}
+    for _, shape, name in targets:
+        width, height = extents.get(name.strip(), (0, 0))
+        extents[name.strip()] = (max(width, shape.width), max(height, shape.height))
+
+    prepared = {
+        name: prepare_image(uploaded_images[name], emu_to_pixels(width, image_dpi), emu_to_pixels(height, image_dpi))
+        for name, (width, height) in extents.items()
+    }
+
+    images_placed = 0
+    for slide, shape, name in targets:
+        image_bytes, image_size = prepared[name.strip()]
+        width, height = fit_image_in_box(image_size, shape.width, shape.height)
+        left = shape.left + (shape.width - width) // 2
+        top = shape.top + (shape.height - height) // 2
+        picture = slide.shapes.add_picture(io.BytesIO(image_bytes), left, top, width, height)
+        # Keep the picture at the placeholder's position in the z-order
+        shape._element.addprevious(picture._element)
+
+        placeholder = f"{{{{{IMAGE_FIELD_PREFIX}{name}}}}}"
+        for paragraph in shape.text_frame.paragraphs:
+            replace_text_in_paragraph(paragraph, placeholder, "")
+        if not shape.text_frame.text.strip():
+            shape._element.getparent().remove(shape._element)
+        images_placed += 1
+
+    return images_placed
+
+def fill_word_images(doc, uploaded_images, image_dpi=DEFAULT_IMAGE_DPI):
+    """(NEW) Insert downscaled pictures in place of {{image:name}} runs in a Word document."""
+    if not doc.sections:
+        return 0
+    section = doc.sections[0]
+    max_width = section.page_width - section.left_margin - section.right_margin
+    max_height = section.page_height - section.top_margin - section.bottom_margin
+
+    # Collect paragraphs together with the width available to them
+    paragraphs = [(paragraph, max_width) for paragraph in doc.paragraphs]
+    for table in doc.tables:
+        for _, _, cell, cell_paragraphs in iter_table_cells(table._tbl, WORD_NAMESPACE):
+            cell_width = _Cell(cell, table).width or max_width
+            paragraphs.extend((Paragraph(paragraph, table), min(cell_width, max_width)) for paragraph in cell_paragraphs)
+    for part, element in word_story_parts(doc, (RT.HEADER, RT.FOOTER)):
+        paragraphs.extend((Paragraph(paragraph, part), max_width) for paragraph in element.iter(f'{{{WORD_NAMESPACE}}}p'))
+
+    # First pass: find target runs so each image is prepared once at the largest box it fills
+    targets = []
+    for paragraph, available_width in paragraphs:
+        if IMAGE_FIELD_PREFIX not in paragraph.text:
+            continue
+        for run in paragraph.runs:
+            for name in re.findall(IMAGE_FIELD_PATTERN, run.text):
+                if name.strip() in uploaded_images:
+                    targets.append((run, name, available_width))
+
+    extents = {}
+    for _, name, available_width in targets:
+        width, height = extents.get(name.strip(), (0, 0))
+        extents[name.strip()] = (max(width, available_width), max(height, max_height))
+
+    prepared = {
+        name: prepare_image(uploaded_images[name], emu_to_pixels(width, image_dpi), emu_to_pixels(height, image_dpi))
+        for name, (width, height) in extents.items()
+    }
+
+    images_placed = 0
+    for run, name, available_width in targets:
+        image_bytes, image_size = prepared[name.strip()]
+        width, height = fit_image_in_box(image_size, available_width, max_height)
+        run.text = run.text.replace(f"{{{{{IMAGE_FIELD_PREFIX}{name}}}}}", "", 1)
+        run.add_picture(io.BytesIO(image_bytes), width=width, height=height)
+        images_placed += 1
+
+    return images_placed
+
+def stamp_images_in_pdf(pdf_bytes, uploaded_images, image_dpi=DEFAULT_IMAGE_DPI):
+    """(NEW) Stamp uploaded images over {{image:name}} text or widgets named image:name.
+
+    Each image is embedded once and every further placement reuses the same
+    image object (xref). Returns (pdf_bytes, images_placed).
+    """
+    pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+    if pdf_document.needs_pass:
+        if not st.session_state.get('pdf_password') or not pdf_document.authenticate(st.session_state.pdf_password):
+            pdf_document.close()
+            return pdf_bytes, 0
+
+    # Collect stamp areas per page
+    targets = []
+    for page in pdf_document:
+        page_targets = []
+        for name in uploaded_images:
+            placeholder = f"{{{{{IMAGE_FIELD_PREFIX}{name}}}}}"
+            for rect in page.search_for(placeholder):
+                page_targets.append((name, rect, True))
+        for widget in page.widgets() or []:
+            widget_name = (widget.field_name or "").strip("{} ")
+            if widget_name.startswith(IMAGE_FIELD_PREFIX) and widget_name[len(IMAGE_FIELD_PREFIX):] in uploaded_images:
+                page_targets.append((widget_name[len(IMAGE_FIELD_PREFIX):], widget.rect, False))
+        if page_targets:
+            targets.append((page, page_targets))
+
+    extents = {}
+    for _, page_targets in targets:
+        for name, rect, _ in page_targets:
+            width, height = extents.get(name, (0, 0))
+            extents[name] = (max(width, rect.width), max(height, rect.height))
+
+    image_xrefs = {}
+    images_placed = 0
+    for page, page_targets in targets:
+        # Remove placeholder text underneath the stamp areas
+        for name, rect, is_text in page_targets:
+            if is_text:
+                page.add_redact_annot(rect)
+        page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE, graphics=fitz.PDF_REDACT_LINE_ART_NONE)
+
+        for name, rect, _ in page_targets:
+            if name in image_xrefs:
+                page.insert_image(rect, xref=image_xrefs[name], keep_proportion=True)
+            else:
+                width, height = extents[name]
+                image_bytes, _ = prepare_image(
+                    uploaded_images[name],
+                    max(1, int(width / PDF_POINTS_PER_INCH * image_dpi)),
+                    max(1, int(height / PDF_POINTS_PER_INCH * image_dpi))
+                )
+                image_xrefs[name] = page.insert_image(rect, stream=image_bytes, keep_proportion=True)
+            images_placed += 1
+
+    output_buffer = io.BytesIO()
+    pdf_document.save(output_buffer)
+    pdf_document.close()
+    return output_buffer.getvalue(), images_placed
+
+def remove_pdf_placeholder_text(pdf_document):
+    """(NEW) Remove leftover {{field}} text from a PDF using redactions.
+
+    Redaction deletes the text from the page content instead of painting a white box
+    over it, so the placeholder is gone from the file (and from copy/paste and search).
+    {{image:name}} placeholders are left for stamp_images_in_pdf.
+    """
+    text_removed = 0
+    for page in pdf_document:
+        placeholders = set(re.findall(r'\{\{[^}]+\}\}', page.get_text()))
+        page_rects = []
+        for placeholder in placeholders:
+            if placeholder.startswith("{{" + IMAGE_FIELD_PREFIX):
+                continue
+            page_rects.extend(page.search_for(placeholder))
+        if not page_rects:
+            continue
+        for rect in page_rects:
+            page.add_redact_annot(rect)
+        # One redaction pass per page; leave images and line art untouched
+        page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE, graphics=fitz.PDF_REDACT_LINE_ART_NONE)
+        text_removed += len(page_rects)
+    return text_removed
+
+def restore_pdf_structure(merged_document, source_document):
+    """(NEW) Copy document-level structure onto a page-for-page rebuild of source_document.
+
+    Merging filled page ranges into a new PDF keeps only the pages: the outline,
+    metadata and page labels are lost, and so is every link to a page in another range.
+    """
+    merged_document.set_metadata(source_document.metadata)
+    merged_document.set_toc(source_document.get_toc(simple=False))
+    page_labels = source_document.get_page_labels()
+    if page_labels:
+        merged_document.set_page_labels(page_labels)
+    for source_page, merged_page in zip(source_document, merged_document):
+        for link in merged_page.get_links():
+            merged_page.delete_link(link)
+        for link in source_page.get_links():
+            merged_page.insert_link(link)
+
+def fill_pdf_with_data(pdf_file, data, report=None):
+    """Fill PDF with data - prioritizing form field filling over text replacement.
+    Per-field results, warnings and errors go to report (a FillReport) rather than the page.
+    """
+    if report is None:
+        report = FillReport()
+    try:
+        # Reset file pointer
+        if hasattr(pdf_file, 'seek'):
+            pdf_file.seek(0)
+        
+        replacements_made = 0
+        
+        # Protected PDFs are read from the copy decrypted once at analysis (a no-op for plain PDFs)
+        store = get_template_store()
+        pdf_path, _ = decrypt_pdf_template(store.add(pdf_file, 'pdf'), st.session_state.get('pdf_password'))
+        if pdf_path is None:
+            report.error("Cannot fill encrypted PDF without the correct password")
+            return None, 0
+        
+        # Method 1: Try form field filling first (this is the proper way for Acrobat forms)
+        try:
+            pdf_reader = PyPDF2.PdfReader(store.open(pdf_path))
+            pdf_writer = PyPDF2.PdfWriter()
+            
+            form_fields_filled = 0
+            all_form_fields = set()
+            used_fields = set()
+            
+            if pdf_reader:
+                # First pass: collect all form field names
+                for page in pdf_reader.pages:
+                    if '/Annots' in page:
+                        annotations = page['/Annots']
+                        if annotations:
+                            for annotation_ref in annotations:
+                                try:
+                                    annotation = annotation_ref.get_object()
+                                    if annotation.get('/Subtype') == '/Widget':
+                                        field_name = annotation.get('/T')
+                                        if field_name:
+                                            all_form_fields.add(str(field_name))
+                                except:
+                                    continue
+                
+                report.count('form_fields', len(all_form_fields))
+                
+                # Second pass: fill form fields
+                for page in pdf_reader.pages:
+                    if '/Annots' in page:
+                        annotations = page['/Annots']
+                        if annotations:
+                            for annotation_ref in annotations:
+                                try:
+                                    annotation = annotation_ref.get_object()
+                                    if annotation.get('/Subtype') == '/Widget':
+                                        field_name = annotation.get('/T')
+                                        if field_name:
+                                            field_name_str = str(field_name)
+                                            
+                                            # Check if we have data for this field
+                                            field_filled = False
+                                            for field, value in data.items():
+                                                # Direct match
+                                                if field == field_name_str:
+                                                    annotation.update({
                                                         PyPDF2.generic.NameObject('/V'): 
                                                         PyPDF2.generic.TextStringObject(str(value))
                                                     })
                                                     form_fields_filled += 1
                                                     field_filled = True
-                                                    st.success(f"✅ Filled form field '{field_name_str}' with '{value}'")
+                                                    used_fields.add(field)
+                                                    report.add('filled', field_name_str, str(value))
                                                     break
                                                 
                                                 # Pattern match {{field_name}}
@@ -532,14 +2176,15 @@ def fill_pdf_with_data(pdf_file, data):
                                                     })
                                                     form_fields_filled += 1
                                                     field_filled = True
-                                                    st.success(f"✅ Filled form field '{field_name_str}' with '{value}' (pattern match)")
+                                                    used_fields.add(field)
+                                                    report.add('filled', field_name_str, f"{value} (pattern match)")
                                                     break
                                             
                                             if not field_filled:
-                                                st.info(f"ℹ️ Form field '{field_name_str}' - no matching data found")
+                                                report.add('unmatched', field_name_str, "No matching data found")
                                                 
                                 except Exception as form_error:
-                                    st.warning(f"Could not process form field: {form_error}")
+                                    report.warn(f"Could not process form field: {form_error}")
                                     continue
                     
                     pdf_writer.add_page(page)
@@ -553,197 +2198,230 @@ def fill_pdf_with_data(pdf_file, data):
                     # Now process with PyMuPDF to remove placeholder text
                     pdf_document = fitz.open(stream=form_output.getvalue(), filetype="pdf")
                     
-                    # Handle password-protected PDFs for text removal
-                    if pdf_document.needs_pass:
-                        if 'pdf_password' in st.session_state and st.session_state.pdf_password:
-                            if not pdf_document.authenticate(st.session_state.pdf_password):
-                                st.warning("Could not authenticate PDF for placeholder text removal")
-                            else:
-                                # Remove placeholder text that might still be visible
-                                text_removed = 0
-                                field_pattern = r'\{\{([^}]+)\}\}'
-                                
-                                for page_num in range(len(pdf_document)):
-                                    page = pdf_document.load_page(page_num)
-                                    text_instances = page.get_text("dict")
-                                    
-                                    for block in text_instances["blocks"]:
-                                        if "lines" in block:
-                                            for line in block["lines"]:
-                                                for span in line["spans"]:
-                                                    text = span.get("text", "")
-                                                    
-                                                    # Check if this text contains placeholder patterns
-                                                    if re.search(field_pattern, text):
-                                                        try:
-                                                            # Remove the placeholder text by covering with white
-                                                            rect = fitz.Rect(span["bbox"])
-                                                            page.draw_rect(rect, color=(1, 1, 1), fill=(1, 1, 1))
-                                                            text_removed += 1
-                                                        except Exception as remove_error:
-                                                            st.warning(f"Could not remove placeholder text: {remove_error}")
-                                
-                                if text_removed > 0:
-                                    st.info(f"Removed {text_removed} placeholder text instances")
+                    # Remove placeholder text that might still be visible
+                    report.count('placeholders_removed', remove_pdf_placeholder_text(pdf_document))
                     
                     # Save the final result
                     final_output = io.BytesIO()
                     pdf_document.save(final_output)
                     pdf_document.close()
                     
+                    for field in data:
+                        if field not in used_fields:
+                            report.add('skipped', field, "No form field uses this value")
                     replacements_made = form_fields_filled
-                    st.success(f"✅ Successfully filled {form_fields_filled} form fields and cleaned up placeholders!")
                     return final_output.getvalue(), replacements_made
-                else:
-                    st.warning("⚠️ No form fields matched your data. Will try text-based replacement as fallback.")
+                elif all_form_fields:
+                    report.warn("No form fields matched your data. Tried text-based replacement as fallback.")
         
         except Exception as e:
-            st.warning(f"Form field filling failed: {e}. Trying text replacement fallback.")
+            report.warn(f"Form field filling failed: {e}. Tried text replacement fallback.")
         
         # Method 2: Fallback to text replacement (only if form filling failed)
         try:
-            if hasattr(pdf_file, 'seek'):
-                pdf_file.seek(0)
+            pdf_document = fitz.open(pdf_path, filetype="pdf")
             
-            pdf_bytes = pdf_file.read()
-            pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
-            
-            # Handle password-protected PDFs
-            if pdf_document.needs_pass:
-                if 'pdf_password' in st.session_state and st.session_state.pdf_password:
-                    if not pdf_document.authenticate(st.session_state.pdf_password):
-                        st.error("Cannot fill PDF: Authentication failed")
-                        pdf_document.close()
-                        return None, 0
-                else:
-                    st.error("Cannot fill encrypted PDF without password")
-                    pdf_document.close()
-                    return None, 0
-            
-            field_pattern = r'\{\{([^}]+)\}\}'
             text_replacements = 0
             
-            # Only do text replacement if no form fields were found
-            for page_num in range(len(pdf_document)):
-                page = pdf_document.load_page(page_num)
-                
-                # Get all text instances with their positions
-                text_instances = page.get_text("dict")
-                
-                # Look for field patterns in text
-                text_found = False
-                for block in text_instances["blocks"]:
-                    if "lines" in block:
-                        for line in block["lines"]:
-                            for span in line["spans"]:
-                                text = span.get("text", "")
-                                for field, value in data.items():
-                                    placeholder = f"{{{{{field}}}}}"
-                                    if placeholder in text:
-                                        text_found = True
-                                        break
-                
-                if text_found:
-                    st.info(f"Found {{field}} patterns in text on page {page_num + 1}. Using text replacement.")
+            if use_parallel_pdf(len(pdf_document)):
+                # Very large documents: rewrite page ranges in worker processes, then merge in page order
+                merged_document = fitz.open()
+                for part_bytes, part_replacements, part_errors in run_pdf_page_ranges(
+                        pdf_workers.fill_page_range, pdf_path, len(pdf_document), data, None):
+                    with fitz.open(stream=part_bytes, filetype="pdf") as part_document:
+                        merged_document.insert_pdf(part_document)
+                    text_replacements += part_replacements
+                    for error in part_errors:
+                        report.warn(error)
+                restore_pdf_structure(merged_document, pdf_document)
+                pdf_document.close()
+                pdf_document = merged_document
+            else:
+                # Only do text replacement if no form fields were found
+                for page_num in range(len(pdf_document)):
+                    page = pdf_document.load_page(page_num)
+                    try:
+                        page_replacements = rewrite_pdf_page_text(page, data)
+                    except Exception as text_error:
+                        report.warn(f"Could not replace text: {text_error}", f"page {page_num + 1}")
+                        continue
                     
-                    # Process text replacements with careful positioning
-                    for block in text_instances["blocks"]:
-                        if "lines" in block:
-                            for line in block["lines"]:
-                                for span in line["spans"]:
-                                    text = span.get("text", "")
-                                    original_text = text
-                                    modified_text = text
-                                    
-                                    for field, value in data.items():
-                                        placeholder = f"{{{{{field}}}}}"
-                                        if placeholder in modified_text:
-                                            modified_text = modified_text.replace(placeholder, str(value))
-                                    
-                                    if modified_text != original_text:
-                                        try:
-                                            rect = fitz.Rect(span["bbox"])
-                                            font_size = span.get("size", 12)
-                                            
-                                            # Remove original text first
-                                            page.draw_rect(rect, color=(1, 1, 1), fill=(1, 1, 1))
-                                            
-                                            # Add replacement text
-                                            page.insert_text(
-                                                rect.top_left,
-                                                modified_text,
-                                                fontsize=font_size,
-                                                color=(0, 0, 0),
-                                                fontname="helv"  # Use safe font
-                                            )
-                                            text_replacements += 1
-                                            
-                                        except Exception as text_error:
-                                            st.warning(f"Could not replace text: {text_error}")
+                    if page_replacements:
+                        report.count('pages_rewritten')
+                        text_replacements += page_replacements
+                
+                if text_replacements > 0:
+                    # TextWriter embeds full font programs; keep only the glyphs actually used
+                    pdf_document.subset_fonts()
             
             if text_replacements > 0:
                 output_buffer = io.BytesIO()
                 pdf_document.save(output_buffer)
                 pdf_document.close()
-                st.success(f"✅ Made {text_replacements} text replacements (fallback method)")
+                report.count('text_replacements', text_replacements)
                 return output_buffer.getvalue(), text_replacements
             else:
                 pdf_document.close()
-                st.warning("⚠️ No field patterns found in PDF text or form fields.")
+                report.warn("No field patterns found in PDF text or form fields.")
                 
         except Exception as e:
-            st.error(f"Text replacement also failed: {str(e)}")
+            report.error(f"Text replacement also failed: {str(e)}")
         
         return None, 0
         
     except Exception as e:
-        st.error(f"Error filling PDF: {str(e)}")
+        report.error(f"Error filling PDF: {str(e)}")
         return None, 0
 
-def fill_powerpoint_with_data(prs, json_data, uploaded_image, progress_container):
-    """(CORRECTED) Fill PowerPoint with data preserving formatting."""
-    replacements_made = 0
-    # Image replacement functionality temporarily disabled
-    # if uploaded_image:
-    #     # Placeholder for image replacement logic
-    #     pass
+def has_placeholder_text(element):
+    """(NEW) Cheap check for "{{" anywhere in an element's text, before building any shape objects.
 
-    for slide in prs.slides:
-        for shape in slide.shapes:
+    XPath string() joins the text in C; itertext() would go through the python-pptx/docx
+    element classes and cost more than the fill it is meant to skip.
+    """
+    return element.xpath('contains(string(.), "{{")')
+
+def iter_placeholder_shapes(shapes):
+    """(NEW) Yield the shapes whose text contains "{{", descending into group shapes."""
+    for shape in shapes:
+        if not has_placeholder_text(shape._element):
+            continue
+        if shape.shape_type == MSO_SHAPE_TYPE.GROUP:
+            yield from iter_placeholder_shapes(shape.shapes)
+        else:
+            yield shape
+
+def fill_text_paragraph(paragraph, placeholder_values, filled=None):
+    """(NEW) Replace only the placeholders a paragraph actually contains. Returns the count.
+    If filled (a Counter) is given, it is incremented per placeholder replaced."""
+    text = paragraph.text
+    replacements = 0
+    for placeholder in set(re.findall(r'\{\{[^}]+\}\}', text)):
+        if placeholder in placeholder_values:
+            replace_text_in_paragraph(paragraph, placeholder, placeholder_values[placeholder])
+            replacements += text.count(placeholder)
+            if filled is not None:
+                filled[placeholder] += text.count(placeholder)
+    return replacements
+
+def replace_placeholders_in_text(text, data, filled=None):
+    """(NEW) Replace every {{field}} in a plain string, counting replacements per placeholder in filled."""
+    for field, value in data.items():
+        placeholder = f"{{{{{field}}}}}"
+        if placeholder in text:
+            if filled is not None:
+                filled[placeholder] += text.count(placeholder)
+            text = text.replace(placeholder, str(value))
+    return text
+
+def fill_powerpoint_slides(slides, json_data, filled=None):
+    """(NEW) Replace text placeholders on the given slides. Returns the replacement count.
+
+    Slides without "{{" in their XML text are skipped before any shape objects are
+    built, so a fill costs about as much as the slides that hold placeholders.
+    """
+    placeholder_values = {f"{{{{{field}}}}}": str(value) for field, value in json_data.items()}
+    replacements_made = 0
+    for slide in slides:
+        if not has_placeholder_text(slide._element):
+            continue
+        for shape in iter_placeholder_shapes(slide.shapes):
             if hasattr(shape, "text_frame") and shape.text_frame:
                 for paragraph in shape.text_frame.paragraphs:
-                    for field, value in json_data.items():
-                        placeholder = f"{{{{{field}}}}}"
-                        replace_text_in_paragraph(paragraph, placeholder, str(value))
-                        replacements_made += 1 # Count attempt
+                    replacements_made += fill_text_paragraph(paragraph, placeholder_values, filled)
             elif shape.has_table:
-                for row in shape.table.rows:
-                    for cell in row.cells:
-                        for paragraph in cell.text_frame.paragraphs:
-                            for field, value in json_data.items():
-                                placeholder = f"{{{{{field}}}}}"
-                                replace_text_in_paragraph(paragraph, placeholder, str(value))
-                                replacements_made += 1 # Count attempt
-    return prs, replacements_made
+                for _, _, _, paragraphs in iter_table_cells(shape.table._tbl, DRAWING_NAMESPACE):
+                    for paragraph in (_Paragraph(paragraph, shape) for paragraph in paragraphs):
+                        replacements_made += fill_text_paragraph(paragraph, placeholder_values, filled)
+    return replacements_made
+
+def remaining_placeholders(elements, namespace):
+    """(NEW) Names of the {{placeholders}} still in the given elements' paragraphs after a fill."""
+    names = set()
+    for element in elements:
+        if not has_placeholder_text(element):
+            continue
+        for paragraph in element.iter(f'{{{namespace}}}p'):
+            text = "".join(text_element.text or "" for text_element in paragraph.iter(f'{{{namespace}}}t'))
+            names.update(name.strip() for name in re.findall(r'\{\{([^}]+)\}\}', text))
+    return names
+
+def report_field_outcomes(report, data, filled, remaining):
+    """(NEW) Add one report entry per field, as fill_pdf_with_data does for form fields.
+
+    Fields whose placeholders were replaced are filled, fields the template has no
+    placeholder for are skipped, and placeholders left without a value are unmatched.
+    """
+    for field, value in data.items():
+        if filled[f"{{{{{field}}}}}"]:
+            report.add('filled', field, str(value))
+        else:
+            report.add('skipped', field, "No placeholder uses this value")
+    for name in sorted(remaining - set(data)):
+        report.add('unmatched', name, "No matching data found")
+
+def word_story_parts(doc, reltypes=WORD_STORY_RELTYPES):
+    """(NEW) Each unique header, footer, footnote and endnote part once, as (part, element).
+
+    Taken from the document's relationships rather than doc.sections: sections linked
+    to the previous one share its part (so per-section loops redo the same XML, and
+    python-docx adds an empty definition when a linked header is read), and first-page
+    and even-page headers are included. python-docx loads footnotes and endnotes as
+    plain parts, so those are parsed here; write changes back with
+    save_word_story_parts.
+    """
+    from docx.oxml import parse_xml
+    from docx.opc.part import XmlPart
+
+    parts = {}
+    for rel in doc.part.rels.values():
+        if rel.is_external or rel.reltype not in reltypes or rel.target_part.partname in parts:
+            continue
+        part = rel.target_part
+        parts[part.partname] = (part, part.element if isinstance(part, XmlPart) else parse_xml(part.blob))
+    return list(parts.values())
+
+def save_word_story_parts(story_parts):
+    """(NEW) Write filled footnote/endnote XML back to their plain parts."""
+    from docx.opc.oxml import serialize_part_xml
+    from docx.opc.part import XmlPart
+
+    for part, element in story_parts:
+        if not isinstance(part, XmlPart):
+            part._blob = serialize_part_xml(element)
+
+def fill_word_story_parts(doc, data, filled=None):
+    """(NEW) Fill every unique header, footer, footnote and endnote part exactly once."""
+    story_parts = [(part, element) for part, element in word_story_parts(doc) if has_placeholder_text(element)]
+    for part, element in story_parts:
+        fill_word_elements(part, [element], data, filled)
+    save_word_story_parts(story_parts)
+
+def fill_word_text(doc, data, report=None, filled=None):
+    """(FIXED) Fill an open Word document with data, preserving formatting and handling
+    text boxes, headers, footers, footnotes and endnotes.
+    Problems are added to report (a FillReport); replacements per placeholder are
+    counted in filled (a Counter), if given. Returns the replacement count.
+    """
+    if report is None:
+        report = FillReport()
+    if filled is None:
+        filled = collections.Counter()
+    replacements_before = sum(filled.values())
+    # Each paragraph only tries the placeholders it contains
+    placeholder_values = {f"{{{{{field}}}}}": str(value) for field, value in data.items()}
 
-def fill_word_with_data(doc_file, data):
-    """(FIXED) Fill a Word document with data, preserving formatting and handling text boxes."""
-    doc = docx.Document(doc_file)
-    
     # Fill regular paragraphs
     for paragraph in doc.paragraphs:
-        for field, value in data.items():
-            placeholder = f"{{{{{field}}}}}"
-            replace_text_in_paragraph(paragraph, placeholder, str(value))
+        fill_text_paragraph(paragraph, placeholder_values, filled)
     
-    # Fill tables
+    # Fill tables (each merged cell once, nested tables included)
     for table in doc.tables:
-        for row in table.rows:
-            for cell in row.cells:
-                for paragraph in cell.paragraphs:
-                    for field, value in data.items():
-                        placeholder = f"{{{{{field}}}}}"
-                        replace_text_in_paragraph(paragraph, placeholder, str(value))
+        if not has_placeholder_text(table._tbl):
+            continue
+        for _, _, _, paragraphs in iter_table_cells(table._tbl, WORD_NAMESPACE):
+            for paragraph in (Paragraph(paragraph, table) for paragraph in paragraphs):
+                fill_text_paragraph(paragraph, placeholder_values, filled)
     
     # Fill text boxes (NEW CODE)
     try:
@@ -774,12 +2452,9 @@ def fill_word_with_data(doc_file, data):
                 for t_elem in text_elements:
                     if t_elem.text:
                         original_text = t_elem.text
-                        modified_text = original_text
                         
                         # Replace all placeholders
-                        for field, value in data.items():
-                            placeholder = f"{{{{{field}}}}}"
-                            modified_text = modified_text.replace(placeholder, str(value))
+                        modified_text = replace_placeholders_in_text(original_text, data, filled)
                         
                         # Update the text if it was modified
                         if modified_text != original_text:
@@ -795,12 +2470,7 @@ def fill_word_with_data(doc_file, data):
             for t_elem in all_text_elements:
                 if t_elem.text:
                     original_text = t_elem.text
-                    modified_text = original_text
-                    
-                    for field, value in data.items():
-                        placeholder = f"{{{{{field}}}}}"
-                        if placeholder in modified_text:
-                            modified_text = modified_text.replace(placeholder, str(value))
+                    modified_text = replace_placeholders_in_text(original_text, data, filled)
                     
                     if modified_text != original_text:
                         t_elem.text = modified_text
@@ -809,41 +2479,1145 @@ def fill_word_with_data(doc_file, data):
             pass
     
     except Exception as e:
-        st.warning(f"Advanced text box filling failed: {e}. Basic filling completed.")
+        report.warn(f"Advanced text box filling failed: {e}. Basic filling completed.")
     
-    # Fill headers and footers
+    # Fill headers, footers, footnotes and endnotes (each shared part once)
     try:
-        for section in doc.sections:
-            # Fill headers
-            if section.header:
-                for paragraph in section.header.paragraphs:
-                    for field, value in data.items():
-                        placeholder = f"{{{{{field}}}}}"
-                        replace_text_in_paragraph(paragraph, placeholder, str(value))
-            
-            # Fill footers
-            if section.footer:
-                for paragraph in section.footer.paragraphs:
-                    for field, value in data.items():
-                        placeholder = f"{{{{{field}}}}}"
-                        replace_text_in_paragraph(paragraph, placeholder, str(value))
+        fill_word_story_parts(doc, data, filled)
     
     except Exception as e:
-        st.error(f"Error filling headers/footers: {e}")
-    
+        report.error(f"Error filling headers/footers: {e}")
+
+    return sum(filled.values()) - replacements_before
+
+def remaining_word_placeholders(doc):
+    """(NEW) Placeholder names left anywhere in a Word document: body, headers, footers, notes."""
+    elements = [doc.element.body] + [element for _, element in word_story_parts(doc)]
+    return remaining_placeholders(elements, WORD_NAMESPACE)
+
+
+# --- Combined Output Functions ---
+def duplicate_slide(prs, source_slide):
+    """(NEW) Append a copy of a slide to the presentation.
+
+    The copy uses the same layout (and so the same master and theme) and points at
+    the same image and media parts, so repeated slides add only their own XML.
+    Other related parts, such as charts, are copied so each slide can be edited
+    independently. Speaker notes are not copied.
+    """
+    new_slide = prs.slides.add_slide(source_slide.slide_layout)
+    relationship_ids = {}
+    for rel in source_slide.part.rels.values():
+        if rel.reltype in (RT.SLIDE_LAYOUT, RT.NOTES_SLIDE):
+            continue
+        if rel.is_external:
+            relationship_ids[rel.rId] = new_slide.part.relate_to(rel.target_ref, rel.reltype, is_external=True)
+        elif rel.reltype in SHARED_SLIDE_RELTYPES:
+            relationship_ids[rel.rId] = new_slide.part.relate_to(rel.target_part, rel.reltype)
+        else:
+            relationship_ids[rel.rId] = new_slide.part.relate_to(_copy_part(rel.target_part), rel.reltype)
+
+    # Replace the layout's placeholder shapes with the source slide's content. The
+    # shape tree element itself is kept because python-pptx caches it on the slide.
+    source_element = source_slide._element
+    new_element = new_slide._element
+    shape_tree = new_element.cSld.spTree
+    for child in list(shape_tree):
+        shape_tree.remove(child)
+    for child in source_element.cSld.spTree:
+        shape_tree.append(copy.deepcopy(child))
+
+    # Background goes before the shape tree, extension lists after it
+    before_shape_tree = True
+    for child in source_element.cSld:
+        if child is source_element.cSld.spTree:
+            before_shape_tree = False
+        elif before_shape_tree:
+            shape_tree.addprevious(copy.deepcopy(child))
+        else:
+            new_element.cSld.append(copy.deepcopy(child))
+
+    # Colour map override, transitions and animations
+    for child in list(new_element):
+        if child is not new_element.cSld:
+            new_element.remove(child)
+    for child in source_element:
+        if child is not source_element.cSld:
+            new_element.append(copy.deepcopy(child))
+    _remap_relationship_ids(new_element, relationship_ids)
+    return new_slide
+
+def _copy_part(part):
+    """Copy a package part (and its relationships, shared) under a new part name."""
+    partname_template = re.sub(r'\d*(\.\w+)$', r'%d\1', part.partname)
+    new_part = PartFactory(part.package.next_partname(partname_template), part.content_type, part.package, part.blob)
+    relationship_ids = {}
+    for rel in part.rels.values():
+        if rel.is_external:
+            relationship_ids[rel.rId] = new_part.relate_to(rel.target_ref, rel.reltype, is_external=True)
+        else:
+            relationship_ids[rel.rId] = new_part.relate_to(rel.target_part, rel.reltype)
+    if hasattr(new_part, '_element'):
+        _remap_relationship_ids(new_part._element, relationship_ids)
+    return new_part
+
+def _remap_relationship_ids(element, relationship_ids):
+    """Point r:id/r:embed/r:link style attributes at the copy's relationship IDs."""
+    relationship_prefix = f"{{{RELATIONSHIP_NAMESPACE}}}"
+    for node in element.iter():
+        for attribute, value in node.attrib.items():
+            if attribute.startswith(relationship_prefix) and value in relationship_ids:
+                node.set(attribute, relationship_ids[value])
+
+def fill_powerpoint_records(prs, records, uploaded_images=None, image_dpi=DEFAULT_IMAGE_DPI, report=None):
+    """(NEW) Repeat the template's slides once per record and fill each copy with its record.
+    Each record's field results are added to report under its record number."""
+    if report is None:
+        report = FillReport()
+    template_slides = list(prs.slides)
+    # Copy every set from the untouched template before any of them are filled
+    slide_sets = [template_slides] + [
+        [duplicate_slide(prs, slide) for slide in template_slides] for _ in records[1:]
+    ]
+
+    replacements_made = 0
+    if uploaded_images:
+        report.count('images_placed', fill_powerpoint_images(prs, uploaded_images, image_dpi))
+    for record_number, (slides, record) in enumerate(zip(slide_sets, records), start=1):
+        record_report = FillReport(record=record_number)
+        filled = collections.Counter()
+        replacements_made += fill_powerpoint_slides(slides, record, filled)
+        report_field_outcomes(record_report, record, filled,
+                              remaining_placeholders([slide._element for slide in slides], DRAWING_NAMESPACE))
+        report.merge(record_report)
+    return prs, replacements_made
+
+def fill_word_records(doc_file, records, uploaded_images=None, image_dpi=DEFAULT_IMAGE_DPI, report=None):
+    """(NEW) Repeat the template's body once per record, each copy starting on a new page.
+
+    Copies share styles, numbering and media with the original. Headers and footers
+    are shared by every page, so they are filled from the first record. Each record's
+    field results are added to report under its record number.
+    """
+    if report is None:
+        report = FillReport()
+    from docx.oxml import parse_xml
+    from docx.oxml.ns import nsdecls, qn
+
+    doc = docx.Document(doc_file)
+    body = doc.element.body
+    section_properties = body.find(qn('w:sectPr'))
+    template_elements = [child for child in body if child.tag != qn('w:sectPr')]
+    pristine_elements = [copy.deepcopy(element) for element in template_elements]
+
+    next_drawing_id = _next_drawing_id(doc)
+    body_copies = [template_elements]
+    for _ in records[1:]:
+        page_break = parse_xml(f'<w:p {nsdecls("w")}><w:r><w:br w:type="page"/></w:r></w:p>')
+        elements = [page_break] + [copy.deepcopy(element) for element in pristine_elements]
+        for element in elements:
+            if section_properties is not None:
+                section_properties.addprevious(element)
+            else:
+                body.append(element)
+            # Drawing IDs must stay unique across the document
+            for drawing_properties in element.iter(qn('wp:docPr')):
+                drawing_properties.set('id', str(next_drawing_id))
+                next_drawing_id += 1
+        body_copies.append(elements)
+
+    if uploaded_images:
+        report.count('images_placed', fill_word_images(doc, uploaded_images, image_dpi))
+    fills = []
+    for elements, record in zip(body_copies, records):
+        filled = collections.Counter()
+        fill_word_elements(doc._body, elements, record, filled)
+        fills.append(filled)
+    fill_word_story_parts(doc, records[0], fills[0])
+
+    story_remaining = remaining_placeholders([element for _, element in word_story_parts(doc)], WORD_NAMESPACE)
+    for record_number, (elements, record, filled) in enumerate(zip(body_copies, records, fills), start=1):
+        record_report = FillReport(record=record_number)
+        remaining = remaining_placeholders(elements, WORD_NAMESPACE)
+        report_field_outcomes(record_report, record, filled, remaining | story_remaining if record_number == 1 else remaining)
+        report.merge(record_report)
+        report.count('replacements', sum(filled.values()))
     return doc
 
+def _next_drawing_id(doc):
+    from docx.oxml.ns import qn
+    drawing_ids = [0]
+    for part in doc.part.package.iter_parts():
+        element = getattr(part, 'element', None)
+        if element is not None:
+            drawing_ids.extend(int(drawing_properties.get('id')) for drawing_properties in element.iter(qn('wp:docPr'))
+                               if drawing_properties.get('id', '').isdigit())
+    return max(drawing_ids) + 1
+
+def fill_word_elements(parent, elements, data, filled=None):
+    """(NEW) Replace text placeholders in every paragraph (including tables and text
+    boxes) inside the given elements only."""
+    from docx.oxml.ns import qn
+
+    placeholder_values = {f"{{{{{field}}}}}": str(value) for field, value in data.items()}
+    for element in elements:
+        if not has_placeholder_text(element):
+            continue
+        for paragraph_element in element.iter(qn('w:p')):
+            fill_text_paragraph(Paragraph(paragraph_element, parent), placeholder_values, filled)
+        # Same fallback as fill_word_text for text outside ordinary runs
+        for text_element in element.iter(qn('w:t')):
+            if text_element.text and '{{' in text_element.text:
+                text_element.text = replace_placeholders_in_text(text_element.text, data, filled)
+
+def fill_pdf_records(pdf_file, records, uploaded_images=None, image_dpi=DEFAULT_IMAGE_DPI, report=None):
+    """(NEW) One PDF with the template's pages filled once per record. Returns bytes or None.
+
+    Each copy's form fields are flattened first, since same-named fields in one PDF
+    share a single value. Identical fonts and images across copies are merged on save.
+    Each record's results are added to report under its record number.
+    """
+    if report is None:
+        report = FillReport()
+    combined_pdf = fitz.open()
+    try:
+        for record_number, record in enumerate(records, start=1):
+            record_report = FillReport(record=record_number)
+            filled_pdf_bytes, _ = fill_pdf_with_images(pdf_file, record, uploaded_images, image_dpi, record_report)
+            report.merge(record_report)
+            if not filled_pdf_bytes:
+                return None
+            flattened_pdf_bytes, _ = optimize_pdf_output(filled_pdf_bytes, flatten_forms=True)
+            with fitz.open(stream=flattened_pdf_bytes, filetype="pdf") as record_pdf:
+                combined_pdf.insert_pdf(record_pdf)
+        return combined_pdf.tobytes(garbage=4, deflate=True)
+    finally:
+        combined_pdf.close()
+
+
+# --- Fill Report Functions ---
+class FillReport:
+    """(NEW) What a fill did, collected while filling and shown once afterwards.
+
+    Fillers add one entry per field (filled, unmatched, skipped, warning or error) and
+    bump named totals instead of writing a UI message each, so the page shows one summary
+    and one paged table however many fields the template has. Entries carry the record
+    number when several records are filled into one output.
+    """
+
+    def __init__(self, record=None):
+        self.record = record
+        self.entries = []
+        self.status_counts = collections.Counter()
+        self.totals = collections.Counter()
+        self.timings = collections.Counter()
+        self._display_entries = []
+        self._json = None
+
+    def add(self, status, field, detail=""):
+        entry = {'status': status, 'field': field, 'detail': detail}
+        if self.record is not None:
+            entry = {'record': self.record, **entry}
+        self.entries.append(entry)
+        self.status_counts[status] += 1
+        self._json = None
+
+    def warn(self, detail, field=""):
+        self.add('warning', field, detail)
+
+    def error(self, detail, field=""):
+        self.add('error', field, detail)
+
+    def count(self, name, amount=1):
+        self.totals[name] += amount
+        self._json = None
+
+    @contextlib.contextmanager
+    def timed(self, step):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[step] += time.perf_counter() - start
+            self._json = None
+
+    def merge(self, other):
+        """Fold a per-record report into this one."""
+        self._json = None
+        self.entries.extend(other.entries)
+        self.status_counts.update(other.status_counts)
+        self.totals.update(other.totals)
+        self.timings.update(other.timings)
+
+    def display_entries(self):
+        """Entries with errors and warnings first (stable within a status), sorted once."""
+        if len(self._display_entries) != len(self.entries):
+            rank = {status: index for index, status in enumerate(FILL_REPORT_STATUSES)}
+            self._display_entries = sorted(self.entries, key=lambda entry: rank[entry['status']])
+        return self._display_entries
+
+    def last_error(self):
+        errors = [entry['detail'] for entry in self.entries if entry['status'] == 'error']
+        return errors[-1] if errors else None
+
+    def to_json(self):
+        """The whole report as JSON, serialized once (later reruns reuse it)."""
+        if self._json is None:
+            self._json = json.dumps({
+                'summary': {status: self.status_counts[status] for status in FILL_REPORT_STATUSES},
+                'totals': dict(self.totals),
+                'timings_ms': {step: round(seconds * 1000, 1) for step, seconds in self.timings.items()},
+                'entries': self.entries,
+            }, indent=2, default=str)
+        return self._json
+
+def format_fill_report_summary(report):
+    """One line: status counts, named totals and step timings."""
+    parts = [f"{report.status_counts[status]} {status}" for status in FILL_REPORT_STATUSES if report.status_counts[status]]
+    parts += [f"{amount} {name.replace('_', ' ')}" for name, amount in report.totals.items() if amount]
+    parts += [f"{step} {seconds * 1000:,.0f} ms" for step, seconds in report.timings.items()]
+    return "🧾 Fill report: " + (" · ".join(parts) or "nothing to report")
+
+def render_fill_report(report, key):
+    """(NEW) Show a fill report as one summary line, a paged table and a JSON download.
+
+    Only one page of entries is sent to the browser, so the number of elements (and their
+    size) stays the same whether the template has ten fields or ten thousand.
+    """
+    st.caption(format_fill_report_summary(report))
+    if report.entries:
+        problems = sum(report.status_counts[status] for status in ("error", "warning"))
+        with st.expander(f"📋 Field details ({len(report.entries):,} entries)", expanded=bool(problems)):
+            page_count = -(-len(report.entries) // FILL_REPORT_PAGE_ROWS)
+            page = 1
+            if page_count > 1:
+                page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1,
+                                       step=1, key=f"{key}_report_page")
+            start = (page - 1) * FILL_REPORT_PAGE_ROWS
+            st.dataframe(pd.DataFrame(report.display_entries()[start:start + FILL_REPORT_PAGE_ROWS]),
+                         use_container_width=True, hide_index=True)
+    st.download_button(
+        label="🧾 Download fill report (JSON)",
+        data=report.to_json(),
+        file_name="fill_report.json",
+        mime="application/json",
+        key=f"{key}_report_json"
+    )
+
+
+# --- Capacity Management Functions ---
+class ServerBusyError(Exception):
+    """Raised when a fill could not be admitted before the queue timeout."""
+
+class AdmissionController:
+    """(NEW) Process-wide limit on concurrent fills, by count and by estimated memory.
+
+    Every Streamlit session runs in its own thread of the same process, so this is
+    shared through st.cache_resource. A single fill larger than the memory limit is
+    still admitted when nothing else is running, so big templates queue instead of
+    failing outright.
+    """
+
+    def __init__(self, max_fills, max_memory_bytes):
+        self.max_fills = max_fills
+        self.max_memory_bytes = max_memory_bytes
+        self.active_fills = 0
+        self.active_memory_bytes = 0
+        self._condition = threading.Condition()
+
+    def _try_acquire(self, cost_bytes):
+        if self.active_fills >= self.max_fills:
+            return False
+        if self.active_fills and self.active_memory_bytes + cost_bytes > self.max_memory_bytes:
+            return False
+        self.active_fills += 1
+        self.active_memory_bytes += cost_bytes
+        return True
+
+    def _release(self, cost_bytes):
+        with self._condition:
+            self.active_fills -= 1
+            self.active_memory_bytes -= cost_bytes
+            self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def admit(self, cost_bytes, on_queued=None, timeout=ADMISSION_TIMEOUT_SECONDS):
+        """Block until the fill fits, calling on_queued once if it has to wait."""
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            queued = False
+            while not self._try_acquire(cost_bytes):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ServerBusyError("The server is at capacity. Please try again in a few minutes.")
+                if not queued and on_queued:
+                    on_queued()
+                    queued = True
+                self._condition.wait(remaining)
+        try:
+            yield
+        finally:
+            self._release(cost_bytes)
+
+@st.cache_resource
+def get_admission_controller():
+    """Shared admission controller for every session in this server process."""
+    return AdmissionController(MAX_CONCURRENT_FILLS, MAX_FILL_MEMORY_MB * 1024 * 1024)
+
+def get_template_size(source_file):
+    """(NEW) Size in bytes of a bundled template path, uploaded file or buffer."""
+    if hasattr(source_file, 'getbuffer'):
+        return source_file.getbuffer().nbytes
+    if hasattr(source_file, 'size'):
+        return source_file.size
+    return os.path.getsize(source_file)
+
+def estimate_fill_cost(template_size, file_extension):
+    """(NEW) Rough peak memory a fill needs: parsed object model plus output copies."""
+    return FILL_BASE_MEMORY_BYTES + template_size * FILL_MEMORY_MULTIPLIERS.get(file_extension, 10)
+
+def get_session_cache():
+    """(NEW) Per-session LRU cache of large objects (outputs, parsed templates)."""
+    if 'session_cache' not in st.session_state:
+        st.session_state.session_cache = collections.OrderedDict()
+    return st.session_state.session_cache
+
+def session_cache_get(key):
+    """Return a cached value (marking it recently used), or None."""
+    cache = get_session_cache()
+    if key not in cache:
+        return None
+    cache.move_to_end(key)
+    return cache[key][0]
+
+def session_cache_put(key, value, size_bytes):
+    """Cache a value, evicting least recently used entries to stay within the session budget.
+    Returns False (caching nothing) if the value alone is over the budget."""
+    cache = get_session_cache()
+    cache.pop(key, None)
+    budget = SESSION_MEMORY_BUDGET_MB * 1024 * 1024
+    if size_bytes > budget:
+        return False
+    cache[key] = (value, size_bytes)
+    total_bytes = sum(size for _, size in cache.values())
+    while total_bytes > budget:
+        _, (_, evicted_size) = cache.popitem(last=False)
+        total_bytes -= evicted_size
+    return True
+
+def keep_output(key, output, size_bytes):
+    """(NEW) Cache a generated output so its download survives reruns; warn if it is too large to keep.
+    Returns output, which the caller offers for download in this run either way."""
+    if not session_cache_put(key, output, size_bytes):
+        st.warning(f"⚠️ This output ({size_bytes / (1024 * 1024):,.0f} MB) is larger than the "
+                   f"{SESSION_MEMORY_BUDGET_MB} MB session memory budget, so it is not kept. "
+                   "Download it now: it will be gone after your next interaction.")
+    return output
+
+
+def session_cache_discard(names):
+    """Drop every cached variant of the named outputs, e.g. when the template changes."""
+    cache = get_session_cache()
+    for key in [key for key in cache if isinstance(key, tuple) and key[0] in names]:
+        del cache[key]
+
+def output_cache_key(name, *inputs):
+    """(NEW) Session cache key for a generated output, tied to the template and inputs it was
+    filled from, so a different template or different data never shows a stale download."""
+    return (name, hashlib.blake2b(repr(inputs).encode('utf-8'), digest_size=16).hexdigest())
+
+
+# --- Batch Journal Functions ---
+class BatchJournal:
+    """(NEW) Durable on-disk record of a batch run, so rows are only filled once.
+
+    Each finished row appends one JSON line to journal.jsonl with the row's content
+    hash and its output file (stored by content hash next to the journal), or the
+    error it failed with. Opening the journal again skips every row whose data is
+    unchanged, so an interrupted batch resumes and an edited batch only refills the
+    edited rows. A line torn by a crash is ignored. Lines are flushed per row and
+    fsynced every BATCH_JOURNAL_SYNC_ROWS rows. The journal and outputs hold users'
+    record data, so they are readable by the server user only.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, "journal.jsonl")
+        self.outputs = {}
+        self.errors = {}
+        self._unsynced = 0
+        os.makedirs(os.path.join(directory, "outputs"), mode=0o700, exist_ok=True)
+        torn_line = False
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    torn_line = not line.endswith("\n")
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if 'output' in entry:
+                        self.outputs[entry['hash']] = entry['output']
+                        self.errors.pop(entry['hash'], None)
+                    else:
+                        self.errors[entry['hash']] = entry['error']
+        self._file = open(os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600), 'a', encoding='utf-8')
+        if torn_line:
+            # Terminate a line cut short by a crash so the next entry starts cleanly
+            self._file.write("\n")
+
+    @staticmethod
+    def row_hash(row_data):
+        """Content hash of one (formatted) row."""
+        return hashlib.blake2b(json.dumps(row_data, sort_keys=True, default=str).encode('utf-8'), digest_size=16).hexdigest()
+
+    def output_path(self, row_hash):
+        """Path of a finished row's output, or None if it still has to be filled."""
+        output = self.outputs.get(row_hash)
+        if output is None:
+            return None
+        path = os.path.join(self.directory, "outputs", output)
+        return path if os.path.exists(path) else None
+
+    def record_output(self, row_number, row_hash, output_bytes, extension):
+        """Store a row's output (atomically) and journal it. Returns the output path."""
+        output = f"{hashlib.blake2b(output_bytes, digest_size=16).hexdigest()}.{extension}"
+        path = os.path.join(self.directory, "outputs", output)
+        if not os.path.exists(path):
+            file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(file_descriptor, 'wb') as f:
+                f.write(output_bytes)
+            os.replace(temp_path, path)
+        self.outputs[row_hash] = output
+        self.errors.pop(row_hash, None)
+        self._append({'row': row_number, 'hash': row_hash, 'output': output, 'bytes': len(output_bytes)})
+        return path
+
+    def record_error(self, row_number, row_hash, error):
+        """Journal a failed row; it is retried on the next run."""
+        self.errors[row_hash] = error
+        self._append({'row': row_number, 'hash': row_hash, 'error': error})
+
+    def _append(self, entry):
+        self._file.write(json.dumps(entry, separators=(',', ':')) + "\n")
+        self._file.flush()
+        self._unsynced += 1
+        if self._unsynced >= BATCH_JOURNAL_SYNC_ROWS:
+            self.sync()
+
+    def sync(self):
+        """Force journaled rows to disk."""
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def close(self):
+        self.sync()
+        self._file.close()
+
+def batch_journal_key(template_path, file_extension, uploaded_images, image_dpi, output_options):
+    """(NEW) Identify a batch by everything that shapes its outputs except the rows.
+
+    The template store names templates by content hash, so the same template and
+    settings map to the same journal after a server restart. Re-encryption passwords
+    are left out (they are regenerated per session); only whether it is on counts.
+    """
+    settings = {key: value for key, value in (output_options or {}).items() if key != 'pdf_encryption'}
+    settings['pdf_encryption'] = bool((output_options or {}).get('pdf_encryption'))
+    key_data = {
+        'template': os.path.basename(template_path),
+        'extension': file_extension,
+        'images': {name: hashlib.sha256(image).hexdigest() for name, image in sorted(uploaded_images.items())},
+        'image_dpi': image_dpi,
+        'settings': settings
+    }
+    return hashlib.blake2b(json.dumps(key_data, sort_keys=True).encode('utf-8'), digest_size=16).hexdigest()
+
+@st.cache_resource
+def get_batch_journal_dir():
+    """Private directory holding every batch journal of this server process."""
+    return make_private_directory(BATCH_JOURNAL_DIR)
+
+def open_batch_journal(journal_key):
+    """(NEW) Open (or start) the journal for a batch and drop journals untouched for a day."""
+    journal_root = get_batch_journal_dir()
+    cutoff = time.time() - BATCH_JOURNAL_MAX_AGE_HOURS * 3600
+    for entry in os.scandir(journal_root):
+        if entry.is_dir() and entry.name != journal_key and entry.stat().st_mtime < cutoff:
+            shutil.rmtree(entry.path, ignore_errors=True)
+    directory = os.path.join(journal_root, journal_key)
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    # Touch the directory so an active batch is never pruned
+    os.utime(directory)
+    return BatchJournal(directory)
+
+
+# --- Batch Formatting Functions ---
+def load_batch_rows(uploaded_file):
+    """(NEW) Read batch data from a CSV or Excel upload, keeping every cell as text."""
+    if uploaded_file.name.lower().endswith(('.xlsx', '.xls')):
+        frame = pd.read_excel(uploaded_file, dtype=str)
+    else:
+        frame = pd.read_csv(uploaded_file, dtype=str)
+    frame.columns = [str(column).strip() for column in frame.columns]
+    return frame.reset_index(drop=True)
+
+def parse_format_spec(spec_text):
+    """(NEW) Parse and validate a JSON format spec: {"field": {"type": "date", ...}, ...}."""
+    if not spec_text.strip():
+        return {}
+    format_spec = json.loads(spec_text)
+    if not isinstance(format_spec, dict):
+        raise ValueError("The format spec must be a JSON object keyed by field name.")
+    for field, spec in format_spec.items():
+        if not isinstance(spec, dict):
+            raise ValueError(f"Format for '{field}' must be an object, e.g. {{\"type\": \"date\"}}.")
+        if spec.get("type", "text") not in BATCH_FORMAT_TYPES:
+            raise ValueError(f"Unknown type '{spec['type']}' for '{field}'. Use one of: {', '.join(BATCH_FORMAT_TYPES)}.")
+    return format_spec
+
+def format_batch_rows(frame, format_spec):
+    """(NEW) Format and validate every batch row, one whole column at a time.
+
+    All work uses pandas vectorized string/datetime/numeric operations, so formatting
+    cost grows with the number of columns, not with Python-level per-row loops.
+    Supported spec keys per field:
+      type: text | date | currency | phone, pattern (date strftime, default "%d %b %Y"),
+      symbol/decimals (currency), uppercase, max_length, required, default (default "TBD")
+    Returns (formatted, issues): formatted holds ready-to-insert strings; issues lists
+    one row per problem with columns Row, Field, Value, Problem.
+    """
+    formatted = pd.DataFrame(index=frame.index)
+    issues = []
+
+    def flag(mask, field, values, problem):
+        if mask.any():
+            issues.append(pd.DataFrame({
+                'Row': frame.index[mask] + 1,
+                'Field': field,
+                'Value': values[mask].fillna("").astype(object),
+                'Problem': problem
+            }))
+
+    for field in frame.columns:
+        spec = format_spec.get(field, {})
+        text = frame[field].astype("string").str.strip()
+        empty = text.isna() | (text == "")
+        kind = spec.get("type", "text")
+
+        if kind == "date":
+            parsed = pd.to_datetime(text, errors="coerce", format="mixed")
+            invalid = parsed.isna() & ~empty
+            values = parsed.dt.strftime(spec.get("pattern", "%d %b %Y")).astype("string")
+            flag(invalid, field, text, "Not a recognizable date")
+        elif kind == "currency":
+            symbol = spec.get("symbol", "$")
+            symbols = re.escape(BATCH_CURRENCY_SYMBOLS + symbol)
+            parts = text.str.replace(rf'[\s{symbols}]', '', regex=True).str.extract(BATCH_AMOUNT_PATTERN)
+            # Anything else (exponents, decimal commas, stray letters) is reported rather than guessed at
+            valid = parts['number'].notna() & (parts['open'].isna() == parts['close'].isna()) & ~(
+                parts['open'].notna() & parts['sign'].notna())
+            numbers = pd.to_numeric(parts['number'].str.replace(',', '', regex=False).where(valid), errors="coerce")
+            numbers = numbers.where(parts['sign'].isna() & parts['open'].isna(), -numbers)
+            invalid = numbers.isna() & ~empty
+            decimals = int(spec.get("decimals", 2))
+            amounts = numbers.abs().round(decimals).map(f"{{:,.{decimals}f}}".format, na_action="ignore").astype("string")
+            values = (symbol + amounts).where(numbers >= 0, "-" + symbol + amounts)
+            flag(invalid, field, text, "Not a valid amount")
+        elif kind == "phone":
+            digits = text.str.replace(r'\D', '', regex=True)
+            digits = digits.where(~((digits.str.len() == 11) & digits.str.startswith("1")), digits.str[1:])
+            invalid = (digits.str.len() != 10) & ~empty
+            values = "(" + digits.str[:3] + ") " + digits.str[3:6] + "-" + digits.str[6:]
+            values = values.where(~invalid)
+            flag(invalid, field, text, "Not a 10-digit phone number")
+        else:
+            invalid = pd.Series(False, index=frame.index)
+            values = text
+
+        # Keep what the user typed for values that failed to parse
+        values = values.where(~invalid, text)
+
+        if spec.get("uppercase"):
+            values = values.str.upper()
+        if spec.get("max_length"):
+            max_length = int(spec["max_length"])
+            too_long = values.str.len() > max_length
+            flag(too_long.fillna(False), field, values, f"Longer than {max_length} characters (truncated)")
+            values = values.str.slice(0, max_length)
+        if spec.get("required"):
+            flag(empty, field, text, "Required value is missing")
+
+        formatted[field] = values.where(~empty, spec.get("default", BATCH_DEFAULT_VALUE)).fillna(
+            spec.get("default", BATCH_DEFAULT_VALUE)).astype(object)
+
+    if issues:
+        issues_frame = pd.concat(issues, ignore_index=True).sort_values(['Row', 'Field'], kind="stable")
+    else:
+        issues_frame = pd.DataFrame(columns=['Row', 'Field', 'Value', 'Problem'])
+    return formatted, issues_frame.reset_index(drop=True)
+
+
+# --- Output Optimization Functions ---
+def optimize_ooxml_output(document_bytes, compression_level=6, dedupe_media=True,
+                          recompress_images=False, max_image_bytes=DEFAULT_MAX_IMAGE_BYTES):
+    """(NEW) Post-process a saved .pptx/.docx/.xlsx package to make it smaller.
+
+    - Identical media parts are stored once and relationships are rewritten to point at the kept copy
+    - Optionally re-encodes images larger than max_image_bytes (kept only if smaller)
+    - Rewrites the zip with the chosen compression level (0 = store, 1-9 = deflate)
+
+    Returns (optimized_bytes, stats) where stats reports sizes, bytes saved and seconds spent.
+    """
+    start_time = time.perf_counter()
+    source_zip = zipfile.ZipFile(io.BytesIO(document_bytes))
+    entries = source_zip.infolist()
+    contents = {entry.filename: source_zip.read(entry.filename) for entry in entries}
+
+    # Map duplicate media parts onto the first copy with the same content hash
+    duplicates = {}
+    if dedupe_media:
+        seen_hashes = {}
+        for entry in entries:
+            if '/media/' not in entry.filename:
+                continue
+            digest = hashlib.sha256(contents[entry.filename]).hexdigest()
+            if digest in seen_hashes:
+                duplicates[entry.filename] = seen_hashes[digest]
+            else:
+                seen_hashes[digest] = entry.filename
+
+    if duplicates:
+        for name in list(contents):
+            if name.endswith('.rels'):
+                contents[name] = _rewrite_relationship_targets(name, contents[name], duplicates)
+        if '[Content_Types].xml' in contents:
+            contents['[Content_Types].xml'] = _remove_content_type_overrides(contents['[Content_Types].xml'], duplicates)
+
+    images_recompressed = 0
+    if recompress_images:
+        for name, data in contents.items():
+            if '/media/' in name and name not in duplicates and len(data) > max_image_bytes:
+                recompressed = _recompress_image_part(name, data)
+                if recompressed is not None:
+                    contents[name] = recompressed
+                    images_recompressed += 1
+
+    output_buffer = io.BytesIO()
+    with zipfile.ZipFile(output_buffer, 'w') as output_zip:
+        for entry in entries:
+            if entry.filename in duplicates:
+                continue
+            info = zipfile.ZipInfo(entry.filename, date_time=entry.date_time)
+            info.external_attr = entry.external_attr
+            # Deflating already-compressed media wastes time for no gain
+            if compression_level == 0 or os.path.splitext(entry.filename)[1].lower() in PRECOMPRESSED_EXTENSIONS:
+                info.compress_type = zipfile.ZIP_STORED
+                output_zip.writestr(info, contents[entry.filename])
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+                output_zip.writestr(info, contents[entry.filename], compresslevel=compression_level)
+
+    optimized_bytes = output_buffer.getvalue()
+    stats = {
+        'original_bytes': len(document_bytes),
+        'optimized_bytes': len(optimized_bytes),
+        'bytes_saved': len(document_bytes) - len(optimized_bytes),
+        'duplicates_removed': len(duplicates),
+        'images_recompressed': images_recompressed,
+        'seconds': time.perf_counter() - start_time
+    }
+    return optimized_bytes, stats
+
+def _rewrite_relationship_targets(rels_name, rels_xml, duplicates):
+    """Point relationships that target a duplicate media part at the kept copy."""
+    from lxml import etree
+
+    # "word/_rels/document.xml.rels" describes parts relative to "word/"
+    source_dir = posixpath.dirname(posixpath.dirname(rels_name))
+    root = etree.fromstring(rels_xml)
+    changed = False
+    for relationship in root:
+        target = relationship.get('Target')
+        if not target or relationship.get('TargetMode') == 'External':
+            continue
+        if target.startswith('/'):
+            resolved = target.lstrip('/')
+        else:
+            resolved = posixpath.normpath(posixpath.join(source_dir, target))
+        if resolved in duplicates:
+            kept = duplicates[resolved]
+            relationship.set('Target', '/' + kept if target.startswith('/') else posixpath.relpath(kept, source_dir or '.'))
+            changed = True
+
+    if not changed:
+        return rels_xml
+    return etree.tostring(root, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+def _remove_content_type_overrides(content_types_xml, duplicates):
+    """Drop [Content_Types].xml overrides for parts that were removed."""
+    from lxml import etree
+
+    root = etree.fromstring(content_types_xml)
+    removed_part_names = {'/' + name for name in duplicates}
+    for override in list(root):
+        if override.get('PartName') in removed_part_names:
+            root.remove(override)
+    return etree.tostring(root, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+def _recompress_image_part(name, data):
+    """Re-encode an oversized PNG/JPEG media part; returns None if it doesn't get smaller."""
+    extension = os.path.splitext(name)[1].lower()
+    if extension not in ('.png', '.jpg', '.jpeg'):
+        return None
+    try:
+        image = Image.open(io.BytesIO(data))
+        output = io.BytesIO()
+        if extension == '.png':
+            image.save(output, format="PNG", optimize=True)
+        else:
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            image.save(output, format="JPEG", quality=85, optimize=True, progressive=True)
+    except Exception:
+        return None
+    recompressed = output.getvalue()
+    return recompressed if len(recompressed) < len(data) else None
+
+def optimize_pdf_output(pdf_bytes, flatten_forms=False, encryption=None):
+    """(NEW) Re-save a filled PDF compactly, optionally flattening form fields.
+
+    Saves with full object garbage collection (including duplicate object merging),
+    deflated streams and compressed object streams. Flattening regenerates each filled
+    widget's appearance and bakes it into the page content so the form is no longer editable.
+    With encryption (see decrypt_pdf_template) the same save re-encrypts the output.
+    Returns (optimized_bytes, stats).
+    """
+    start_time = time.perf_counter()
+    pdf_document = fitz.open(stream=pdf_bytes, filetype="pdf")
+    if pdf_document.needs_pass:
+        if not st.session_state.get('pdf_password') or not pdf_document.authenticate(st.session_state.pdf_password):
+            pdf_document.close()
+            return pdf_bytes, None
+
+    fields_flattened = 0
+    if flatten_forms:
+        has_widgets = False
+        for page in pdf_document:
+            for widget in page.widgets() or []:
+                has_widgets = True
+                if widget.field_value:
+                    # Values set through PyPDF2 have no appearance stream yet
+                    widget.update()
+                    fields_flattened += 1
+        # Empty widgets are baked too (the form is no longer editable) but only filled ones are counted
+        if has_widgets:
+            pdf_document.bake(annots=False, widgets=True)
+
+    output_buffer = io.BytesIO()
+    encryption_options = {}
+    if encryption:
+        encryption_options = {
+            'encryption': fitz.PDF_ENCRYPT_AES_256,
+            'permissions': encryption['permissions'],
+            'user_pw': encryption['user_password'],
+            'owner_pw': encryption['owner_password']
+        }
+    pdf_document.save(output_buffer, garbage=4, deflate=True, deflate_fonts=True, use_objstms=1, clean=True,
+                      **encryption_options)
+    pdf_document.close()
+
+    optimized_bytes = output_buffer.getvalue()
+    stats = {
+        'original_bytes': len(pdf_bytes),
+        'optimized_bytes': len(optimized_bytes),
+        'bytes_saved': len(pdf_bytes) - len(optimized_bytes),
+        'fields_flattened': fields_flattened,
+        'seconds': time.perf_counter() - start_time
+    }
+    return optimized_bytes, stats
+
+def render_output_options(file_extension, pdf_encryption=None):
+    """(NEW) Let the user choose how generated documents are compressed."""
+    output_options = {
+        'compression_level': OUTPUT_COMPRESSION_OPTIONS[DEFAULT_COMPRESSION_OPTION],
+        'dedupe_media': True,
+        'recompress_images': False,
+        'optimize_pdf': True,
+        'flatten_pdf': False,
+        'pdf_encryption': None
+    }
+    with st.expander("⚙️ Output Options", expanded=False):
+        if file_extension == 'pdf':
+            output_options['optimize_pdf'] = st.checkbox(
+                "Optimize PDF size", value=True,
+                help="Removes unused objects and compresses streams. Smaller files that open faster."
+            )
+            output_options['flatten_pdf'] = st.checkbox(
+                "Flatten filled form fields", value=False,
+                help="Turns filled form fields into regular page content. The output can no longer be edited as a form."
+            )
+            if pdf_encryption and st.checkbox(
+                "Re-encrypt with the original password and permissions", value=True,
+                help="The template was protected. Filled files are encrypted again (AES-256) with its password and permissions."
+            ):
+                output_options['pdf_encryption'] = pdf_encryption
+            st.checkbox(
+                "Process large PDFs in parallel", value=True, key="parallel_pdf",
+                help=f"PDFs with {PARALLEL_PDF_MIN_PAGES}+ pages are split into page ranges handled by {PDF_WORKER_PROCESSES} worker processes."
+            )
+        else:
+            compression_label = st.selectbox(
+                "Compression",
+                options=list(OUTPUT_COMPRESSION_OPTIONS),
+                index=list(OUTPUT_COMPRESSION_OPTIONS).index(DEFAULT_COMPRESSION_OPTION),
+                help="Smaller files take a little longer to generate. 'Fastest' skips compression entirely."
+            )
+            output_options['compression_level'] = OUTPUT_COMPRESSION_OPTIONS[compression_label]
+            output_options['dedupe_media'] = st.checkbox("Remove duplicate images and media", value=True)
+            output_options['recompress_images'] = st.checkbox(
+                "Recompress oversized images", value=False,
+                help=f"Re-encodes images larger than {DEFAULT_MAX_IMAGE_BYTES // 1024} KB when that makes them smaller."
+            )
+    return output_options
+
+def format_optimization_stats(stats):
+    """Summarize optimize_ooxml_output/optimize_pdf_output stats for display."""
+    details = [f"saved {stats['bytes_saved'] / 1024:,.1f} KB"]
+    if stats.get('duplicates_removed'):
+        details.append(f"{stats['duplicates_removed']} duplicate media removed")
+    if stats.get('fields_flattened'):
+        details.append(f"{stats['fields_flattened']} form fields flattened")
+    return (f"📦 Output optimized: {stats['original_bytes'] / 1024:,.0f} KB → {stats['optimized_bytes'] / 1024:,.0f} KB "
+            f"({', '.join(details)}) in {stats['seconds'] * 1000:.0f} ms")
+
+
+def build_filled_document(source_file, file_extension, data, uploaded_images, progress_container,
+                          filename_prefix="filled", image_dpi=DEFAULT_IMAGE_DPI, output_options=None, report=None):
+    """(NEW) Fill the selected template and return (bytes, download filename, mime type).
+    Returns (None, None, None) if a PDF could not be filled.
+    Per-field results and step timings are collected in report (a FillReport), if given.
+    Raises ServerBusyError if the fill could not be admitted in time.
+    """
+    with admit_fill(source_file, file_extension, progress_container):
+        return _build_filled_document(source_file, file_extension, data, uploaded_images, progress_container,
+                                      filename_prefix, image_dpi, output_options, report or FillReport())
+
+def fill_pdf_with_images(source_file, data, uploaded_images, image_dpi=DEFAULT_IMAGE_DPI, report=None):
+    """(NEW) Fill PDF text/form fields, then stamp uploaded images. Returns (bytes, replacements)."""
+    if report is None:
+        report = FillReport()
+    filled_pdf_bytes, replacements = fill_pdf_with_data(source_file, data, report)
+    if uploaded_images:
+        if not filled_pdf_bytes:
+            # Image-only forms: stamp onto the untouched template
+            base_pdf_bytes = read_template_bytes(source_file)
+        else:
+            base_pdf_bytes = filled_pdf_bytes
+        stamped_pdf_bytes, images_placed = stamp_images_in_pdf(base_pdf_bytes, uploaded_images, image_dpi)
+        if images_placed:
+            filled_pdf_bytes = stamped_pdf_bytes
+            replacements += images_placed
+            report.count('images_placed', images_placed)
+    return filled_pdf_bytes, replacements
+
+def build_combined_document(source_file, file_extension, records, uploaded_images, progress_container,
+                            filename_prefix="combined", image_dpi=DEFAULT_IMAGE_DPI, output_options=None, report=None):
+    """(NEW) Fill the template once per record into a single output: a copy of the slides,
+    document body or pages per record, in record order.
+    Returns (bytes, download filename, mime type), or (None, None, None) if a PDF could not be filled.
+    Raises ServerBusyError if the fill could not be admitted in time, and ValueError for no records.
+    """
+    if not records:
+        raise ValueError("A combined document needs at least one record")
+    if report is None:
+        report = FillReport()
+    with admit_fill(source_file, file_extension, progress_container, len(records)):
+        if hasattr(source_file, 'seek'):
+            source_file.seek(0)
+
+        output_buffer = io.BytesIO()
+        download_filename, mime_type = output_file_details(filename_prefix, file_extension)
+
+        with report.timed('fill'):
+            if file_extension == 'pptx':
+                prs, replacements = fill_powerpoint_records(Presentation(source_file), records, uploaded_images,
+                                                            image_dpi, report)
+                report.count('replacements', replacements)
+                prs.save(output_buffer)
+            elif file_extension == 'docx':
+                fill_word_records(source_file, records, uploaded_images, image_dpi, report).save(output_buffer)
+            elif file_extension == 'pdf':
+                combined_pdf_bytes = fill_pdf_records(source_file, records, uploaded_images, image_dpi, report)
+                if not combined_pdf_bytes:
+                    return None, None, None
+                output_buffer.write(combined_pdf_bytes)
+        report.count('records', len(records))
+
+        progress_container.success(f"✅ Combined {len(records)} records into one {file_extension.upper()}!")
+        with report.timed('optimize'):
+            output_bytes = optimize_output(output_buffer.getvalue(), file_extension, output_options, progress_container)
+        return output_bytes, download_filename, mime_type
+
+@contextlib.contextmanager
+def admit_fill(source_file, file_extension, progress_container, records=1):
+    """(NEW) Wait for fill capacity before parsing anything; shows a queued notice while waiting."""
+    queued_notice = progress_container.empty()
+    template_size = get_template_size(source_file)
+    # Extra records in a combined output add roughly one template's worth of XML/pages each
+    fill_cost = estimate_fill_cost(template_size, file_extension) + template_size * (records - 1)
+    with get_admission_controller().admit(
+        fill_cost,
+        on_queued=lambda: queued_notice.info("⏳ The server is busy. Your document is queued and will start automatically...")
+    ):
+        queued_notice.empty()
+        yield
+
+def output_file_details(filename_prefix, file_extension):
+    """(NEW) Timestamped download filename and mime type for a filled output."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    kind = {'pptx': "presentation", 'xlsx': "workbook"}.get(file_extension, "document")
+    return f"{filename_prefix}_{kind}_{timestamp}.{file_extension}", OUTPUT_MIME_TYPES[file_extension]
+
+class FillPlan:
+    """(NEW) A template opened before its data arrives, filled as field values come in.
+
+    PowerPoint and Word templates are parsed (and images placed) up front, and each
+    apply() writes its values into the open document straight away, so once the last
+    field of a streamed AI response arrives only saving is left. Excel and PDF fills
+    rewrite the whole file in one pass, so for those the plan collects values and
+    fills at finish(). Per-field results go into report at finish(), once every value is in.
+    """
+
+    def __init__(self, source_file, file_extension, uploaded_images=None, image_dpi=DEFAULT_IMAGE_DPI, report=None):
+        self.source_file = source_file
+        self.file_extension = file_extension
+        self.uploaded_images = uploaded_images
+        self.image_dpi = image_dpi
+        self.report = report or FillReport()
+        self.data = {}
+        self.document = None
+        self._stale = False
+        self._open()
+
+    def _open(self):
+        if hasattr(self.source_file, 'seek'):
+            self.source_file.seek(0)
+        # Replacements per placeholder, turned into per-field report entries at finish()
+        self.filled = collections.Counter()
+        with self.report.timed('fill'):
+            if self.file_extension == 'pptx':
+                self.document = Presentation(self.source_file)
+                if self.uploaded_images:
+                    self.report.count('images_placed', fill_powerpoint_images(self.document, self.uploaded_images, self.image_dpi))
+            elif self.file_extension == 'docx':
+                self.document = docx.Document(self.source_file)
+                # Fill image placeholders before text so {{image:name}} runs are still intact
+                if self.uploaded_images:
+                    self.report.count('images_placed', fill_word_images(self.document, self.uploaded_images, self.image_dpi))
+
+    def apply(self, data):
+        """Fill these field values (a dict) into the template.
+
+        A field sent again with a different value replaces the earlier one (the last value
+        wins, as when a pasted response is parsed whole); since the earlier value has already
+        replaced its placeholders, the document is then refilled from the template at finish().
+        """
+        if self.document is not None and any(field in self.data and self.data[field] != value
+                                             for field, value in data.items()):
+            self._stale = True
+        self.data.update(data)
+        if self._stale:
+            return
+        with self.report.timed('fill'):
+            if self.file_extension == 'pptx':
+                self.report.count('replacements', fill_powerpoint_slides(self.document.slides, data, self.filled))
+            elif self.file_extension == 'docx':
+                self.report.count('replacements', fill_word_text(self.document, data, self.report, self.filled))
+
+    def finish(self, progress_container, filename_prefix="filled", output_options=None):
+        """Return (bytes, download filename, mime type), or (None, None, None) if a PDF could not be filled."""
+        if self._stale:
+            self.report.totals.pop('replacements', None)
+            self.report.totals.pop('images_placed', None)
+            self._stale = False
+            self._open()
+            self.apply(self.data)
+        if self.document is None:
+            return _build_filled_document(self.source_file, self.file_extension, self.data, self.uploaded_images,
+                                          progress_container, filename_prefix, self.image_dpi, output_options, self.report)
+        if self.file_extension == 'pptx':
+            remaining = remaining_placeholders([slide._element for slide in self.document.slides], DRAWING_NAMESPACE)
+        else:
+            remaining = remaining_word_placeholders(self.document)
+        report_field_outcomes(self.report, self.data, self.filled, remaining)
+        output_buffer = io.BytesIO()
+        with self.report.timed('save'):
+            self.document.save(output_buffer)
+        download_filename, mime_type = output_file_details(filename_prefix, self.file_extension)
+        with self.report.timed('optimize'):
+            output_bytes = optimize_output(output_buffer.getvalue(), self.file_extension, output_options, progress_container)
+        return output_bytes, download_filename, mime_type
+
+def _build_filled_document(source_file, file_extension, data, uploaded_images, progress_container,
+                           filename_prefix, image_dpi, output_options, report):
+    if file_extension in ('pptx', 'docx'):
+        plan = FillPlan(source_file, file_extension, uploaded_images, image_dpi, report)
+        plan.apply(data)
+        return plan.finish(progress_container, filename_prefix, output_options)
+
+    if hasattr(source_file, 'seek'):
+        source_file.seek(0)
+
+    output_buffer = io.BytesIO()
+    download_filename, mime_type = output_file_details(filename_prefix, file_extension)
+
+    with report.timed('fill'):
+        if file_extension == 'xlsx':
+            filled_xlsx_bytes, replacements = fill_excel_with_data(source_file, data)
+            report.count('replacements', replacements)
+            output_buffer.write(filled_xlsx_bytes)
+        elif file_extension == 'pdf':
+            filled_pdf_bytes, replacements = fill_pdf_with_images(source_file, data, uploaded_images, image_dpi, report)
+            if not filled_pdf_bytes:
+                return None, None, None
+            output_buffer.write(filled_pdf_bytes)
+            progress_container.success(f"✅ PDF generated successfully! Made {replacements} replacements.")
+
+    with report.timed('optimize'):
+        output_bytes = optimize_output(output_buffer.getvalue(), file_extension, output_options, progress_container)
+    return output_bytes, download_filename, mime_type
+
+def optimize_output(output_bytes, file_extension, output_options, progress_container):
+    """(NEW) Apply the chosen output optimizations and show their stats."""
+    if output_options:
+        stats = None
+        if file_extension in ('pptx', 'docx', 'xlsx'):
+            output_bytes, stats = optimize_ooxml_output(
+                output_bytes,
+                compression_level=output_options['compression_level'],
+                dedupe_media=output_options['dedupe_media'],
+                recompress_images=output_options['recompress_images']
+            )
+        elif file_extension == 'pdf' and (output_options['optimize_pdf'] or output_options['flatten_pdf']
+                                          or output_options['pdf_encryption']):
+            output_bytes, stats = optimize_pdf_output(output_bytes, flatten_forms=output_options['flatten_pdf'],
+                                                      encryption=output_options['pdf_encryption'])
+        if stats:
+            progress_container.caption(format_optimization_stats(stats))
+    return output_bytes
+
 
 # --- Main Application Logic ---
 def main():
     st.warning('**DO NOT ENTER CUI OR PII INTO THIS SYSTEM - FOR BETA TESTING AND NON-OFFICIAL USE ONLY**')
-    try:
-        st.image("banner.png", use_container_width=True)
-    except Exception as e:
+    banner_bytes = get_banner_bytes()
+    if banner_bytes:
+        st.image(banner_bytes, use_container_width=True)
+    else:
         st.info("Info: `banner.png` not found. Skipping image banner.")
 
     st.markdown('<div class="main-header">📊 Document AI Field Filler</div>', unsafe_allow_html=True)
-    st.markdown("**Transform your templates with AI-powered data filling! This tool supports PowerPoint, Word, and PDF documents. It will take unformatted data and conduct research, formatting, organization, data extraction, and place it in a pre-made template or bring your own!**")
+    st.markdown("**Transform your templates with AI-powered data filling! This tool supports PowerPoint, Word, Excel, and PDF documents. It will take unformatted data and conduct research, formatting, organization, data extraction, and place it in a pre-made template or bring your own!**")
 
     if 'fields' not in st.session_state:
         st.session_state.fields = []
@@ -851,23 +3625,29 @@ def main():
         st.session_state.field_locations = []
     if 'ai_prompt' not in st.session_state:
         st.session_state.ai_prompt = ""
+    if 'image_fields' not in st.session_state:
+        st.session_state.image_fields = []
 
     st.markdown('<div class="step-container">', unsafe_allow_html=True)
     st.markdown("### 📁 Step 1: Choose Your Template")
 
     try:
-        template_files = glob.glob("templates/*.*")
+        template_files = get_template_catalog()
         template_options = ["Upload my own template"] + template_files
     except Exception as e:
         st.error(f"Could not scan templates directory: {e}")
         template_options = ["Upload my own template"]
 
     selected_template = st.selectbox("Select a template or upload your own:", options=template_options)
+    st.toggle(
+        "⚡ Fast analysis", value=True, key="streaming_analysis",
+        help="Scans Word and PowerPoint templates by streaming their XML instead of loading the full document. Turn off to use the original analyzer."
+    )
     source_file = None 
     template_name = None  # Track template name for prompt selection
 
     if selected_template == "Upload my own template":
-        source_file = st.file_uploader("Choose your template file", type=['pptx', 'docx', 'pdf'])
+        source_file = st.file_uploader("Choose your template file", type=['pptx', 'docx', 'pdf', 'xlsx'])
         if source_file:
             template_name = source_file.name
     else:
@@ -880,20 +3660,40 @@ def main():
         filename = source_file.name if hasattr(source_file, 'name') else source_file
         file_extension = filename.split('.')[-1].lower()
 
-        with st.spinner('🔍 Analyzing template fields...'):
-            if file_extension == 'pptx':
-                st.session_state.fields, st.session_state.field_locations = analyze_powerpoint_fields(source_file)
-            elif file_extension == 'docx':
-                st.session_state.fields, st.session_state.field_locations = analyze_word_fields(source_file)
-            elif file_extension == 'pdf':
-                st.session_state.fields, st.session_state.field_locations = analyze_pdf_fields(source_file)
-            else:
-                st.error("Unsupported file type. Supported formats: PowerPoint (.pptx), Word (.docx), PDF (.pdf)")
+        if get_template_size(source_file) > MAX_TEMPLATE_MB * 1024 * 1024:
+            st.error(f"Template is too large. The maximum template size is {MAX_TEMPLATE_MB} MB.")
+            return
+
+        # Reruns on the same template reuse this session's analysis instead of redoing it
+        analysis_key = (template_cache_key(source_file), st.session_state.get('streaming_analysis', True))
+        analysis = session_cache_get('template_analysis')
+        if analysis is None or analysis['key'] != analysis_key or not os.path.exists(analysis['template_path']):
+            analysis = analyze_template(source_file, file_extension)
+            if analysis is None:
+                st.error("Unsupported file type. Supported formats: PowerPoint (.pptx), Word (.docx), PDF (.pdf), Excel (.xlsx)")
                 return
+            analysis['key'] = analysis_key
+            # Outputs of the previous template can never be shown again
+            session_cache_discard(OUTPUT_CACHE_NAMES)
+            # A protected PDF is cached once unlocked: template_path is then its decrypted copy
+            if analysis['fields'] or analysis['image_fields']:
+                # The template itself lives in the shared template store, so only the field
+                # lists and locations count against this session's budget
+                session_cache_put('template_analysis', analysis, len(json.dumps(analysis, default=str)))
+
+        # Every fill reads the shared memory-mapped copy instead of a private one
+        source_file = get_template_store().open(analysis['template_path'])
+        if analysis['splits_repaired']:
+            st.caption(f"🔧 Repaired {analysis['splits_repaired']} placeholders that were split across text runs.")
+        if analysis['pdf_encryption']:
+            st.caption("🔓 Protected PDF unlocked. It was decrypted once and every fill reuses the decrypted copy.")
+        st.session_state.fields = analysis['fields']
+        st.session_state.field_locations = analysis['field_locations']
+        st.session_state.image_fields = analysis['image_fields']
 
-        if st.session_state.fields:
+        if st.session_state.fields or st.session_state.image_fields:
             st.markdown('<div class="success-box">', unsafe_allow_html=True)
-            st.success(f"Found {len(st.session_state.fields)} placeholders in '{filename}'!")
+            st.success(f"Found {len(st.session_state.fields) + len(st.session_state.image_fields)} placeholders in '{filename}'!")
             
             with st.expander("Click to see found fields and their locations"):
                 col1, col2 = st.columns(2)
@@ -903,27 +3703,60 @@ def main():
                 with col2:
                     st.write("**Field Locations:**")
                     if st.session_state.field_locations:
+                        # One markdown element for the whole list keeps reruns cheap on large templates
+                        location_lines = []
                         for location in st.session_state.field_locations:
                             if file_extension == 'pdf':
-                                st.write(f"• **{location['field']}** (Page {location['page']}, Type: {location['type']})")
+                                location_lines.append(f"- **{location['field']}** (Page {location['page']}, Type: {location['type']})")
                             elif file_extension == 'pptx':
-                                st.write(f"• **{location['field']}** (Slide {location['slide']})")
+                                location_lines.append(f"- **{location['field']}** (Slide {location['slide']})")
+                            elif file_extension == 'docx':
+                                location_lines.append(f"- **{location['field']}** ({location['part']}, paragraph {location['paragraph']})")
+                            elif file_extension == 'xlsx':
+                                location_lines.append(f"- **{location['field']}** ({location['sheet']}, {location['cell']})")
+                        st.markdown("\n".join(location_lines))
                     else:
                         st.write("Location data not available for this document type.")
 
             st.markdown('</div>', unsafe_allow_html=True)
 
-            # Create tabs for AI Generation and Manual Entry
-            tab1, tab2 = st.tabs(["🤖 AI Generation", "✏️ Manual Entry"])
+            # Image placeholders are filled from uploads rather than from text data
+            uploaded_images = {}
+            image_dpi = DEFAULT_IMAGE_DPI
+            if st.session_state.image_fields:
+                st.markdown('<div class="step-container">', unsafe_allow_html=True)
+                st.markdown("### 🖼️ Images")
+                st.info("Upload an image for each image placeholder. Images are resized to fit their placeholder, so full-resolution photos won't bloat the output.")
+                for image_name in st.session_state.image_fields:
+                    image_file = st.file_uploader(
+                        f"Image for {{{{image:{image_name}}}}}",
+                        type=['png', 'jpg', 'jpeg', 'gif', 'bmp', 'tif', 'tiff', 'webp'],
+                        key=f"image_upload_{image_name}"
+                    )
+                    if image_file:
+                        uploaded_images[image_name] = image_file.getvalue()
+                image_dpi = st.number_input(
+                    "Image resolution (DPI)", min_value=72, max_value=600, value=DEFAULT_IMAGE_DPI, step=25,
+                    help="Images are downscaled to this resolution at their placed size. Lower values give smaller files."
+                )
+                st.markdown('</div>', unsafe_allow_html=True)
+
+            output_options = render_output_options(file_extension, analysis['pdf_encryption'])
+            # Everything besides the data that shapes an output; part of each cached output's key
+            fill_settings = (analysis['key'], image_dpi, output_options,
+                             {name: hashlib.blake2b(data, digest_size=16).hexdigest() for name, data in uploaded_images.items()})
+
+            # Outputs generated in this run, offered for download even when too large to cache
+            generated_outputs = {}
+
+            # Create tabs for AI Generation, Manual Entry and Batch
+            tab1, tab2, tab3 = st.tabs(["🤖 AI Generation", "✏️ Manual Entry", "📊 Batch"])
             
             # AI Generation Tab
             with tab1:
                 st.markdown('<div class="step-container">', unsafe_allow_html=True)
                 st.markdown("### 📝 Step 2: Enter Your Applicable Data Or Text. This can be formatted in any way, stream of thought, lists, sentences, etc. The more you provide the better your result will be. Any field on your template that is not covered will be TBD")
                 project_data = st.text_area("Enter your data here:", height=200)
-                
-                # Image upload temporarily disabled for all formats
-                uploaded_image = None
 
                 st.markdown('</div>', unsafe_allow_html=True)
 
@@ -953,59 +3786,110 @@ def main():
                         st.markdown(f'<a href="https://niprgpt.mil/" target="_blank" class="ai-button nipr-btn">🚀 Open NiprGPT</a>', unsafe_allow_html=True)
                         st.markdown('</div>', unsafe_allow_html=True)
 
+                        llm_backend = get_llm_backend()
+                        if llm_backend:
+                            st.markdown('<div class="step-container">', unsafe_allow_html=True)
+                            backend_name = llm_backend.get("name", "the configured AI")
+                            st.markdown(f"### ⚡ Or Generate Directly with {backend_name}")
+                            st.info("The response is read as it streams in and each field is filled as soon as it arrives.")
+                            ai_stream_key = output_cache_key('ai_stream_output', fill_settings, st.session_state.ai_prompt)
+                            if st.button(f"⚡ Generate with {backend_name}", type="primary", key="ai_stream_btn"):
+                                progress_container = st.container()
+                                stream_status = progress_container.empty()
+                                fill_report = FillReport()
+                                field_stream = JsonFieldStream()
+                                fill_plan = None
+                                try:
+                                    with contextlib.ExitStack() as admission:
+                                        with fill_report.timed('ai_stream'):
+                                            for chunk in stream_llm_response(st.session_state.ai_prompt, llm_backend):
+                                                for field, value in field_stream.feed(chunk):
+                                                    if fill_plan is None:
+                                                        # Take a fill slot when the first field arrives, not while waiting on the model
+                                                        admission.enter_context(admit_fill(source_file, file_extension, progress_container))
+                                                        fill_plan = FillPlan(source_file, file_extension, uploaded_images, image_dpi, fill_report)
+                                                    fill_plan.apply({field: value})
+                                                    stream_status.caption(f"⚡ Received {len(field_stream.fields)} fields (latest: {field})")
+                                        if fill_plan is None:
+                                            raise ValueError("The response did not contain a JSON object")
+                                        output_bytes, download_filename, mime_type = fill_plan.finish(
+                                            progress_container, "filled", output_options
+                                        )
+                                except ServerBusyError as e:
+                                    st.error(f"⏳ {e}")
+                                    st.stop()
+                                except (OSError, ValueError) as e:
+                                    st.error(f"❌ AI request failed: {e}")
+                                    st.stop()
+                                if output_bytes is None:
+                                    st.error(f"Failed to generate filled PDF: {fill_report.last_error() or 'no fields could be filled'}")
+                                    render_fill_report(fill_report, "ai_stream")
+                                    st.stop()
+                                if field_stream.invalid_members:
+                                    st.warning(f"⚠️ Skipped {field_stream.invalid_members} entries in the response that were not valid JSON.")
+                                generated_outputs[ai_stream_key] = keep_output(
+                                    ai_stream_key, (output_bytes, download_filename, mime_type, fill_report), len(output_bytes))
+
+                            cached_output = session_cache_get(ai_stream_key) or generated_outputs.get(ai_stream_key)
+                            if cached_output:
+                                output_bytes, download_filename, mime_type, fill_report = cached_output
+                                st.download_button(
+                                    label=f"📥 Download Filled {download_filename.rsplit('.', 1)[-1].upper()}",
+                                    data=output_bytes,
+                                    file_name=download_filename,
+                                    mime=mime_type,
+                                    key="ai_stream_download"
+                                )
+                                render_fill_report(fill_report, "ai_stream")
+                            st.markdown('</div>', unsafe_allow_html=True)
+
                         st.markdown('<div class="step-container">', unsafe_allow_html=True)
                         st.markdown("### 🔄 Step 4: Paste AI Response & Generate")
                         ai_response = st.text_area("Paste the AI's JSON response here:", height=150)
 
                         if ai_response.strip():
                             try:
-                                json_str_match = re.search(r'\{.*\}', ai_response, re.DOTALL)
-                                if not json_str_match:
-                                    raise json.JSONDecodeError("No JSON object found", "", 0)
-                                json_data = json.loads(json_str_match.group(0))
+                                json_data, field_stream = extract_json_fields(ai_response)
                                 st.success("✅ Valid JSON detected!")
+                                if field_stream.invalid_members:
+                                    st.warning(f"⚠️ Skipped {field_stream.invalid_members} entries that were not valid JSON.")
 
+                                ai_output_key = output_cache_key('ai_output', fill_settings, json_data)
                                 if st.button("🚀 Generate Filled Document", type="primary", key="ai_generate_btn"):
                                     progress_container = st.container()
+                                    fill_report = FillReport()
                                     with st.spinner('🔄 Filling template...'):
-                                        if hasattr(source_file, 'seek'):
-                                            source_file.seek(0)
-                                        
-                                        output_buffer = io.BytesIO()
-                                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                                        
-                                        if file_extension == 'pptx':
-                                            prs = Presentation(source_file)
-                                            filled_doc, _ = fill_powerpoint_with_data(prs, json_data, uploaded_image, progress_container)
-                                            filled_doc.save(output_buffer)
-                                            download_filename = f"filled_presentation_{timestamp}.pptx"
-                                            mime_type = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
-                                        elif file_extension == 'docx':
-                                            filled_doc = fill_word_with_data(source_file, json_data)
-                                            filled_doc.save(output_buffer)
-                                            download_filename = f"filled_document_{timestamp}.docx"
-                                            mime_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                                        elif file_extension == 'pdf':
-                                            filled_pdf_bytes, replacements = fill_pdf_with_data(source_file, json_data)
-                                            if filled_pdf_bytes:
-                                                output_buffer.write(filled_pdf_bytes)
-                                                download_filename = f"filled_document_{timestamp}.pdf"
-                                                mime_type = "application/pdf"
-                                                progress_container.success(f"✅ PDF generated successfully! Made {replacements} replacements.")
-                                            else:
-                                                st.error("Failed to generate filled PDF")
-                                                st.stop()
+                                        try:
+                                            output_bytes, download_filename, mime_type = build_filled_document(
+                                                source_file, file_extension, json_data, uploaded_images,
+                                                progress_container, "filled", image_dpi, output_options, fill_report
+                                            )
+                                        except ServerBusyError as e:
+                                            st.error(f"⏳ {e}")
+                                            st.stop()
+                                        if output_bytes is None:
+                                            st.error(f"Failed to generate filled PDF: {fill_report.last_error() or 'no fields could be filled'}")
+                                            render_fill_report(fill_report, "ai")
+                                            st.stop()
                                         
                                         if file_extension != 'pdf':
                                             progress_container.success("✅ Document generated successfully!")
                                         
-                                        st.download_button(
-                                            label=f"📥 Download Filled {file_extension.upper()}",
-                                            data=output_buffer.getvalue(),
-                                            file_name=download_filename,
-                                            mime=mime_type
-                                        )
+                                        generated_outputs[ai_output_key] = keep_output(
+                                            ai_output_key, (output_bytes, download_filename, mime_type, fill_report), len(output_bytes))
                                         st.balloons()
+
+                                # Keep the latest output downloadable across reruns (within the session memory budget)
+                                cached_output = session_cache_get(ai_output_key) or generated_outputs.get(ai_output_key)
+                                if cached_output:
+                                    output_bytes, download_filename, mime_type, fill_report = cached_output
+                                    st.download_button(
+                                        label=f"📥 Download Filled {download_filename.rsplit('.', 1)[-1].upper()}",
+                                        data=output_bytes,
+                                        file_name=download_filename,
+                                        mime=mime_type
+                                    )
+                                    render_fill_report(fill_report, "ai")
                             except json.JSONDecodeError as e:
                                 st.error(f"❌ Invalid JSON format: {e}")
                         st.markdown('</div>', unsafe_allow_html=True)
@@ -1070,59 +3954,53 @@ def main():
                     st.metric("Fields to Fill", f"{filled_count}/{len(st.session_state.fields)}")
                 
                 with col_generate:
+                    # Prepare data dictionary, excluding empty fields
+                    manual_data = {}
+                    filled_count = 0
+                    
+                    for field in st.session_state.fields:
+                        value = st.session_state.manual_entry_data.get(field, "").strip()
+                        if value:  # Only include non-empty fields
+                            manual_data[field] = value
+                            filled_count += 1
+                    manual_output_key = output_cache_key('manual_output', fill_settings, manual_data)
+
                     if st.button("🚀 Generate Document", type="primary", key="manual_generate_btn"):
-                        # Prepare data dictionary, excluding empty fields
-                        manual_data = {}
-                        filled_count = 0
-                        
-                        for field in st.session_state.fields:
-                            value = st.session_state.manual_entry_data.get(field, "").strip()
-                            if value:  # Only include non-empty fields
-                                manual_data[field] = value
-                                filled_count += 1
-                        
                         st.info(f"Filling {filled_count} out of {len(st.session_state.fields)} fields. Empty fields will remain as placeholders.")
                         
                         progress_container = st.container()
+                        fill_report = FillReport()
                         with st.spinner('🔄 Generating document with manual entry...'):
-                            if hasattr(source_file, 'seek'):
-                                source_file.seek(0)
-                            
-                            output_buffer = io.BytesIO()
-                            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                            
-                            if file_extension == 'pptx':
-                                prs = Presentation(source_file)
-                                filled_doc, _ = fill_powerpoint_with_data(prs, manual_data, None, progress_container)
-                                filled_doc.save(output_buffer)
-                                download_filename = f"manual_filled_presentation_{timestamp}.pptx"
-                                mime_type = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
-                            elif file_extension == 'docx':
-                                filled_doc = fill_word_with_data(source_file, manual_data)
-                                filled_doc.save(output_buffer)
-                                download_filename = f"manual_filled_document_{timestamp}.docx"
-                                mime_type = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                            elif file_extension == 'pdf':
-                                filled_pdf_bytes, replacements = fill_pdf_with_data(source_file, manual_data)
-                                if filled_pdf_bytes:
-                                    output_buffer.write(filled_pdf_bytes)
-                                    download_filename = f"manual_filled_document_{timestamp}.pdf"
-                                    mime_type = "application/pdf"
-                                    progress_container.success(f"✅ PDF generated successfully! Made {replacements} replacements.")
-                                else:
-                                    st.error("Failed to generate filled PDF")
-                                    st.stop()
+                            try:
+                                output_bytes, download_filename, mime_type = build_filled_document(
+                                    source_file, file_extension, manual_data, uploaded_images,
+                                    progress_container, "manual_filled", image_dpi, output_options, fill_report
+                                )
+                            except ServerBusyError as e:
+                                st.error(f"⏳ {e}")
+                                st.stop()
+                            if output_bytes is None:
+                                st.error(f"Failed to generate filled PDF: {fill_report.last_error() or 'no fields could be filled'}")
+                                render_fill_report(fill_report, "manual")
+                                st.stop()
                             
                             if file_extension != 'pdf':
                                 progress_container.success("✅ Document generated successfully with manual entry!")
                             
-                            st.download_button(
-                                label=f"📥 Download Manual Filled {file_extension.upper()}",
-                                data=output_buffer.getvalue(),
-                                file_name=download_filename,
-                                mime=mime_type
-                            )
+                            generated_outputs[manual_output_key] = keep_output(
+                                manual_output_key, (output_bytes, download_filename, mime_type, fill_report), len(output_bytes))
                             st.balloons()
+
+                    cached_output = session_cache_get(manual_output_key) or generated_outputs.get(manual_output_key)
+                    if cached_output:
+                        output_bytes, download_filename, mime_type, fill_report = cached_output
+                        st.download_button(
+                            label=f"📥 Download Manual Filled {download_filename.rsplit('.', 1)[-1].upper()}",
+                            data=output_bytes,
+                            file_name=download_filename,
+                            mime=mime_type
+                        )
+                        render_fill_report(fill_report, "manual")
                 
                 # Show a detailed preview of what will be filled
                 with st.expander("📋 Preview of Field Mappings", expanded=False):
@@ -1142,6 +4020,174 @@ def main():
                 
                 st.markdown('</div>', unsafe_allow_html=True)
 
+            # Batch Tab
+            with tab3:
+                st.markdown('<div class="step-container">', unsafe_allow_html=True)
+                st.markdown("### 📊 Batch - One Document per Spreadsheet Row")
+                st.info("Upload a CSV or Excel file with one column per field name. Every row becomes its own filled document.")
+                batch_file = st.file_uploader("Upload your data (.csv or .xlsx)", type=['csv', 'xlsx'], key="batch_upload")
+
+                format_spec_text = st.text_area(
+                    "Field formats (optional JSON):",
+                    height=150,
+                    key="batch_format_spec",
+                    placeholder=BATCH_FORMAT_EXAMPLE,
+                    help="Types: text, date (pattern), currency (symbol, decimals), phone. "
+                         f"Any field can also use uppercase, max_length, required and default (blank cells become \"{BATCH_DEFAULT_VALUE}\")."
+                )
+                st.markdown('</div>', unsafe_allow_html=True)
+
+                if batch_file:
+                    try:
+                        batch_rows = load_batch_rows(batch_file)
+                        format_spec = parse_format_spec(format_spec_text)
+                    except (ValueError, json.JSONDecodeError) as e:
+                        st.error(f"❌ Could not read batch input: {e}")
+                        st.stop()
+
+                    batch_fields = [column for column in batch_rows.columns if column in st.session_state.fields]
+                    unknown_columns = [column for column in batch_rows.columns if column not in st.session_state.fields]
+                    missing_fields = [field for field in st.session_state.fields if field not in batch_rows.columns]
+                    if unknown_columns:
+                        st.warning(f"⚠️ Ignoring columns that are not template fields: {', '.join(unknown_columns)}")
+                    if missing_fields:
+                        st.info(f"These fields have no column and will remain as placeholders: {', '.join(missing_fields)}")
+
+                    if batch_rows.empty:
+                        st.warning("⚠️ The file has column headers but no data rows. Add at least one row to generate documents.")
+                        st.stop()
+
+                    # Format and validate every row up front, before any document is filled
+                    formatted_rows, batch_issues = format_batch_rows(batch_rows[batch_fields], format_spec)
+                    col_rows, col_issues = st.columns(2)
+                    col_rows.metric("Rows", len(formatted_rows))
+                    col_issues.metric("Rows with issues", batch_issues['Row'].nunique())
+
+                    if not batch_issues.empty:
+                        st.warning("⚠️ Some values could not be formatted. They will be inserted as typed unless you fix the file.")
+                        st.dataframe(batch_issues, use_container_width=True, hide_index=True)
+
+                    with st.expander("📋 Preview of formatted rows", expanded=False):
+                        st.dataframe(formatted_rows.head(50), use_container_width=True)
+
+                    combine_output = st.radio(
+                        "Output", ["One file per row (ZIP)", "One combined file"], horizontal=True, key="batch_output_mode",
+                        help="Combined puts every row into a single document: a copy of the slides, pages or document body per row."
+                    ) == "One combined file"
+                    if combine_output:
+                        if file_extension == 'xlsx':
+                            st.info("Combined output isn't available for Excel templates. Use a {{table.column}} row instead to list every record in one sheet.")
+                            st.stop()
+                        if len(formatted_rows) > MAX_COMBINED_RECORDS:
+                            st.error(f"A combined file can hold at most {MAX_COMBINED_RECORDS} rows. Split your data or download one file per row.")
+                            st.stop()
+                        if file_extension == 'docx':
+                            st.caption("Headers and footers are shared by every page, so they are filled from the first row.")
+                    else:
+                        name_column = st.selectbox("Name each file by", ["(row number)"] + batch_fields, key="batch_name_column")
+                        reuse_finished = st.checkbox(
+                            "Reuse rows finished in earlier runs", value=True, key="batch_reuse_finished",
+                            help="Finished rows are journaled on the server. An interrupted batch resumes where it stopped, "
+                                 "and re-running with a few edited rows only regenerates those rows."
+                        )
+
+                    batch_output_key = output_cache_key('batch_output', fill_settings, formatted_rows.to_csv(), combine_output,
+                                                        None if combine_output else name_column)
+                    if batch_fields and combine_output and st.button("🚀 Generate Combined Document", type="primary", key="batch_combined_btn"):
+                        progress_container = st.container()
+                        fill_report = FillReport()
+                        with st.spinner(f'🔄 Combining {len(formatted_rows)} records...'):
+                            try:
+                                output_bytes, download_filename, mime_type = build_combined_document(
+                                    source_file, file_extension, formatted_rows.to_dict('records'), uploaded_images,
+                                    progress_container, "combined", image_dpi, output_options, fill_report
+                                )
+                            except ServerBusyError as e:
+                                st.error(f"⏳ {e}")
+                                st.stop()
+                        if output_bytes is None:
+                            st.error(f"Failed to generate combined PDF: {fill_report.last_error() or 'no fields could be filled'}")
+                            render_fill_report(fill_report, "batch")
+                            st.stop()
+                        generated_outputs[batch_output_key] = keep_output(
+                            batch_output_key, (output_bytes, download_filename, mime_type, "Combined Document", fill_report),
+                            len(output_bytes))
+
+                    if batch_fields and not combine_output and st.button("🚀 Generate All Documents", type="primary", key="batch_generate_btn"):
+                        progress_bar = st.progress(0.0)
+                        progress_container = st.empty()
+                        journal = open_batch_journal(
+                            batch_journal_key(source_file.path, file_extension, uploaded_images, image_dpi, output_options)
+                        )
+                        generated = 0
+                        reused = 0
+                        failed_rows = []
+                        fill_report = FillReport()
+                        row_outputs = []
+                        try:
+                            for row_number, row_data in enumerate(formatted_rows.to_dict('records'), start=1):
+                                row_hash = BatchJournal.row_hash(row_data)
+                                output_path = journal.output_path(row_hash) if reuse_finished else None
+                                if output_path is not None:
+                                    reused += 1
+                                else:
+                                    row_report = FillReport(record=row_number)
+                                    try:
+                                        output_bytes, _, _ = build_filled_document(
+                                            source_file, file_extension, row_data, uploaded_images,
+                                            progress_container, "batch", image_dpi, output_options, row_report
+                                        )
+                                        error = row_report.last_error() or "The template could not be filled with this row."
+                                    except ServerBusyError:
+                                        raise
+                                    except Exception as e:
+                                        output_bytes, error = None, str(e)
+                                        row_report.error(error)
+                                    fill_report.merge(row_report)
+                                    if output_bytes is not None:
+                                        output_path = journal.record_output(row_number, row_hash, output_bytes, file_extension)
+                                        generated += 1
+                                    else:
+                                        journal.record_error(row_number, row_hash, error)
+                                        failed_rows.append({'Row': row_number, 'Error': error})
+                                if output_path is not None:
+                                    label = row_data[name_column] if name_column in row_data else "row"
+                                    safe_label = re.sub(r'[^\w\-]+', '_', str(label)).strip('_')[:60] or "row"
+                                    row_outputs.append((f"{row_number:04d}_{safe_label}.{file_extension}", output_path))
+                                progress_bar.progress(row_number / len(formatted_rows))
+                        except ServerBusyError as e:
+                            st.error(f"⏳ {e} Finished rows are saved. Generate again to resume.")
+                            st.stop()
+                        finally:
+                            journal.close()
+                        progress_container.empty()
+
+                        zip_buffer = io.BytesIO()
+                        # Outputs are already compressed, so store them as-is in the ZIP
+                        with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_STORED) as zip_file:
+                            for archive_name, output_path in row_outputs:
+                                zip_file.write(output_path, archive_name)
+                        zip_bytes = zip_buffer.getvalue()
+                        generated_outputs[batch_output_key] = keep_output(
+                            batch_output_key, (zip_bytes, f"batch_{template_name.rsplit('.', 1)[0]}.zip", "application/zip",
+                                               f"{len(row_outputs)} Documents (ZIP)", fill_report), len(zip_bytes))
+                        reused_note = f" ({reused} reused from an earlier run)" if reused else ""
+                        st.success(f"✅ Generated {generated + reused} of {len(formatted_rows)} documents{reused_note}!")
+                        if failed_rows:
+                            st.warning(f"⚠️ {len(failed_rows)} rows failed. Fix them and generate again; finished rows are not regenerated.")
+                            st.dataframe(pd.DataFrame(failed_rows), use_container_width=True, hide_index=True)
+
+                    cached_output = session_cache_get(batch_output_key) or generated_outputs.get(batch_output_key)
+                    if cached_output:
+                        output_bytes, download_filename, mime_type, output_label, fill_report = cached_output
+                        st.download_button(
+                            label=f"📥 Download {output_label}",
+                            data=output_bytes,
+                            file_name=download_filename,
+                            mime=mime_type
+                        )
+                        render_fill_report(fill_report, "batch")
+
         elif source_file is not None:
             st.markdown('<div class="warning-box">', unsafe_allow_html=True)
             st.warning("⚠️ No {{field_name}} placeholders found in your template!")
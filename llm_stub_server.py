@@ -0,0 +1,108 @@
+"""
+Local stub of an OpenAI-compatible chat completions server, for trying and testing the
+app's streaming AI backend without a real model or network access.
+
+Every request gets a streamed reply shaped like a real assistant's: a line of prose, a
+fenced JSON object with a sample value for each field listed in the prompt, and a
+closing remark, sent a few characters per server-sent event.
+
+Usage:
+    python llm_stub_server.py
+    python llm_stub_server.py --port 8765 --delay 0.02 --chunk-size 4
+
+Then point the app at it in prompt_config.json:
+    "llm_backend": {
+        "type": "openai_compatible",
+        "name": "Local stub",
+        "url": "http://127.0.0.1:8765/v1/chat/completions",
+        "model": "stub"
+    }
+"""
+import argparse
+import json
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_PORT = 8765
+DEFAULT_DELAY_SECONDS = 0.02
+DEFAULT_CHUNK_SIZE = 4
+REPEATED_ROW_ITEMS = 2
+
+# generate_ai_prompt lists one field per "  - name" line
+FIELD_LINE_PATTERN = r'^  - ([^:\n]+)$'
+
+
+def sample_reply(prompt):
+    """Prose around a JSON object holding a sample value for every field in the prompt."""
+    values = {}
+    for field in re.findall(FIELD_LINE_PATTERN, prompt, re.MULTILINE):
+        if '.' in field:
+            # {{list.column}} spreadsheet rows take a list of objects under the list name
+            list_name, column = field.split('.', 1)
+            rows = values.setdefault(list_name, [{} for _ in range(REPEATED_ROW_ITEMS)])
+            for index, row in enumerate(rows, start=1):
+                row[column] = f"Sample {column} {index}"
+        else:
+            values[field] = f"Sample {field.replace('_', ' ')}"
+    return ("Here is the JSON for your template:\n```json\n" + json.dumps(values, indent=2)
+            + "\n```\nLet me know if any {field} needs changes.")
+
+
+def completion_chunk(text):
+    """One server-sent event in the OpenAI streaming format."""
+    payload = {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": text}}]}
+    return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    delay_seconds = DEFAULT_DELAY_SECONDS
+    chunk_size = DEFAULT_CHUNK_SIZE
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            prompt = request["messages"][-1]["content"]
+        except (ValueError, KeyError, IndexError, TypeError):
+            self.send_error(400, "Expected a chat completions request with at least one message")
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        reply = sample_reply(prompt)
+        for start in range(0, len(reply), self.chunk_size):
+            self.wfile.write(completion_chunk(reply[start:start + self.chunk_size]))
+            self.wfile.flush()
+            time.sleep(self.delay_seconds)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stub OpenAI-compatible streaming server for app.py")
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on")
+    parser.add_argument("--delay", type=float, default=DEFAULT_DELAY_SECONDS,
+                        help="Seconds between streamed chunks (simulates token latency)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Characters per streamed chunk")
+    args = parser.parse_args()
+
+    StubHandler.delay_seconds = args.delay
+    StubHandler.chunk_size = args.chunk_size
+    server = ThreadingHTTPServer((args.host, args.port), StubHandler)
+    print(f"Stub chat completions server on http://{args.host}:{args.port}/v1/chat/completions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
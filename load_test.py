@@ -0,0 +1,396 @@
+"""
+Concurrent-session load test for the Document AI Field Filler.
+
+Drives many simulated users through the real app flow in-process using Streamlit's
+app testing API (streamlit.testing.v1.AppTest), with sessions running in parallel
+threads the same way a Streamlit server runs them. For each concurrency level it
+reports p50/p95/p99 latency per step, throughput and peak RSS.
+
+Usage:
+    python load_test.py
+    python load_test.py --concurrency 1 4 16 --sessions 32 --json results.json
+    python load_test.py --json new.json --compare results.json
+
+The JSON output has a fixed schema so runs can be compared with --compare. The exit
+status is 1 when the single-session idle_app_work p50 (the app's own share of a no-op
+rerun, apart from Streamlit's element building) is over IDLE_APP_WORK_BUDGET_MS.
+"""
+import argparse
+import functools
+import inspect
+import json
+import math
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import streamlit
+from streamlit.delta_generator import DeltaGenerator
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from streamlit.runtime.scriptrunner import script_runner as script_runner_module
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+from streamlit.testing.v1 import AppTest
+from streamlit.testing.v1 import app_test as app_test_module
+from streamlit.testing.v1 import local_script_runner as local_script_runner_module
+
+# psutil gives live RSS sampling; without it we fall back to the process high-water mark
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py")
+DEFAULT_TEMPLATE = "templates/MFR Template.docx"
+DEFAULT_CONCURRENCY = [1, 2, 4, 8]
+IDLE_RERUNS = 5
+# Target for the app's own work in a no-op rerun on an analyzed template (p50, one
+# session): script time outside Streamlit commands. See measure_app_work.
+# Measured on a 1-CPU box: 8-10 ms before the per-rerun caching, 3.5-4 ms after.
+IDLE_APP_WORK_BUDGET_MS = 6
+SCRIPT_TIMEOUT_SECONDS = 120
+RSS_SAMPLE_SECONDS = 0.05
+PROJECT_DATA = (
+    "SSgt Jane Q. Doe, 100th Maintenance Squadron, led a 6-person team that rebuilt the "
+    "engine shop scheduling process, saving 1,200 man-hours and $85,000 in FY24."
+)
+
+# Steps in the order a session performs them
+STEPS = [
+    "load",
+    "select_and_analyze",
+    "idle_rerun",
+    "idle_app_work",
+    "enter_data",
+    "generate_prompt",
+    "paste_json",
+    "generate",
+    "manual_keystroke",
+]
+
+
+def share_script_cache():
+    """Make every simulated session reuse one compiled copy of app.py.
+
+    AppTest builds a new ScriptCache on every run, recompiling the script each time,
+    whereas a real Streamlit server compiles once and shares the bytecode between
+    sessions. Concurrent compiles also trip a CPython 3.11 bug in ast.parse.
+    The patched names are Streamlit internals, so fail loudly if they move.
+    """
+    for module in (app_test_module, local_script_runner_module):
+        if not hasattr(module, "ScriptCache"):
+            raise RuntimeError(
+                f"{module.__name__} has no ScriptCache in Streamlit {streamlit.__version__}; "
+                "share_script_cache() needs updating for this Streamlit version."
+            )
+    shared_cache = ScriptCache()
+    app_test_module.ScriptCache = lambda: shared_cache
+    local_script_runner_module.ScriptCache = lambda: shared_cache
+
+
+# Time spent inside Streamlit commands by the script run on this thread
+_streamlit_time = threading.local()
+# App work of the last script run requested from this (session) thread
+_last_run = threading.local()
+
+
+def time_streamlit_calls(func):
+    """Wrap a Streamlit command so its time (outermost call only) counts as Streamlit's."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if getattr(_streamlit_time, "depth", 0):
+            return func(*args, **kwargs)
+        _streamlit_time.depth = 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _streamlit_time.depth = 0
+            _streamlit_time.seconds = getattr(_streamlit_time, "seconds", 0.0) + time.perf_counter() - start
+    return wrapper
+
+
+def time_cache_decoration(decorator):
+    """Time an st.cache_* decorator, including the second step of @st.cache_*(...) forms."""
+    timed_decorator = time_streamlit_calls(decorator)
+
+    def wrapper(func, **kwargs):
+        decorated = timed_decorator(func, **kwargs)
+        return decorated if func is not None else time_streamlit_calls(decorated)
+    return wrapper
+
+
+def measure_app_work():
+    """Split every script run into Streamlit's own cost and the app's own work.
+
+    Each public st.* function, DeltaGenerator method and st.cache_* decoration is
+    wrapped to time its calls. A run's app work is the time spent executing app.py
+    minus those calls: the app's own code and the cached functions it calls, without
+    building, serializing and queueing elements or Streamlit's widget-state and
+    callback handling around the script. The result is handed to the session thread
+    that asked for the run (see run_session).
+    The patched names are Streamlit internals, so fail loudly if they move.
+    """
+    cache_apis = [streamlit.cache_data, streamlit.cache_resource]
+    if "exec(code, module.__dict__)" not in inspect.getsource(script_runner_module) or \
+            not all(hasattr(api, "_decorator") for api in cache_apis):
+        raise RuntimeError(
+            f"Streamlit {streamlit.__version__} moved its script runner or caching internals; "
+            "measure_app_work() needs updating for this Streamlit version."
+        )
+    for name, value in inspect.getmembers(streamlit):
+        if not name.startswith("_") and (inspect.isfunction(value) or inspect.ismethod(value)):
+            setattr(streamlit, name, time_streamlit_calls(value))
+    for name, value in inspect.getmembers(DeltaGenerator, inspect.isfunction):
+        if not name.startswith("_"):
+            setattr(DeltaGenerator, name, time_streamlit_calls(value))
+    # Declaring a cached function hashes its source on every rerun; that is Streamlit's cost
+    for api in cache_apis:
+        api._decorator = time_cache_decoration(api._decorator)
+
+    app_work = {}
+
+    def timed_exec(code, namespace):
+        _streamlit_time.seconds = 0.0
+        start = time.perf_counter()
+        try:
+            exec(code, namespace)
+        finally:
+            elapsed = time.perf_counter() - start - _streamlit_time.seconds
+            session_id = get_script_run_ctx().session_id
+            app_work[session_id] = app_work.get(session_id, 0.0) + elapsed
+
+    run_script = local_script_runner_module.LocalScriptRunner.run
+
+    def run_and_collect(self, *args, **kwargs):
+        try:
+            return run_script(self, *args, **kwargs)
+        finally:
+            _last_run.app_work = app_work.pop(self._session_id, 0.0)
+
+    # The script runner executes app.py with a bare exec(); shadow it in that module only
+    script_runner_module.exec = timed_exec
+    local_script_runner_module.LocalScriptRunner.run = run_and_collect
+
+
+def timed(step_times, step, action):
+    """Run action (an AppTest .run() chain) and record its latency under step."""
+    start = time.perf_counter()
+    app_test = action()
+    step_times.setdefault(step, []).append(time.perf_counter() - start)
+    if app_test is not None and app_test.exception:
+        raise RuntimeError(f"{step}: {app_test.exception[0].message}")
+    return app_test
+
+
+def run_session(template, keystrokes):
+    """Simulate one user: AI flow end to end, then typing into manual entry."""
+    step_times = {}
+    app_test = AppTest.from_file(APP_PATH, default_timeout=SCRIPT_TIMEOUT_SECONDS)
+
+    timed(step_times, "load", app_test.run)
+    timed(step_times, "select_and_analyze", lambda: app_test.selectbox[0].set_value(template).run())
+
+    fields = list(app_test.session_state["fields"])
+    if not fields:
+        raise RuntimeError(f"No fields found in {template}")
+
+    # Fixed per-rerun cost: nothing changes, so this is pure script overhead on an analyzed template
+    for _ in range(IDLE_RERUNS):
+        timed(step_times, "idle_rerun", app_test.run)
+        step_times.setdefault("idle_app_work", []).append(_last_run.app_work)
+
+    timed(step_times, "enter_data", lambda: app_test.text_area[0].input(PROJECT_DATA).run())
+    timed(step_times, "generate_prompt", lambda: app_test.button(key="ai_prompt_btn").click().run())
+
+    ai_response = "Here is the JSON:\n" + json.dumps({field: f"Value for {field}" for field in fields})
+    timed(step_times, "paste_json", lambda: app_test.text_area[1].input(ai_response).run())
+    timed(step_times, "generate", lambda: app_test.button(key="ai_generate_btn").click().run())
+
+    # Manual entry reruns the whole script on every committed keystroke
+    manual_key = f"manual_field_{fields[0]}_1"
+    typed = ""
+    for index in range(keystrokes):
+        typed += "abcdefghijklmnopqrstuvwxyz"[index % 26]
+        timed(step_times, "manual_keystroke", lambda: app_test.text_input(key=manual_key).input(typed).run())
+
+    return step_times
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    # Round away float noise first (0.95 * 20 is 19.000000000000004, which would ceil to 20)
+    rank = math.ceil(round(fraction * len(sorted_values), 9))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+class RssSampler:
+    """Samples this process's resident memory in the background and keeps the peak."""
+
+    def __init__(self):
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        if psutil is not None:
+            process = psutil.Process()
+            self.peak_bytes = process.memory_info().rss
+
+            def sample():
+                while not self._stop.wait(RSS_SAMPLE_SECONDS):
+                    self.peak_bytes = max(self.peak_bytes, process.memory_info().rss)
+
+            self._thread = threading.Thread(target=sample, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            # ru_maxrss is in KB on Linux (bytes on macOS) and covers the whole process lifetime
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            self.peak_bytes = max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def run_level(concurrency, sessions, template, keystrokes):
+    """Run `sessions` simulated users with `concurrency` of them active at once."""
+    all_step_times = {}
+    errors = []
+    start = time.perf_counter()
+    with RssSampler() as rss, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(run_session, template, keystrokes) for _ in range(sessions)]
+        for future in as_completed(futures):
+            try:
+                for step, times in future.result().items():
+                    all_step_times.setdefault(step, []).extend(times)
+            except Exception as e:
+                errors.append(str(e))
+    wall_seconds = time.perf_counter() - start
+
+    steps = {}
+    for step in STEPS:
+        times = sorted(all_step_times.get(step, []))
+        steps[step] = {
+            "count": len(times),
+            "p50_ms": round(percentile(times, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(times, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(times, 0.99) * 1000, 2),
+        }
+
+    completed = sessions - len(errors)
+    return {
+        "concurrency": concurrency,
+        "sessions": sessions,
+        "completed": completed,
+        "errors": errors,
+        "wall_seconds": round(wall_seconds, 3),
+        "sessions_per_second": round(completed / wall_seconds, 3) if wall_seconds else 0.0,
+        "reruns_per_second": round(sum(stats["count"] for step, stats in steps.items() if step != "idle_app_work")
+                                   / wall_seconds, 2) if wall_seconds else 0.0,
+        "peak_rss_mb": round(rss.peak_bytes / (1024 * 1024), 1),
+        "steps": steps,
+    }
+
+
+def print_level(result):
+    print(f"\n=== Concurrency {result['concurrency']}: {result['completed']}/{result['sessions']} sessions "
+          f"in {result['wall_seconds']:.2f}s ({result['sessions_per_second']:.2f} sessions/s, "
+          f"{result['reruns_per_second']:.1f} reruns/s), peak RSS {result['peak_rss_mb']:.0f} MB")
+    print(f"  {'step':<20}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for step, stats in result["steps"].items():
+        print(f"  {step:<20}{stats['count']:>7}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    for error in result["errors"][:5]:
+        print(f"  ! {error}")
+    if result["concurrency"] == 1:
+        app_work_p50 = result["steps"]["idle_app_work"]["p50_ms"]
+        verdict = "within" if app_work_p50 <= IDLE_APP_WORK_BUDGET_MS else "OVER"
+        print(f"  idle_app_work p50 {app_work_p50:.1f} ms is {verdict} the {IDLE_APP_WORK_BUDGET_MS} ms budget")
+
+
+def over_budget(results):
+    """True if a single-session level missed the idle app work budget."""
+    return any(level["concurrency"] == 1 and level["steps"]["idle_app_work"]["p50_ms"] > IDLE_APP_WORK_BUDGET_MS
+               for level in results["levels"])
+
+
+def print_comparison(results, baseline):
+    """Show p95 change per step against a previous run at matching concurrency levels."""
+    baseline_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    print("\n=== p95 change vs baseline (positive = slower)")
+    for level in results["levels"]:
+        previous = baseline_levels.get(level["concurrency"])
+        if previous is None:
+            continue
+        changes = []
+        for step, stats in level["steps"].items():
+            old_p95 = previous["steps"].get(step, {}).get("p95_ms")
+            if old_p95:
+                changes.append(f"{step} {100 * (stats['p95_ms'] - old_p95) / old_p95:+.0f}%")
+        rss_change = level["peak_rss_mb"] - previous["peak_rss_mb"]
+        print(f"  c={level['concurrency']}: " + ", ".join(changes) + f", peak RSS {rss_change:+.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for app.py")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=DEFAULT_CONCURRENCY,
+                        help="Concurrency levels to run, in order")
+    parser.add_argument("--sessions", type=int, default=None,
+                        help="Sessions per level (default: 2x the concurrency level)")
+    parser.add_argument("--template", default=DEFAULT_TEMPLATE, help="Bundled template to select")
+    parser.add_argument("--keystrokes", type=int, default=20, help="Manual-entry keystrokes per session")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    parser.add_argument("--compare", dest="baseline_path", help="Compare against a previous JSON result")
+    args = parser.parse_args()
+
+    # The app resolves templates/ and banner.png relative to the working directory
+    os.chdir(os.path.dirname(APP_PATH))
+    share_script_cache()
+    measure_app_work()
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "template": args.template,
+            "keystrokes": args.keystrokes,
+            "python": platform.python_version(),
+            "streamlit": streamlit.__version__,
+            "cpu_count": os.cpu_count(),
+            "platform": platform.platform(),
+            "idle_app_work_budget_ms": IDLE_APP_WORK_BUDGET_MS,
+        },
+        "levels": [],
+    }
+
+    # Warm-up session so imports and process-level caches don't skew the first level
+    run_session(args.template, 1)
+
+    for concurrency in args.concurrency:
+        sessions = args.sessions or concurrency * 2
+        result = run_level(concurrency, sessions, args.template, args.keystrokes)
+        results["levels"].append(result)
+        print_level(result)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.json_path}")
+
+    if args.baseline_path:
+        with open(args.baseline_path, "r", encoding="utf-8") as f:
+            print_comparison(results, json.load(f))
+
+    if over_budget(results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
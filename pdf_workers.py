@@ -0,0 +1,133 @@
+"""
+PDF page-level workers for the Document AI Field Filler.
+
+Pure PyMuPDF helpers with no Streamlit dependency. app.py calls them inline for
+normal documents and submits them to a process pool for very large PDFs, where each
+worker opens the same source file read-only and handles its own page range.
+"""
+import functools
+import math
+import re
+
+import fitz  # PyMuPDF
+
+FIELD_PATTERN = r'\{\{([^}]+)\}\}'
+
+
+@functools.lru_cache(maxsize=None)
+def get_pdf_font(fontname):
+    """Return a cached PyMuPDF Font object for a Base-14 font name."""
+    return fitz.Font(fontname)
+
+def match_pdf_font(span_font, span_flags):
+    """(NEW) Pick the Base-14 font closest to a text span's original font.
+
+    Embedded template fonts are usually subsets that lack the glyphs needed for new
+    text, so we match family (sans/serif/mono) and bold/italic from the span instead.
+    """
+    name = span_font.lower()
+    bold = bool(span_flags & 16) or 'bold' in name or 'black' in name or 'heavy' in name
+    italic = bool(span_flags & 2) or 'italic' in name or 'oblique' in name
+
+    if span_flags & 8 or 'courier' in name or 'mono' in name or 'consolas' in name:
+        family = ('cour', 'cobo', 'coit', 'cobi')
+    elif 'times' in name or 'georgia' in name or 'garamond' in name or (span_flags & 4 and 'sans' not in name):
+        family = ('tiro', 'tibo', 'tiit', 'tibi')
+    else:
+        family = ('helv', 'hebo', 'heit', 'hebi')
+    return family[bold + 2 * italic]
+
+def rewrite_pdf_page_text(page, data):
+    """(NEW) Replace {{field}} text on one PDF page in a single batched operation.
+
+    All affected spans are collected first, removed with one redaction pass, and the
+    replacement text is laid out through one TextWriter per text color using cached
+    fonts matched to the original span font and size. The page content is then
+    written once instead of appending a fragment per span.
+    Returns the number of spans rewritten.
+    """
+    replacements = []
+    for block in page.get_text("dict")["blocks"]:
+        for line in block.get("lines", []):
+            for span in line["spans"]:
+                text = span.get("text", "")
+                if "{{" not in text:
+                    continue
+                modified_text = text
+                for field, value in data.items():
+                    placeholder = f"{{{{{field}}}}}"
+                    if placeholder in modified_text:
+                        modified_text = modified_text.replace(placeholder, str(value))
+                if modified_text != text:
+                    replacements.append((span, modified_text))
+
+    if not replacements:
+        return 0
+
+    for span, _ in replacements:
+        page.add_redact_annot(fitz.Rect(span["bbox"]))
+    page.apply_redactions(images=fitz.PDF_REDACT_IMAGE_NONE, graphics=fitz.PDF_REDACT_LINE_ART_NONE)
+
+    writers = {}
+    for span, modified_text in replacements:
+        color = fitz.sRGB_to_pdf(span.get("color", 0))
+        if color not in writers:
+            writers[color] = fitz.TextWriter(page.rect, color=color)
+        writers[color].append(
+            span["origin"],
+            modified_text,
+            font=get_pdf_font(match_pdf_font(span.get("font", ""), span.get("flags", 0))),
+            fontsize=span.get("size", 12)
+        )
+    for writer in writers.values():
+        writer.write_text(page)
+
+    return len(replacements)
+
+def split_page_ranges(page_count, chunks):
+    """Split pages into at most `chunks` contiguous (start, end) ranges."""
+    chunk_size = max(1, math.ceil(page_count / max(1, chunks)))
+    return [(start, min(start + chunk_size, page_count)) for start in range(0, page_count, chunk_size)]
+
+def open_pdf(source_path, password=None):
+    """Open a PDF read-only from disk, authenticating if it is encrypted."""
+    pdf_document = fitz.open(source_path)
+    if pdf_document.needs_pass and not pdf_document.authenticate(password or ""):
+        pdf_document.close()
+        raise ValueError("Could not authenticate PDF")
+    return pdf_document
+
+def analyze_page_range(source_path, start, end, password=None):
+    """Find {{field}} text on pages [start, end). Returns location dicts in page order."""
+    field_locations = []
+    with open_pdf(source_path, password) as pdf_document:
+        for page_num in range(start, end):
+            text_content = pdf_document.load_page(page_num).get_text()
+            for field in re.findall(FIELD_PATTERN, text_content):
+                field_locations.append({
+                    'field': field,
+                    'page': page_num + 1,
+                    'type': 'text',
+                    'context': text_content[:100] + '...' if len(text_content) > 100 else text_content
+                })
+    return field_locations
+
+def fill_page_range(source_path, start, end, data, password=None):
+    """Rewrite {{field}} text on pages [start, end) and return just those pages as a PDF.
+
+    Returns (pdf_bytes, replacements, errors). The output is unencrypted so the
+    parts can be merged back together in page order.
+    """
+    replacements = 0
+    errors = []
+    with open_pdf(source_path, password) as pdf_document:
+        for page_num in range(start, end):
+            try:
+                replacements += rewrite_pdf_page_text(pdf_document.load_page(page_num), data)
+            except Exception as text_error:
+                errors.append(f"Could not replace text on page {page_num + 1}: {text_error}")
+        pdf_document.select(list(range(start, end)))
+        if replacements:
+            pdf_document.subset_fonts()
+        pdf_bytes = pdf_document.tobytes(garbage=3, deflate=True, encryption=fitz.PDF_ENCRYPT_NONE)
+    return pdf_bytes, replacements, errors
@@ -0,0 +1,51 @@
+import io
+from unittest import mock
+
+import docx
+import pytest
+
+import app
+
+DUPLICATE_RESPONSE = 'Here you go:\n```json\n{"name": "First", "title": "Engineer", "name": "Last"}\n```'
+
+
+def build_word_template():
+    document = docx.Document()
+    document.add_paragraph("Name: {{name}}")
+    document.add_paragraph("Title: {{title}}")
+    buffer = io.BytesIO()
+    document.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def paragraph_texts(document_bytes):
+    return [paragraph.text for paragraph in docx.Document(io.BytesIO(document_bytes)).paragraphs]
+
+
+def test_pasted_response_keeps_last_duplicate_value():
+    fields, _ = app.extract_json_fields(DUPLICATE_RESPONSE)
+    assert fields == {"name": "Last", "title": "Engineer"}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, len(DUPLICATE_RESPONSE)])
+def test_streamed_response_keeps_last_duplicate_value(chunk_size):
+    stream = app.JsonFieldStream()
+    pairs = []
+    for start in range(0, len(DUPLICATE_RESPONSE), chunk_size):
+        pairs.extend(stream.feed(DUPLICATE_RESPONSE[start:start + chunk_size]))
+    assert pairs == [("name", "First"), ("title", "Engineer"), ("name", "Last")]
+    assert stream.fields == {"name": "Last", "title": "Engineer"}
+
+
+def test_streamed_fill_matches_pasted_fill_for_duplicate_keys():
+    stream = app.JsonFieldStream()
+    plan = app.FillPlan(build_word_template(), 'docx')
+    for field, value in stream.feed(DUPLICATE_RESPONSE):
+        plan.apply({field: value})
+    streamed_bytes, _, _ = plan.finish(mock.MagicMock())
+
+    fields, _ = app.extract_json_fields(DUPLICATE_RESPONSE)
+    pasted_bytes, _, _ = app.build_filled_document(build_word_template(), 'docx', fields, None, mock.MagicMock())
+
+    assert paragraph_texts(streamed_bytes) == paragraph_texts(pasted_bytes) == ["Name: Last", "Title: Engineer"]
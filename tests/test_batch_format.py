@@ -0,0 +1,25 @@
+import pandas as pd
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("$1,234.50", "$1,234.50"),
+    ("1234.5", "$1,234.50"),
+    (" 12 ", "$12.00"),
+    ("-$5", "-$5.00"),
+    ("(3.00)", "-$3.00"),
+    ("$(1,000)", "-$1,000.00"),
+])
+def test_currency_amounts_are_formatted(raw, expected):
+    formatted, issues = app.format_batch_rows(pd.DataFrame({"amount": [raw]}), {"amount": {"type": "currency"}})
+    assert formatted["amount"].tolist() == [expected]
+    assert issues.empty
+
+
+@pytest.mark.parametrize("raw", ["1e3", "€1.234,56", "1,23", "12 apples", "(-3)", "(3.00"])
+def test_ambiguous_currency_values_are_reported_not_guessed(raw):
+    formatted, issues = app.format_batch_rows(pd.DataFrame({"amount": [raw]}), {"amount": {"type": "currency"}})
+    assert formatted["amount"].tolist() == [raw.strip()]
+    assert issues[["Row", "Field", "Value", "Problem"]].values.tolist() == [[1, "amount", raw, "Not a valid amount"]]
@@ -0,0 +1,79 @@
+import json
+import os
+
+import pytest
+
+import app
+
+ROWS = [{"name": "Ada"}, {"name": "Grace"}, {"name": "Linus"}]
+
+
+@pytest.fixture
+def journal_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, "BATCH_JOURNAL_DIR", str(tmp_path / "batches"))
+    app.get_batch_journal_dir.clear()
+    yield tmp_path / "batches"
+    app.get_batch_journal_dir.clear()
+
+
+def journal_key(**output_options):
+    return app.batch_journal_key("/store/abc.docx", 'docx', {}, 150, output_options)
+
+
+def test_resumed_batch_skips_finished_rows_and_refills_edited_ones(journal_dir):
+    journal = app.open_batch_journal(journal_key())
+    hashes = [app.BatchJournal.row_hash(row) for row in ROWS]
+    journal.record_output(1, hashes[0], b"first output", 'docx')
+    journal.record_error(2, hashes[1], "Bad date")
+    journal.close()
+
+    resumed = app.open_batch_journal(journal_key())
+    with open(resumed.output_path(hashes[0]), 'rb') as f:
+        assert f.read() == b"first output"
+    assert resumed.output_path(hashes[1]) is None
+    assert resumed.errors == {hashes[1]: "Bad date"}
+    assert resumed.output_path(hashes[2]) is None
+    assert resumed.output_path(app.BatchJournal.row_hash({"name": "Ada L."})) is None
+    resumed.close()
+
+
+def test_torn_last_line_is_ignored_and_the_next_entry_starts_cleanly(journal_dir):
+    journal = app.open_batch_journal(journal_key())
+    row_hash = app.BatchJournal.row_hash(ROWS[0])
+    journal.record_output(1, row_hash, b"first output", 'docx')
+    journal.close()
+    with open(journal.path, 'a', encoding='utf-8') as f:
+        f.write('{"row":2,"hash":"torn')
+
+    resumed = app.open_batch_journal(journal_key())
+    assert resumed.output_path(row_hash) is not None
+    second_hash = app.BatchJournal.row_hash(ROWS[1])
+    resumed.record_output(2, second_hash, b"second output", 'docx')
+    resumed.close()
+
+    with open(journal.path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    assert json.loads(lines[-1])['hash'] == second_hash
+    assert app.open_batch_journal(journal_key()).output_path(second_hash) is not None
+
+
+def test_changed_settings_start_a_new_journal(journal_dir):
+    row_hash = app.BatchJournal.row_hash(ROWS[0])
+    journal = app.open_batch_journal(journal_key(compression_level=6))
+    journal.record_output(1, row_hash, b"output", 'docx')
+    journal.close()
+
+    assert journal_key(compression_level=6) != journal_key(compression_level=9)
+    assert app.open_batch_journal(journal_key(compression_level=9)).output_path(row_hash) is None
+    assert app.open_batch_journal(journal_key(compression_level=6)).output_path(row_hash) is not None
+
+
+@pytest.mark.skipif(not hasattr(os, 'getuid'), reason="POSIX permissions")
+def test_journal_is_private(journal_dir):
+    journal = app.open_batch_journal(journal_key())
+    path = journal.record_output(1, app.BatchJournal.row_hash(ROWS[0]), b"output", 'docx')
+    journal.close()
+    assert os.stat(journal_dir).st_mode & 0o777 == 0o700
+    assert os.stat(journal.directory).st_mode & 0o777 == 0o700
+    assert os.stat(journal.path).st_mode & 0o777 == 0o600
+    assert os.stat(path).st_mode & 0o777 == 0o600
@@ -0,0 +1,58 @@
+import io
+from unittest import mock
+
+import docx
+import fitz
+import pytest
+from pptx import Presentation
+from pptx.util import Inches
+
+import app
+
+RECORDS = [{"name": "Ada"}, {"name": "Grace"}, {"name": "Linus"}]
+
+
+def build_template(extension):
+    buffer = io.BytesIO()
+    if extension == 'docx':
+        document = docx.Document()
+        document.add_paragraph("Name: {{name}}")
+        document.save(buffer)
+    elif extension == 'pptx':
+        presentation = Presentation()
+        slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+        slide.shapes.add_textbox(Inches(1), Inches(1), Inches(4), Inches(1)).text_frame.text = "Name: {{name}}"
+        presentation.save(buffer)
+    else:
+        document = fitz.open()
+        document.new_page().insert_text((72, 72), "Name: {{name}}")
+        buffer.write(document.tobytes())
+    buffer.seek(0)
+    return buffer
+
+
+def record_texts(output_bytes, extension):
+    """The filled text of each record's copy, in order."""
+    if extension == 'docx':
+        return [paragraph.text for paragraph in docx.Document(io.BytesIO(output_bytes)).paragraphs if paragraph.text]
+    if extension == 'pptx':
+        return [shape.text_frame.text for slide in Presentation(io.BytesIO(output_bytes)).slides
+                for shape in slide.shapes if shape.has_text_frame]
+    with fitz.open(stream=output_bytes, filetype="pdf") as document:
+        return [page.get_text().strip() for page in document]
+
+
+@pytest.mark.parametrize("extension", ['docx', 'pptx', 'pdf'])
+def test_combined_output_has_one_filled_copy_per_record(extension):
+    output_bytes, download_filename, mime_type = app.build_combined_document(
+        build_template(extension), extension, RECORDS, None, mock.MagicMock())
+
+    assert download_filename.endswith(f".{extension}")
+    assert mime_type == app.OUTPUT_MIME_TYPES[extension]
+    assert record_texts(output_bytes, extension) == ["Name: Ada", "Name: Grace", "Name: Linus"]
+
+
+@pytest.mark.parametrize("extension", ['docx', 'pptx', 'pdf'])
+def test_combined_output_without_records_is_rejected(extension):
+    with pytest.raises(ValueError, match="at least one record"):
+        app.build_combined_document(build_template(extension), extension, [], None, mock.MagicMock())
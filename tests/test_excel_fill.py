@@ -0,0 +1,61 @@
+import io
+import zipfile
+
+import openpyxl
+
+import app
+
+
+def build_workbook():
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["Item", "Cost"])
+    sheet.append(["{{items.name}}", "{{items.cost}}"])
+    sheet.append(["Total", "=SUM(B2:B2)"])
+    sheet.append(["Prepared by", "{{author}}"])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def fill(data):
+    filled_bytes, _ = app.fill_excel_with_data(io.BytesIO(build_workbook()), data)
+    return openpyxl.load_workbook(io.BytesIO(filled_bytes)).active
+
+
+def test_list_rows_repeat_and_ranges_follow():
+    sheet = fill({"items": [{"name": "Bolts", "cost": 3}, {"name": "Nuts", "cost": 2}], "author": "Sam"})
+    assert [[cell.value for cell in row] for row in sheet.iter_rows()] == [
+        ["Item", "Cost"], ["Bolts", 3], ["Nuts", 2], ["Total", "=SUM(B2:B3)"], ["Prepared by", "Sam"]]
+
+
+def test_empty_list_keeps_one_blank_row():
+    sheet = fill({"items": [], "author": "Sam"})
+    assert [[cell.value for cell in row] for row in sheet.iter_rows()] == [
+        ["Item", "Cost"], ["", ""], ["Total", "=SUM(B2:B2)"], ["Prepared by", "Sam"]]
+
+
+def test_formulas_above_a_repeated_row_follow_it():
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.append(["Total", "=SUM(B3:B3)", "=B5"])
+    sheet.append(["Item", "Cost"])
+    sheet.append(["{{items.name}}", "{{items.cost}}"])
+    sheet.append([])
+    sheet.append(["Note", "{{author}}"])
+    buffer = io.BytesIO()
+    workbook.save(buffer)
+    items = [{"name": "Bolts", "cost": 3}, {"name": "Nuts", "cost": 2}, {"name": "Washers", "cost": 1}]
+
+    filled_bytes, _ = app.fill_excel_with_data(io.BytesIO(buffer.getvalue()), {"items": items, "author": "Sam"})
+    filled = openpyxl.load_workbook(io.BytesIO(filled_bytes)).active
+
+    assert [filled["B1"].value, filled["C1"].value] == ["=SUM(B3:B5)", "=B7"]
+    assert filled["B7"].value == "Sam"
+
+
+def test_streamed_rows_do_not_redeclare_namespaces():
+    filled_bytes, _ = app.fill_excel_with_data(io.BytesIO(build_workbook()), {"items": [{"name": "Bolts", "cost": 3}]})
+    with zipfile.ZipFile(io.BytesIO(filled_bytes)) as package:
+        sheet_xml = package.read('xl/worksheets/sheet1.xml')
+    assert sheet_xml.count(b'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"') == 1
@@ -0,0 +1,93 @@
+import io
+from unittest import mock
+
+import docx
+import fitz
+from pptx import Presentation
+from pptx.util import Inches
+
+import app
+
+DATA = {"name": "Ada", "unused": "Nobody asked"}
+
+
+def outcomes(report):
+    return {(entry['status'], entry['field']) for entry in report.entries}
+
+
+def fill(source_file, extension):
+    report = app.FillReport()
+    output_bytes, _, _ = app.build_filled_document(source_file, extension, DATA, None, mock.MagicMock(), report=report)
+    return output_bytes, report
+
+
+def test_docx_fill_reports_each_field():
+    document = docx.Document()
+    document.add_paragraph("Name: {{name}}, title: {{title}}")
+    document.sections[0].header.paragraphs[0].text = "Prepared for {{name}}"
+    buffer = io.BytesIO()
+    document.save(buffer)
+
+    output_bytes, report = fill(buffer, 'docx')
+
+    assert outcomes(report) == {('filled', 'name'), ('skipped', 'unused'), ('unmatched', 'title')}
+    assert report.totals['replacements'] == 2
+    assert report.status_counts['filled'] == 1
+    assert docx.Document(io.BytesIO(output_bytes)).paragraphs[0].text == "Name: Ada, title: {{title}}"
+
+
+def test_docx_fill_problems_go_to_the_report(monkeypatch):
+    document = docx.Document()
+    document.add_paragraph("{{name}}")
+    monkeypatch.setattr(app, "fill_word_story_parts", mock.Mock(side_effect=RuntimeError("broken footer")))
+    report = app.FillReport()
+
+    with mock.patch.object(app.st, "error") as page_error, mock.patch.object(app.st, "warning") as page_warning:
+        assert app.fill_word_text(document, DATA, report) == 1
+
+    page_error.assert_not_called()
+    page_warning.assert_not_called()
+    assert report.last_error() == "Error filling headers/footers: broken footer"
+
+
+def test_pptx_fill_reports_each_field():
+    presentation = Presentation()
+    slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+    slide.shapes.add_textbox(Inches(1), Inches(1), Inches(4), Inches(1)).text_frame.text = "{{name}} / {{title}}"
+    buffer = io.BytesIO()
+    presentation.save(buffer)
+
+    _, report = fill(buffer, 'pptx')
+
+    assert outcomes(report) == {('filled', 'name'), ('skipped', 'unused'), ('unmatched', 'title')}
+    assert report.totals['replacements'] == 1
+
+
+def test_pdf_form_fill_reports_each_field():
+    document = fitz.open()
+    page = document.new_page()
+    for index, field_name in enumerate(["name", "title"]):
+        widget = fitz.Widget()
+        widget.field_type = fitz.PDF_WIDGET_TYPE_TEXT
+        widget.field_name = field_name
+        widget.rect = fitz.Rect(72, 72 + index * 40, 300, 96 + index * 40)
+        page.add_widget(widget)
+
+    _, report = fill(io.BytesIO(document.tobytes()), 'pdf')
+
+    assert outcomes(report) == {('filled', 'name'), ('skipped', 'unused'), ('unmatched', 'title')}
+    assert report.totals['form_fields'] == 2
+
+
+def test_combined_docx_reports_fields_per_record():
+    document = docx.Document()
+    document.add_paragraph("{{name}}")
+    buffer = io.BytesIO()
+    document.save(buffer)
+    report = app.FillReport()
+
+    app.build_combined_document(buffer, 'docx', [{"name": "Ada"}, {"other": "x"}], None, mock.MagicMock(),
+                                report=report)
+
+    assert {(entry['record'], entry['status'], entry['field']) for entry in report.entries} == {
+        (1, 'filled', 'name'), (2, 'skipped', 'other'), (2, 'unmatched', 'name')}
@@ -0,0 +1,30 @@
+import pytest
+
+from load_test import IDLE_APP_WORK_BUDGET_MS, over_budget, percentile
+
+
+@pytest.mark.parametrize("values, fraction, expected", [
+    ([1, 2, 3, 4], 0.50, 2),
+    ([1, 2, 3, 4], 0.75, 3),
+    ([1, 2, 3, 4, 5], 0.50, 3),
+    (list(range(1, 21)), 0.95, 19),
+    (list(range(1, 101)), 0.99, 99),
+    ([7], 0.99, 7),
+    ([1, 2, 3], 1.0, 3),
+    ([1, 2, 3], 0.0, 1),
+])
+def test_percentile_is_nearest_rank(values, fraction, expected):
+    assert percentile(values, fraction) == expected
+
+
+def test_percentile_of_no_samples_is_zero():
+    assert percentile([], 0.5) == 0.0
+
+
+def level(concurrency, app_work_p50_ms):
+    return {"concurrency": concurrency, "steps": {"idle_app_work": {"p50_ms": app_work_p50_ms}}}
+
+
+def test_idle_app_work_budget_applies_to_the_single_session_level():
+    assert not over_budget({"levels": [level(1, IDLE_APP_WORK_BUDGET_MS), level(4, IDLE_APP_WORK_BUDGET_MS * 4)]})
+    assert over_budget({"levels": [level(1, IDLE_APP_WORK_BUDGET_MS + 1)]})
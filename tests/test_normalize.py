@@ -0,0 +1,57 @@
+import io
+import zipfile
+
+import docx
+
+import app
+
+
+def build_word_template(*paragraph_runs):
+    document = docx.Document()
+    for runs in paragraph_runs:
+        paragraph = document.add_paragraph()
+        for text in runs:
+            paragraph.add_run(text)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def test_split_placeholder_is_repaired():
+    template = build_word_template(["Name: {{na", "me}}"], ["Title: {{title}}"])
+    normalized_bytes, splits_repaired = app.normalize_template_runs(template, 'docx')
+    assert splits_repaired == 1
+    paragraphs = docx.Document(io.BytesIO(normalized_bytes)).paragraphs
+    assert [[run.text for run in paragraph.runs] for paragraph in paragraphs] == [["Name: {{name}}"], ["Title: {{title}}"]]
+
+
+def test_parts_without_split_placeholders_are_left_as_they_are():
+    template = build_word_template(["Name: ", "{{name}}"], ["Title: {{title}}"])
+    normalized_bytes, splits_repaired = app.normalize_template_runs(template, 'docx')
+    assert splits_repaired == 0
+    with zipfile.ZipFile(template) as original, zipfile.ZipFile(io.BytesIO(normalized_bytes)) as normalized:
+        assert normalized.read('word/document.xml') == original.read('word/document.xml')
+
+
+def test_streaming_scan_flags_the_parts_to_normalize():
+    template = build_word_template(["Name: {{na", "me}}"])
+    split_parts = set()
+    fields, _ = app.scan_ooxml_fields_streaming(template, 'docx', split_parts)
+    assert fields == ["name"]
+    assert split_parts == {'word/document.xml'}
+
+
+def test_only_flagged_parts_are_parsed(monkeypatch):
+    template = build_word_template(["Name: {{na", "me}}"])
+    parsed = []
+    normalize_paragraph = app._normalize_paragraph_runs
+    monkeypatch.setattr(app, "_normalize_paragraph_runs",
+                        lambda paragraph, tags: parsed.append(paragraph) or normalize_paragraph(paragraph, tags))
+
+    normalized_bytes, splits_repaired = app.normalize_template_runs(template, 'docx', split_parts=set())
+
+    assert (splits_repaired, parsed) == (0, [])
+    with zipfile.ZipFile(template) as original, zipfile.ZipFile(io.BytesIO(normalized_bytes)) as normalized:
+        assert {name: normalized.read(name) for name in normalized.namelist()} == \
+            {name: original.read(name) for name in original.namelist()}
@@ -0,0 +1,77 @@
+import io
+import zipfile
+
+from PIL import Image
+
+import app
+
+RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" Target="media/image1.jpeg"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" Target="media/image2.jpeg"/>'
+    '</Relationships>'
+)
+CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/word/media/image2.jpeg" ContentType="image/jpeg"/>'
+    '</Types>'
+)
+
+
+def jpeg_bytes(size, quality):
+    image = Image.new("RGB", size)
+    image.putdata([(x * 7 % 256, y * 13 % 256, (x * y) % 256) for y in range(size[1]) for x in range(size[0])])
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+def build_package(media):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as package:
+        package.writestr('[Content_Types].xml', CONTENT_TYPES)
+        package.writestr('word/document.xml', '<document>' + 'text ' * 2000 + '</document>')
+        package.writestr('word/_rels/document.xml.rels', RELS)
+        for name, data in media.items():
+            package.writestr(f'word/media/{name}', data)
+    return buffer.getvalue()
+
+
+def test_duplicate_media_is_stored_once():
+    photo = jpeg_bytes((64, 64), 90)
+    optimized, stats = app.optimize_ooxml_output(build_package({'image1.jpeg': photo, 'image2.jpeg': photo}))
+
+    assert stats['duplicates_removed'] == 1
+    with zipfile.ZipFile(io.BytesIO(optimized)) as package:
+        assert 'word/media/image2.jpeg' not in package.namelist()
+        rels = package.read('word/_rels/document.xml.rels').decode()
+        assert rels.count('Target="media/image1.jpeg"') == 2
+        assert '/word/media/image2.jpeg' not in package.read('[Content_Types].xml').decode()
+
+
+def test_only_images_over_the_size_limit_are_recompressed():
+    large = jpeg_bytes((400, 400), 100)
+    small = jpeg_bytes((16, 16), 100)
+    optimized, stats = app.optimize_ooxml_output(build_package({'image1.jpeg': large, 'image2.jpeg': small}),
+                                                 recompress_images=True, max_image_bytes=len(small) + 1)
+
+    assert stats['images_recompressed'] == 1
+    with zipfile.ZipFile(io.BytesIO(optimized)) as package:
+        assert len(package.read('word/media/image1.jpeg')) < len(large)
+        assert package.read('word/media/image2.jpeg') == small
+
+
+def test_compression_level_applies_to_xml_but_not_media():
+    package_bytes = build_package({'image1.jpeg': jpeg_bytes((32, 32), 90)})
+    stored, _ = app.optimize_ooxml_output(package_bytes, compression_level=0)
+    deflated, _ = app.optimize_ooxml_output(package_bytes, compression_level=9)
+
+    with zipfile.ZipFile(io.BytesIO(stored)) as package:
+        assert package.getinfo('word/document.xml').compress_type == zipfile.ZIP_STORED
+    with zipfile.ZipFile(io.BytesIO(deflated)) as package:
+        assert package.getinfo('word/document.xml').compress_type == zipfile.ZIP_DEFLATED
+        assert package.getinfo('word/media/image1.jpeg').compress_type == zipfile.ZIP_STORED
+    assert len(deflated) < len(stored)
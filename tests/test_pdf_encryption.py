@@ -0,0 +1,51 @@
+import fitz
+
+import app
+
+USER_PASSWORD = "secret"
+OWNER_PASSWORD = "boss"
+PERMISSIONS = fitz.PDF_PERM_PRINT | fitz.PDF_PERM_ACCESSIBILITY
+
+
+def build_encrypted_pdf():
+    document = fitz.open()
+    document.new_page().insert_text((72, 72), "Hello {{name}}")
+    return document.tobytes(encryption=fitz.PDF_ENCRYPT_AES_256, permissions=PERMISSIONS,
+                            user_pw=USER_PASSWORD, owner_pw=OWNER_PASSWORD)
+
+
+def refill(password):
+    """Decrypt with password, then re-save the plain copy the way a filled output is saved."""
+    template_path = app.get_template_store().add_bytes(build_encrypted_pdf(), 'pdf')
+    plain_path, encryption = app.decrypt_pdf_template(template_path, password)
+    with open(plain_path, 'rb') as plain_file:
+        output_bytes, _ = app.optimize_pdf_output(plain_file.read(), encryption=encryption)
+    return encryption, fitz.open(stream=output_bytes, filetype="pdf")
+
+
+def test_wrong_password_is_rejected():
+    template_path = app.get_template_store().add_bytes(build_encrypted_pdf(), 'pdf')
+    assert app.decrypt_pdf_template(template_path, "wrong") == (None, None)
+
+
+def test_user_password_unlock_keeps_user_password():
+    encryption, output = refill(USER_PASSWORD)
+    assert encryption['user_password'] == USER_PASSWORD
+    assert encryption['owner_password'] != USER_PASSWORD
+    with output:
+        assert output.needs_pass
+        assert output.authenticate(USER_PASSWORD) == 2
+        assert output.permissions & PERMISSIONS == PERMISSIONS
+        assert not output.permissions & fitz.PDF_PERM_MODIFY
+
+
+def test_owner_password_unlock_does_not_become_user_password():
+    encryption, output = refill(OWNER_PASSWORD)
+    assert encryption['user_password'] == ''
+    assert encryption['owner_password'] == OWNER_PASSWORD
+    with output:
+        # Opens without a password, but the permissions still hold and the owner password still unlocks them
+        assert not output.needs_pass
+        assert "Hello" in output[0].get_text()
+        assert not output.permissions & fitz.PDF_PERM_MODIFY
+        assert output.authenticate(OWNER_PASSWORD) == 4
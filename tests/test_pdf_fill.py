@@ -0,0 +1,40 @@
+import io
+
+import fitz
+import pytest
+
+import app
+
+PAGE_COUNT = 120
+
+
+def build_structured_pdf():
+    """A PDF big enough for the parallel path, with an outline, metadata, page labels
+    and a link that crosses page ranges."""
+    document = fitz.open()
+    for page_number in range(PAGE_COUNT):
+        page = document.new_page()
+        page.insert_text((72, 72), f"Page {page_number + 1}: {{{{name}}}}")
+    document.set_toc([[1, "Start", 1], [1, "Middle", 60], [2, "Late", 110]])
+    document.set_metadata({"title": "Structured", "author": "Test Author"})
+    document.set_page_labels([{"startpage": 0, "prefix": "A-", "style": "D", "firstpagenum": 1}])
+    document[0].insert_link({"kind": fitz.LINK_GOTO, "from": fitz.Rect(72, 100, 200, 120), "page": 109})
+    return document.tobytes()
+
+
+@pytest.mark.parametrize("parallel", [False, True])
+def test_pdf_text_fill_keeps_document_structure(monkeypatch, parallel):
+    monkeypatch.setattr(app, "PDF_WORKER_PROCESSES", 4 if parallel else 1)
+    assert app.use_parallel_pdf(PAGE_COUNT) is parallel
+
+    filled_bytes, replacements = app.fill_pdf_with_data(io.BytesIO(build_structured_pdf()), {"name": "Jane"})
+
+    assert replacements == PAGE_COUNT
+    with fitz.open(stream=filled_bytes, filetype="pdf") as filled:
+        assert len(filled) == PAGE_COUNT
+        assert "Jane" in filled[PAGE_COUNT - 1].get_text()
+        assert [entry[:3] for entry in filled.get_toc()] == [[1, "Start", 1], [1, "Middle", 60], [2, "Late", 110]]
+        assert filled.metadata["title"] == "Structured"
+        assert filled.metadata["author"] == "Test Author"
+        assert filled[4].get_label() == "A-5"
+        assert [link["page"] for link in filled[0].get_links()] == [109]
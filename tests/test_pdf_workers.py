@@ -0,0 +1,78 @@
+import fitz
+import pytest
+
+import pdf_workers
+
+
+@pytest.mark.parametrize("span_font, span_flags, expected", [
+    ("Helvetica", 0, "helv"),
+    ("ArialMT", 16 | 2, "hebi"),
+    ("Times-Bold", 0, "tibo"),
+    ("Georgia", 2, "tiit"),
+    ("CIDFont+F1", 4, "tiro"),
+    ("CourierNewPS-ItalicMT", 0, "coit"),
+    ("ABCDEF+Consolas", 16, "cobo"),
+])
+def test_span_fonts_map_to_the_closest_base14_font(span_font, span_flags, expected):
+    assert pdf_workers.match_pdf_font(span_font, span_flags) == expected
+
+
+def test_fonts_are_loaded_once():
+    assert pdf_workers.get_pdf_font("tibo") is pdf_workers.get_pdf_font("tibo")
+
+
+def build_page():
+    document = fitz.open()
+    page = document.new_page()
+    page.insert_text((72, 72), "Name: {{name}}", fontname="tiro", fontsize=14)
+    page.insert_text((72, 100), "Role: {{role}}", fontname="helv", fontsize=10)
+    page.insert_text((72, 128), "Again {{name}}", fontname="helv", fontsize=10, color=(1, 0, 0))
+    page.insert_text((72, 156), "No placeholder here", fontname="helv", fontsize=10)
+    return document, page
+
+
+def test_page_is_rewritten_in_one_batch(monkeypatch):
+    document, page = build_page()
+    redaction_passes = []
+    apply_redactions = fitz.Page.apply_redactions
+    monkeypatch.setattr(fitz.Page, "apply_redactions",
+                        lambda self, *args, **kwargs: redaction_passes.append(1) or apply_redactions(self, *args, **kwargs))
+    text_writes = []
+    write_text = fitz.TextWriter.write_text
+    monkeypatch.setattr(fitz.TextWriter, "write_text",
+                        lambda self, *args, **kwargs: text_writes.append(1) or write_text(self, *args, **kwargs))
+
+    assert pdf_workers.rewrite_pdf_page_text(page, {"name": "Ada", "role": "Engineer"}) == 3
+
+    # One redaction pass, and one text write per text colour (black and red)
+    assert (len(redaction_passes), len(text_writes)) == (1, 2)
+    text = page.get_text()
+    assert "{{" not in text
+    for line in ("Name: Ada", "Role: Engineer", "Again Ada", "No placeholder here"):
+        assert line in text
+    document.close()
+
+
+def test_replacement_text_keeps_the_span_font_and_size():
+    document, page = build_page()
+    pdf_workers.rewrite_pdf_page_text(page, {"name": "Ada", "role": "Engineer"})
+
+    spans = {span["text"]: span for block in page.get_text("dict")["blocks"]
+             for line in block.get("lines", []) for span in line["spans"]}
+    # PyMuPDF embeds the Base-14 fonts as their Nimbus equivalents
+    assert spans["Name: Ada"]["font"].startswith("NimbusRoman")
+    assert spans["Name: Ada"]["size"] == pytest.approx(14)
+    assert spans["Role: Engineer"]["font"].startswith("NimbusSans")
+    assert spans["Role: Engineer"]["size"] == pytest.approx(10)
+    document.close()
+
+
+def test_page_without_placeholders_is_untouched():
+    document = fitz.open()
+    page = document.new_page()
+    page.insert_text((72, 72), "Nothing to fill")
+    contents = page.read_contents()
+
+    assert pdf_workers.rewrite_pdf_page_text(page, {"name": "Ada"}) == 0
+    assert page.read_contents() == contents
+    document.close()
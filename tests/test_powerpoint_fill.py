@@ -0,0 +1,37 @@
+from pptx import Presentation
+from pptx.util import Inches
+
+import app
+
+
+def build_deck(slide_count, placeholder_slide):
+    """A deck with plain text on every slide and {{name}} inside a group shape on one of them."""
+    presentation = Presentation()
+    for index in range(slide_count):
+        slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+        slide.shapes.add_textbox(Inches(1), Inches(1), Inches(4), Inches(1)).text_frame.text = f"Slide {index + 1}"
+        if index == placeholder_slide:
+            group = slide.shapes.add_group_shape()
+            group.shapes.add_textbox(Inches(1), Inches(3), Inches(4), Inches(1)).text_frame.text = "Hello {{name}}"
+            group.shapes.add_textbox(Inches(1), Inches(4), Inches(4), Inches(1)).text_frame.text = "No placeholder"
+    return presentation
+
+
+def test_only_placeholder_shapes_are_yielded_including_inside_groups():
+    slide = build_deck(1, 0).slides[0]
+    assert [shape.text_frame.text for shape in app.iter_placeholder_shapes(slide.shapes)] == ["Hello {{name}}"]
+
+
+def test_slides_without_placeholders_are_skipped(monkeypatch):
+    presentation = build_deck(20, 12)
+    walked = []
+    iter_placeholder_shapes = app.iter_placeholder_shapes
+    monkeypatch.setattr(app, "iter_placeholder_shapes",
+                        lambda shapes: walked.append(shapes) or iter_placeholder_shapes(shapes))
+
+    assert app.fill_powerpoint_slides(presentation.slides, {"name": "Ada"}) == 1
+
+    # Shapes are only built for the one slide with a placeholder (and its group)
+    assert len(walked) == 2
+    group = presentation.slides[12].shapes[1]
+    assert [shape.text_frame.text for shape in group.shapes] == ["Hello Ada", "No placeholder"]
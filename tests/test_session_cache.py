@@ -0,0 +1,28 @@
+from unittest import mock
+
+import app
+
+
+def test_output_over_the_session_budget_is_offered_once_with_a_warning(monkeypatch):
+    monkeypatch.setattr(app, "SESSION_MEMORY_BUDGET_MB", 1)
+    app.get_session_cache().clear()
+    output = (b"x" * (2 * 1024 * 1024), "filled.docx", "application/octet-stream", None)
+
+    with mock.patch.object(app.st, "warning") as warning:
+        assert app.keep_output(("batch_output", "big"), output, len(output[0])) is output
+
+    warning.assert_called_once()
+    assert "larger than the 1 MB session memory budget" in warning.call_args.args[0]
+    assert app.session_cache_get(("batch_output", "big")) is None
+
+
+def test_output_within_the_session_budget_is_cached_without_a_warning(monkeypatch):
+    monkeypatch.setattr(app, "SESSION_MEMORY_BUDGET_MB", 1)
+    app.get_session_cache().clear()
+    output = (b"x" * 1024, "filled.docx", "application/octet-stream", None)
+
+    with mock.patch.object(app.st, "warning") as warning:
+        app.keep_output(("manual_output", "small"), output, len(output[0]))
+
+    warning.assert_not_called()
+    assert app.session_cache_get(("manual_output", "small")) is output
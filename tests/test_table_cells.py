@@ -0,0 +1,54 @@
+import docx
+from pptx import Presentation
+from pptx.util import Inches
+
+import app
+
+
+def cell_texts(table_element, namespace):
+    texts = []
+    for row, column, _, paragraphs in app.iter_table_cells(table_element, namespace):
+        text_elements = (text for paragraph in paragraphs for text in paragraph.iter(f"{{{namespace}}}t"))
+        texts.append((row, column, "".join(text.text or "" for text in text_elements)))
+    return texts
+
+
+def test_merged_word_cell_is_visited_once():
+    document = docx.Document()
+    table = document.add_table(rows=2, cols=3)
+    table.cell(0, 0).merge(table.cell(0, 2)).text = "{{title}}"
+    for column in range(3):
+        table.cell(1, column).text = f"c{column}"
+
+    # python-docx repeats the merged cell once per grid column it spans
+    assert len(table.rows[0].cells) == 3
+    assert cell_texts(table._tbl, app.WORD_NAMESPACE) == [(0, 0, "{{title}}"), (1, 0, "c0"), (1, 1, "c1"), (1, 2, "c2")]
+    assert app.fill_word_text(document, {"title": "Report"}) == 1
+    assert table.cell(0, 1).text == "Report"
+
+
+def test_nested_word_table_follows_its_cell_with_only_its_own_text():
+    document = docx.Document()
+    table = document.add_table(rows=1, cols=2)
+    outer = table.cell(0, 0)
+    outer.text = "outer {{a}}"
+    outer.add_table(rows=1, cols=1).cell(0, 0).text = "inner {{b}}"
+    table.cell(0, 1).text = "last"
+
+    assert cell_texts(table._tbl, app.WORD_NAMESPACE) == [(0, 0, "outer {{a}}"), (0, 0, "inner {{b}}"), (0, 1, "last")]
+    app.fill_word_text(document, {"a": "A", "b": "B"})
+    assert outer.tables[0].cell(0, 0).text == "inner B"
+
+
+def test_powerpoint_table_cells_are_visited_once():
+    presentation = Presentation()
+    slide = presentation.slides.add_slide(presentation.slide_layouts[6])
+    table = slide.shapes.add_table(2, 2, Inches(1), Inches(1), Inches(4), Inches(1)).table
+    table.cell(0, 0).merge(table.cell(0, 1))
+    table.cell(0, 0).text = "{{title}}"
+    table.cell(1, 0).text = "{{name}}"
+
+    visited = [(row, column) for row, column, _, _ in app.iter_table_cells(table._tbl, app.DRAWING_NAMESPACE)]
+    assert visited == [(0, 0), (0, 1), (1, 0), (1, 1)]
+    assert app.fill_powerpoint_slides(presentation.slides, {"title": "Report", "name": "Ada"}) == 2
+    assert (table.cell(0, 0).text, table.cell(1, 0).text) == ("Report", "Ada")
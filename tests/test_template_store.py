@@ -0,0 +1,59 @@
+import gc
+import os
+
+import pytest
+
+import app
+
+posix_only = pytest.mark.skipif(not hasattr(os, 'getuid'), reason="POSIX permissions")
+
+
+@posix_only
+def test_store_directory_and_files_are_private(tmp_path):
+    store = app.TemplateStore(str(tmp_path / "store"), 1024)
+    path = store.add_bytes(b"template", 'docx')
+    assert os.stat(store.directory).st_mode & 0o777 == 0o700
+    assert os.stat(path).st_mode & 0o777 == 0o600
+
+
+@posix_only
+def test_existing_private_directory_is_tightened(tmp_path):
+    directory = tmp_path / "store"
+    directory.mkdir(mode=0o755)
+    assert app.make_private_directory(str(directory)) == str(directory)
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+
+
+@posix_only
+def test_symlinked_directory_is_not_used(tmp_path):
+    target = tmp_path / "elsewhere"
+    target.mkdir()
+    (tmp_path / "store").symlink_to(target)
+    directory = app.make_private_directory(str(tmp_path / "store"))
+    assert directory != str(tmp_path / "store")
+    assert not os.path.islink(directory) and os.path.isdir(directory)
+
+
+def test_eviction_skips_templates_being_read(tmp_path):
+    store = app.TemplateStore(str(tmp_path / "store"), 10)
+    first = store.add_bytes(b"first!", 'docx')
+    reader = store.open(first)
+    store.add_bytes(b"second", 'docx')
+    assert os.path.exists(first)
+    assert reader.read() == b"first!"
+
+    del reader
+    gc.collect()
+    store.add_bytes(b"third!", 'docx')
+    assert not os.path.exists(first)
+
+
+def test_template_removed_by_another_process_is_put_back(tmp_path):
+    store = app.TemplateStore(str(tmp_path / "store"), 1024)
+    path = store.add_bytes(b"template", 'pdf')
+    store.open(path)
+    os.unlink(path)
+    reader = store.open(path)
+    assert reader.read() == b"template"
+    with open(path, 'rb') as f:
+        assert f.read() == b"template"
@@ -0,0 +1,47 @@
+import io
+
+import docx
+from docx.opc.constants import RELATIONSHIP_TYPE as RT
+from docx.shared import Inches
+from PIL import Image
+
+import app
+
+
+def png_bytes(width, height):
+    buffer = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def embedded_pixel_sizes(document):
+    return [Image.open(io.BytesIO(rel.target_part.blob)).size
+            for rel in document.part.rels.values() if rel.reltype == RT.IMAGE]
+
+
+def test_table_cell_image_is_prepared_at_the_cell_width():
+    document = docx.Document()
+    table = document.add_table(rows=1, cols=2)
+    table.cell(0, 0).width = Inches(1)
+    table.cell(0, 0).text = "{{image:logo}}"
+
+    assert app.fill_word_images(document, {"logo": png_bytes(3000, 1500)}) == 1
+
+    cell_pixels = app.emu_to_pixels(Inches(1), app.DEFAULT_IMAGE_DPI)
+    assert embedded_pixel_sizes(document) == [(cell_pixels, cell_pixels // 2)]
+    assert document.inline_shapes[0].width <= Inches(1)
+
+
+def test_image_used_in_body_and_cell_is_prepared_once_at_the_larger_box():
+    document = docx.Document()
+    document.add_paragraph("{{image:logo}}")
+    table = document.add_table(rows=1, cols=1)
+    table.cell(0, 0).width = Inches(1)
+    table.cell(0, 0).text = "{{image:logo}}"
+
+    assert app.fill_word_images(document, {"logo": png_bytes(3000, 1500)}) == 2
+
+    section = document.sections[0]
+    body_pixels = app.emu_to_pixels(section.page_width - section.left_margin - section.right_margin,
+                                     app.DEFAULT_IMAGE_DPI)
+    assert embedded_pixel_sizes(document) == [(body_pixels, body_pixels // 2)]
@@ -0,0 +1,87 @@
+import io
+import zipfile
+from unittest import mock
+
+import docx
+from docx.enum.section import WD_SECTION
+
+import app
+
+FOOTNOTES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<w:footnotes xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    '<w:footnote w:id="1"><w:p><w:r><w:t>Source: {{source}}</w:t></w:r></w:p></w:footnote>'
+    '</w:footnotes>'
+)
+FOOTNOTES_RELATIONSHIP = (
+    '<Relationship Id="rIdFootnotes" Target="footnotes.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/footnotes"/>'
+)
+FOOTNOTES_OVERRIDE = (
+    '<Override PartName="/word/footnotes.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.footnotes+xml"/>'
+)
+DATA = {"name": "Ada", "first": "Cover", "even": "Left", "footer": "Page", "source": "Archive"}
+
+
+def build_template(section_count=4):
+    """Sections that all share one header part, plus first-page and even-page headers,
+    a footer and a footnotes part."""
+    document = docx.Document()
+    document.settings.odd_and_even_pages_header_footer = True
+    first_section = document.sections[0]
+    first_section.different_first_page_header_footer = True
+    first_section.header.paragraphs[0].text = "Header {{name}}"
+    first_section.first_page_header.paragraphs[0].text = "First {{first}}"
+    first_section.even_page_header.paragraphs[0].text = "Even {{even}}"
+    first_section.footer.paragraphs[0].text = "Footer {{footer}}"
+    for index in range(section_count - 1):
+        document.add_section(WD_SECTION.NEW_PAGE)
+        document.add_paragraph(f"Section {index + 2}")
+    buffer = io.BytesIO()
+    document.save(buffer)
+
+    # python-docx cannot create footnotes, so add the part to the package directly
+    output = io.BytesIO()
+    with zipfile.ZipFile(buffer) as source, zipfile.ZipFile(output, 'w') as target:
+        for entry in source.infolist():
+            data = source.read(entry.filename)
+            if entry.filename == 'word/_rels/document.xml.rels':
+                data = data.replace(b'</Relationships>', FOOTNOTES_RELATIONSHIP.encode() + b'</Relationships>')
+            elif entry.filename == '[Content_Types].xml':
+                data = data.replace(b'</Types>', FOOTNOTES_OVERRIDE.encode() + b'</Types>')
+            target.writestr(entry, data)
+        target.writestr('word/footnotes.xml', FOOTNOTES_XML)
+    output.seek(0)
+    return output
+
+
+def test_each_story_part_is_listed_once_however_many_sections_share_it():
+    document = docx.Document(build_template())
+    partnames = [str(part.partname) for part, _ in app.word_story_parts(document)]
+
+    assert len(document.sections) == 4
+    assert len(partnames) == len(set(partnames)) == 5  # default, first and even headers, footer, footnotes
+    assert '/word/footnotes.xml' in partnames
+
+
+def test_streaming_scan_finds_first_page_even_page_and_footnote_fields():
+    fields, _ = app.scan_ooxml_fields_streaming(build_template(), 'docx')
+    assert sorted(fields) == sorted(DATA)
+
+
+def test_each_shared_part_is_filled_once(monkeypatch):
+    filled_parts = []
+    fill_word_elements = app.fill_word_elements
+    monkeypatch.setattr(app, "fill_word_elements", lambda parent, elements, data, filled=None: (
+        filled_parts.append(str(parent.partname)), fill_word_elements(parent, elements, data, filled)))
+
+    output_bytes, _, _ = app.build_filled_document(build_template(), 'docx', DATA, None, mock.MagicMock())
+
+    assert len(filled_parts) == len(set(filled_parts)) == 5
+    with zipfile.ZipFile(io.BytesIO(output_bytes)) as package:
+        story_xml = b"".join(package.read(name) for name in package.namelist()
+                             if name.startswith(('word/header', 'word/footer', 'word/footnotes')))
+    assert b"{{" not in story_xml
+    for value in DATA.values():
+        assert value.encode() in story_xml